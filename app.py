@@ -1,6 +1,16 @@
 import flask as f
-from search import search_engine
+from search import search_engine, query_words
+from autocomplete import PrefixIndex
+from spelling import SpellingIndex, suggest_query
+from database import Database
 from crawler import Crawler
+from snapshots import SnapshotReader
+from postings_cache import all_cache_stats
+from search_api import RankedListStore, CursorError, encode_cursor, decode_cursor, parse_fields, hydrate
+from page_text import page_snippet
+from markupsafe import Markup, escape
+import metrics
+import json
 from dotenv import load_dotenv
 import os
 
@@ -9,6 +19,71 @@ app = f.Flask(__name__)
 app.secret_key = os.getenv('FLASH_SECRET_KEY')
 START_URL = "https://www.cse.ust.hk/~kwtleung/COMP4321/testpage.htm"
 
+# Replace misspelled query words by their closest keyword instead of only suggesting them
+app.config['FUZZY_EXPANSION'] = os.getenv('FUZZY_EXPANSION', '0') == '1'
+# Boost pages where the query words appear close together
+app.config['PROXIMITY'] = os.getenv('PROXIMITY', '0') == '1'
+# Score the champion lists of the query terms first (built by main.py / champions.py)
+app.config['CHAMPIONS'] = os.getenv('CHAMPIONS', '0') == '1'
+# Gather candidates and match phrases with the FTS5 index (built by main.py / fts.py)
+app.config['FTS'] = os.getenv('FTS', '0') == '1'
+# Stage timers, SQL counts, slow query log and /metrics (searches slower than SLOW_QUERY_MS are logged)
+app.config['METRICS'] = os.getenv('METRICS', '0') == '1'
+metrics.enable(app.config['METRICS'])
+metrics.SLOW_QUERY_SECONDS = int(os.getenv('SLOW_QUERY_MS', '500')) / 1000
+
+def load_vocabulary(db_name):
+    """Read the vocabulary and its df once per served snapshot."""
+    index = Database(db_name, read_only=True)
+    vocabulary = index.get_vocabulary_with_df()
+    index.close()
+    return vocabulary
+
+def load_word_indexes(db_name):
+    global prefix_index, spelling_index
+    vocabulary = load_vocabulary(db_name)
+    prefix_index, spelling_index = PrefixIndex(vocabulary), SpellingIndex(vocabulary)
+
+# Serve the snapshot published by main.py; requests started before a swap finish on the old one.
+# Every open is read-only, so a published snapshot is never written to (it is already at the current schema).
+snapshots = SnapshotReader(on_swap=load_word_indexes)
+load_word_indexes(snapshots.path)
+
+# Ranked lists of recent queries: later pages and API cursors slice them instead of searching again
+ranked_lists = RankedListStore()
+
+def rank_query(crawler, query):
+    """(list id, [(url, score)]) for the query under the current snapshot and ranking options."""
+    key = (f.g.db_name, query, app.config['FUZZY_EXPANSION'], app.config['PROXIMITY'], app.config['CHAMPIONS'],
+           app.config['FTS'])
+    spelling = spelling_index if app.config['FUZZY_EXPANSION'] else None
+    return ranked_lists.rank(key, query, lambda: search_engine(crawler, query, spelling=spelling,
+                                                               proximity=app.config['PROXIMITY'],
+                                                               champions=app.config['CHAMPIONS'],
+                                                               fts=app.config['FTS']))
+
+def highlight(snippet):
+    """Snippet text as HTML with the query words in bold."""
+    if snippet is None:
+        return None
+    text, html, end = snippet['text'], [], 0
+    for start, stop in snippet['highlights']:
+        html += [escape(text[end:start]), Markup('<b>'), escape(text[start:stop]), Markup('</b>')]
+        end = stop
+    html.append(escape(text[end:]))
+    return Markup('').join(html)
+
+@app.before_request
+def acquire_snapshot():
+    metrics.start_request()
+    f.g.db_name = snapshots.acquire()
+
+@app.teardown_request
+def release_snapshot(exc):
+    if 'db_name' in f.g:
+        snapshots.release(f.g.db_name)
+    metrics.finish_request(f.g.get('search_query'))
+
 @app.route('/')
 def home():
     return f.render_template('index.html', results=None)
@@ -16,7 +91,7 @@ def home():
 @app.route('/search', methods=['GET', 'POST'])
 def search():
     # Create a new crawler instance for each request
-    crawler = Crawler(START_URL)
+    crawler = Crawler(START_URL, db_name=f.g.db_name, read_only=True)
     
     if f.request.method == 'POST':
         query = f.request.form['query']
@@ -26,63 +101,108 @@ def search():
         page = int(f.request.args.get('page', 1))
 
     results_per_page = 7
+    suggestion = None
 
     if query:
         # Call the search engine with the query
-        search_results = search_engine(crawler, query)
-        all_results = []
-
-        if search_results:
-            # Format the results into the required structure
-            for rank, (url, score) in enumerate(search_results, 1):
-                # Fetch title from DB
-                crawler.index.cursor.execute("SELECT title, last_modified, size FROM pages WHERE url=?", (url,))
-                row = crawler.index.cursor.fetchone()
-                top_keywords = crawler._get_top_keywords(url)
-                parent_links = crawler._get_parent_links(url)
-                child_links = crawler._get_child_links(url)
-                all_results.append(
-                    {
-                        'title': row[0] if row else "No Title",
-                        'score': score,
-                        'url': url,
-                        'rank': rank,
-                        'last_modified': row[1] if row else "Last Modified Not Found",
-                        'size': row[2] if row else "Size Not Found",
-                        'keywords': top_keywords,
-                        'parent_links': parent_links,
-                        'child_links': child_links
-                    }
-                )
-            
-        else: 
-            all_results = []
+        _, search_results = rank_query(crawler, query)
+        f.g.search_query = query    # Only requests that ran a search count as searches in the metrics
+        if not search_results:
             f.flash(f'No results found for "{query}"', 'info')
-            print("I got here Abdullah!")
-        # Handle empty results case with a flash message
-
-        # Close the database connection
-        crawler.close()
+            suggestion = suggest_query(query, spelling_index, crawler.stopwords)
     else:
-        all_results = []
-    
-    # Paginate results
+        search_results = []
+
+    # Paginate results, then fetch titles, keywords and links for the shown page only
     start = (page - 1) * results_per_page
     end = start + results_per_page
-    paginated_results = all_results[start:end]
-    total_pages = (len(all_results) + results_per_page - 1) // results_per_page
+    paginated_results = []
+    words = query_words(crawler, query) if search_results else []
+    with metrics.stage('hydrate'):
+        for rank, (url, score) in enumerate(search_results[start:end], start + 1):
+            crawler.index.cursor.execute("SELECT title, last_modified, size FROM pages WHERE url=?", (url,))
+            row = crawler.index.cursor.fetchone()
+            paginated_results.append(
+                {
+                    'title': row[0] if row else "No Title",
+                    'score': score,
+                    'url': url,
+                    'rank': rank,
+                    'last_modified': row[1] if row else "Last Modified Not Found",
+                    'size': row[2] if row else "Size Not Found",
+                    'snippet': highlight(page_snippet(crawler.index, url, words)),
+                    'keywords': crawler._get_top_keywords(url),
+                    'parent_links': crawler._get_parent_links(url),
+                    'child_links': crawler._get_child_links(url)
+                }
+            )
+    crawler.close()
+    total_pages = (len(search_results) + results_per_page - 1) // results_per_page
 
     return f.render_template('index.html', 
                            results=paginated_results, 
                            query=query, 
                            page=page, 
-                           total_pages=total_pages)
+                           total_pages=total_pages,
+                           suggestion=suggestion)
+
+@app.route('/api/search', methods=['GET'])
+def api_search():
+    """
+    Ranked results as JSON: q (query), limit, fields (comma-separated, default all) and cursor (next_cursor
+    of a previous response, which continues the same ranked list). stream=1 sends ndjson instead: a header
+    line, one line per result as soon as it is hydrated, and a last line with next_cursor.
+    """
+    limit = max(1, min(f.request.args.get('limit', 10, type=int), 100))
+    stream = f.request.args.get('stream', '0') == '1'
+    try:
+        fields = parse_fields(f.request.args.get('fields'))
+    except ValueError as e:
+        return f.jsonify({'error': str(e)}), 400
+
+    crawler = Crawler(START_URL, db_name=f.g.db_name, read_only=True)
+    cursor = f.request.args.get('cursor')
+    try:
+        if cursor:
+            list_id, offset = decode_cursor(cursor)
+            query, results = ranked_lists.get(list_id)
+        else:
+            query, offset = f.request.args.get('q', '').strip(), 0
+            if not query:
+                crawler.close()
+                return f.jsonify({'error': 'Missing query'}), 400
+            list_id, results = rank_query(crawler, query)
+    except CursorError as e:
+        crawler.close()
+        return f.jsonify({'error': str(e)}), 410
+    f.g.search_query = query
+
+    page = results[offset:offset + limit]
+    words = query_words(crawler, query) if 'snippet' in fields else []
+    next_cursor = encode_cursor(list_id, offset + limit) if offset + limit < len(results) else None
+
+    if not stream:
+        with metrics.stage('hydrate'):
+            hydrated = [hydrate(crawler, rank, url, score, fields, words)
+                        for rank, (url, score) in enumerate(page, offset + 1)]
+        crawler.close()
+        return f.jsonify({'query': query, 'total': len(results), 'results': hydrated, 'next_cursor': next_cursor})
+
+    def generate():
+        try:
+            yield json.dumps({'query': query, 'total': len(results)}) + "\n"
+            for rank, (url, score) in enumerate(page, offset + 1):
+                yield json.dumps(hydrate(crawler, rank, url, score, fields, words)) + "\n"
+            yield json.dumps({'next_cursor': next_cursor}) + "\n"
+        finally:
+            crawler.close()
+    return f.Response(f.stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/similar', methods=['POST'])
 def similar():
     url = f.request.form['url']
     # Remove usage of existing_query, only use keywords from similar page
-    crawler = Crawler(START_URL)
+    crawler = Crawler(START_URL, db_name=f.g.db_name, read_only=True)
     # Get top-5 keywords for the given URL
     keywords = crawler.get_similar_pages_query(url)
     # Use only the keywords as the new query
@@ -91,12 +211,18 @@ def similar():
     # Redirect to search with the new query
     return f.redirect(f.url_for('search', query=new_query))
 
-@app.route('/get_keywords', methods=['GET'])
-def get_keywords():
-    crawler = Crawler(START_URL)
-    keywords = crawler.show_stemmed_keywords()
-    crawler.close()
-    return f.jsonify(keywords)
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    # Prometheus text format; the counters only move when METRICS=1
+    return f.Response(metrics.render(all_cache_stats()), mimetype='text/plain; version=0.0.4')
+
+@app.route('/complete', methods=['GET'])
+def complete():
+    # Top-k stemmed keywords starting with the prefix, most common (highest df) first
+    prefix = f.request.args.get('prefix', '').strip().lower()
+    k = f.request.args.get('k', 10, type=int)
+    completions = prefix_index.complete(prefix, k)
+    return f.jsonify([{'word': word, 'df': df} for word, df in completions])
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,53 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from typing import List, Tuple
+
+MAX_K = 20              # Largest number of completions returned for one prefix
+CACHED_PREFIX_LEN = 3   # Prefixes up to this length get their top-MAX_K precomputed
+
+
+class PrefixIndex:
+    """
+    Sorted vocabulary array searched with binary search, ranked by df.
+    Short prefixes match large ranges of the vocabulary, so their top completions are precomputed
+    once; longer prefixes only cover a few words and are ranked on the fly. Either way a lookup
+    does not depend on the vocabulary size.
+    """
+
+    def __init__(self, vocabulary: List[Tuple[str, int]]):
+        vocabulary = sorted(vocabulary)
+        self.words = [word for word, df in vocabulary]
+        self.dfs = [df for word, df in vocabulary]
+        self.top = {}   # prefix -> top-MAX_K indices into self.words, best first
+        for length in range(CACHED_PREFIX_LEN + 1):
+            start = 0
+            while start < len(self.words):
+                prefix = self.words[start][:length]
+                if len(prefix) < length:    # Word shorter than the prefix length
+                    start += 1
+                    continue
+                end = self._range_end(prefix, start)
+                self.top[prefix] = self._rank(start, end, MAX_K)
+                start = end
+
+    def _range_end(self, prefix: str, lo: int = 0) -> int:
+        return bisect_right(self.words, prefix + '\U0010ffff', lo)
+
+    def _rank(self, start: int, end: int, k: int) -> List[int]:
+        # Highest df first, alphabetical among ties
+        return heapq.nsmallest(k, range(start, end), key=lambda i: (-self.dfs[i], self.words[i]))
+
+    def complete(self, prefix: str, k: int = 10) -> List[Tuple[str, int]]:
+        """Return up to k (word, df) completions of prefix, highest df first."""
+        k = max(0, min(k, MAX_K))
+        if prefix in self.top:
+            indices = self.top[prefix][:k]
+        elif len(prefix) <= CACHED_PREFIX_LEN:
+            indices = []    # No vocabulary word starts with this short prefix
+        else:
+            start = bisect_left(self.words, prefix)
+            indices = self._rank(start, self._range_end(prefix, start), k)
+        return [(self.words[i], self.dfs[i]) for i in indices]
+
+    def __len__(self):
+        return len(self.words)
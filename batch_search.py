@@ -0,0 +1,223 @@
+import argparse
+import json
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from boolean_query import is_boolean_query
+from crawler import Crawler
+from search import parse_query, gather_candidates, gather_boolean_candidates, build_query_vector, \
+    build_doc_vector, rank_candidates
+from spelling import suggest_query
+
+
+class BatchStats:
+    """
+    Everything a batch of queries needs from the index, loaded once: the postings of every query term,
+    df of the terms, maxtf and vector norm of every candidate page. It answers the lookups search.py
+    makes on a crawler, so the batch is scored by the same functions as single queries.
+    Holds no database connection, so it can be sent to worker processes.
+    """
+
+    def __init__(self, N: int):
+        self.index = self       # search.py reads postings and norms through crawler.index
+        self.N = N
+        self.body_docs = {}     # term -> URLs with the term in their body, in page_id order
+        self.title_docs = {}
+        self.body_tf = {}       # term -> {url: frequency}
+        self.title_tf = {}
+        self.body_positions = {}    # term -> {url: positions}
+        self.body_df = {}
+        self.title_df = {}
+        self.maxtf = {}         # url -> (body maxtf, title maxtf)
+        self.norms = {}         # url -> document vector norm
+        self.doc_terms = {}     # url -> all terms, only while norms are computed
+
+    # Lookups made by search.py
+    def get_total_doc_count(self):
+        return self.N
+
+    def get_docs_containing_word_body(self, word: str):
+        return self.body_docs.get(word, [])
+
+    def get_docs_containing_word_title(self, word: str):
+        return self.title_docs.get(word, [])
+
+    def has_fresh_page_norms(self) -> bool:
+        return True     # Every candidate has a norm, stored or computed by load_pages()
+
+    def get_page_norms(self, urls: List[str]) -> Dict[str, float]:
+        return {url: self.norms[url] for url in urls if url in self.norms}
+
+    def calculate_body_df(self, word: str) -> int:
+        return self.body_df.get(word, 0)
+
+    def calculate_title_df(self, word: str) -> int:
+        return self.title_df.get(word, 0)
+
+    def calculate_body_tf(self, url: str, word: str):
+        return self.body_tf.get(word, {}).get(url, 0)
+
+    def calculate_title_tf(self, url: str, word: str):
+        return self.title_tf.get(word, {}).get(url, 0)
+
+    def calculate_body_maxtf(self, url: str):
+        return self.maxtf.get(url, (0, 0))[0]
+
+    def calculate_title_maxtf(self, url: str):
+        return self.maxtf.get(url, (0, 0))[1]
+
+    def get_body_positions(self, url: str, word: str) -> List[int]:
+        return self.body_positions.get(word, {}).get(url, [])
+
+    def get_all_terms_in_doc(self, url: str) -> List[str]:
+        return self.doc_terms.get(url, [])
+
+    # Loading
+    def load_terms(self, index, terms):
+        """Postings and df of every term, one postings read per term and field."""
+        postings = {(field, t): index.get_postings(field, t) for t in terms for field in ('body', 'title')}
+        urls = index.get_page_urls({page_id for p in postings.values() for page_id in p.page_ids})
+        for (field, t), p in postings.items():
+            docs = [urls[page_id] for page_id in p.page_ids if page_id in urls]
+            tf = {urls[page_id]: freq for page_id, freq in zip(p.page_ids, p.frequencies) if page_id in urls}
+            if field == 'body':
+                self.body_docs[t], self.body_tf[t] = docs, tf
+                self.body_positions[t] = {urls[page_id]: list(pos) for page_id, pos in zip(p.page_ids, p.positions)
+                                          if page_id in urls}
+            else:
+                self.title_docs[t], self.title_tf[t] = docs, tf
+        self._load_df(index, terms)
+
+    def _load_df(self, index, terms):
+        terms = [t for t in set(terms) if t not in self.body_df]
+        for i in range(0, len(terms), 500):
+            chunk = terms[i:i + 500]
+            index.cursor.execute(f'''
+                SELECT w.word, COALESCE(b.df, 0), COALESCE(t.df, 0) FROM words w
+                LEFT JOIN inverted_index_body_word2df b ON b.word_id = w.word_id
+                LEFT JOIN inverted_index_title_word2df t ON t.word_id = w.word_id
+                WHERE w.word IN ({','.join('?' * len(chunk))})
+            ''', chunk)
+            for word, body_df, title_df in index.cursor.fetchall():
+                self.body_df[word], self.title_df[word] = body_df, title_df
+
+    def load_pages(self, crawler, urls):
+        """maxtf and vector norm of every candidate page; norms not stored by compact.py are computed once here."""
+        index = crawler.index
+        urls = list(urls)
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            index.cursor.execute(f'''
+                SELECT p.url, COALESCE(b.maxtf, 0), COALESCE(t.maxtf, 0) FROM pages p
+                LEFT JOIN forward_index_body_page2maxtf b ON b.page_id = p.page_id
+                LEFT JOIN forward_index_title_page2maxtf t ON t.page_id = p.page_id
+                WHERE p.url IN ({','.join('?' * len(chunk))})
+            ''', chunk)
+            for url, body_maxtf, title_maxtf in index.cursor.fetchall():
+                self.maxtf[url] = (body_maxtf, title_maxtf)
+        if index.has_fresh_page_norms():
+            self.norms.update(index.get_page_norms(urls))
+        # Pages without a stored norm: build their whole vector once for the batch, as rank_candidates would
+        for url in [u for u in urls if u not in self.norms]:
+            self.doc_terms[url] = crawler.get_all_terms_in_doc(url)
+            for field, tf in (('body', self.body_tf), ('title', self.title_tf)):
+                index.cursor.execute(f'''
+                    SELECT w.word, i.frequency FROM inverted_index_{field} i JOIN words w ON w.word_id = i.word_id
+                    WHERE i.page_id = (SELECT page_id FROM pages WHERE url = ?)
+                ''', (url,))
+                for word, freq in index.cursor.fetchall():
+                    tf.setdefault(word, {})[url] = freq
+            self._load_df(index, self.doc_terms[url])
+        for url in list(self.doc_terms):
+            vec = build_doc_vector(self, url, self.N)
+            self.norms[url] = math.sqrt(sum(v**2 for v in vec.values()))
+        self.doc_terms = {}
+
+
+def _score(stats: BatchStats, terms, phrases, candidates: List[str], top_k: int) -> List[Tuple[str, float]]:
+    query_vector = build_query_vector(stats, terms, phrases, stats.N)
+    return rank_candidates(stats, candidates, query_vector, stats.N)[:top_k]
+
+
+# Per-process worker state, filled in by _init_worker
+_worker = {}
+
+
+def _init_worker(stats: BatchStats):
+    _worker['stats'] = stats
+
+
+def _score_in_worker(job):
+    return _score(_worker['stats'], *job)
+
+
+def batch_search(crawler, queries: List[str], top_k: int = 50, spelling=None,
+                 workers: int = None) -> List[List[Tuple[str, float]]]:
+    """
+    Rank pages for every query of the batch; result i is what search_engine(crawler, queries[i], top_k,
+    spelling) returns. Terms shared by queries are read once: postings, df and maxtf are loaded for the
+    whole batch before scoring. workers: score the queries in that many processes.
+    """
+    N = crawler.index.get_total_doc_count()
+    if N == 0:
+        return [[] for _ in queries]
+
+    # 1. Parse every query; boolean queries get their candidates from the index right away
+    parsed = []
+    terms = set()
+    for query in queries:
+        if spelling is not None:
+            query = suggest_query(query, spelling, crawler.stopwords) or query
+        if is_boolean_query(query):
+            q_terms, q_phrases, candidates = gather_boolean_candidates(crawler, query)
+        else:
+            (q_terms, q_phrases), candidates = parse_query(query), None
+        parsed.append((q_terms, q_phrases, candidates))
+        terms.update(q_terms)
+        terms.update(w for phrase in q_phrases for w in phrase)
+
+    # 2. Load the statistics of every term once, then gather the candidates of the other queries
+    stats = BatchStats(N)
+    stats.load_terms(crawler.index, terms)
+    jobs = []
+    for q_terms, q_phrases, candidates in parsed:
+        if candidates is None:
+            candidates = gather_candidates(stats, q_terms, q_phrases)
+        # A list keeps the candidate order, and so the order of tied scores, in worker processes
+        jobs.append(None if candidates is None else (q_terms, q_phrases, list(candidates), top_k))
+    stats.load_pages(crawler, {url for job in jobs if job for url in job[2]})
+
+    # 3. Score
+    todo = [job for job in jobs if job is not None]
+    if workers and workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(stats,)) as pool:
+            scored = iter(pool.map(_score_in_worker, todo, chunksize=max(1, len(todo) // (workers * 4))))
+    else:
+        scored = iter([_score(stats, *job) for job in todo])
+    return [[] if job is None else next(scored) for job in jobs]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank a file of queries (one per line) in one batch.")
+    parser.add_argument("queries")
+    parser.add_argument("--db", help="database to read (default: the served index)")
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None, help="score in this many processes")
+    parser.add_argument("--out", help="write one JSON line of results per query")
+    args = parser.parse_args()
+
+    with open(args.queries) as f:
+        queries = [line.strip() for line in f if line.strip()]
+    from snapshots import current_snapshot
+    crawler = Crawler(None, db_name=args.db or current_snapshot(), read_only=True)
+    start = time.perf_counter()
+    results = batch_search(crawler, queries, args.top_k, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    crawler.close()
+    if args.out:
+        with open(args.out, "w") as f:
+            for query, ranked in zip(queries, results):
+                f.write(json.dumps({'query': query, 'results': ranked}) + "\n")
+    print(f"{len(queries)} queries in {elapsed:.2f} s ({elapsed / max(1, len(queries)) * 1000:.1f} ms per query)")
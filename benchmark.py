@@ -0,0 +1,195 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import List
+
+from compact import compact, database_size
+from crawler import Crawler
+from fetcher import Fetcher
+from search import search_engine
+from testing_utils import serve_directory
+
+CONSONANTS = "bdfgklmnprstvz"
+VOWELS = "aeiou"
+
+
+def synthetic_word(i: int) -> str:
+    """Deterministic pronounceable word for vocabulary rank i (at least two syllables)."""
+    syllables = []
+    i += len(CONSONANTS) * len(VOWELS)     # Skip one-syllable words
+    while i:
+        i, s = divmod(i, len(CONSONANTS) * len(VOWELS))
+        syllables.append(CONSONANTS[s // len(VOWELS)] + VOWELS[s % len(VOWELS)])
+    return "".join(syllables) + "n"         # Consonant ending: Porter stemming keeps words apart
+
+
+class ZipfSampler:
+    """Draws vocabulary words with probability proportional to 1 / rank^skew."""
+
+    def __init__(self, vocabulary: int, skew: float, rng: random.Random):
+        self.words = [synthetic_word(i) for i in range(vocabulary)]
+        total = 0.0
+        self.cum_weights = []
+        for rank in range(1, vocabulary + 1):
+            total += 1 / rank ** skew
+            self.cum_weights.append(total)
+        self.rng = rng
+
+    def sample(self, k: int) -> List[str]:
+        return self.rng.choices(self.words, cum_weights=self.cum_weights, k=k)
+
+
+def generate_site(path: str, pages: int = 200, fanout: int = 5, vocabulary: int = 5000, skew: float = 1.1,
+                  words_per_page: int = 300, seed: int = 0) -> str:
+    """
+    Write a synthetic site of `pages` HTML pages, page0.html being the start page. Every page links to
+    `fanout` pages (the next one, so all are reachable, and random others), and its title and body are
+    drawn from a Zipf-distributed vocabulary. Returns the start page name.
+    """
+    rng = random.Random(seed)
+    sampler = ZipfSampler(vocabulary, skew, rng)
+    os.makedirs(path, exist_ok=True)
+    for i in range(pages):
+        targets = {(i + 1) % pages} | {rng.randrange(pages) for _ in range(fanout - 1)}
+        links = " ".join(f'<a href="page{t}.html">page {t}</a>' for t in sorted(targets))
+        title = " ".join(sampler.sample(3))
+        body = " ".join(sampler.sample(rng.randint(words_per_page // 2, words_per_page * 3 // 2)))
+        with open(os.path.join(path, f"page{i}.html"), "w") as f:
+            f.write(f"<html><head><title>{title}</title></head><body><p>{body}</p><p>{links}</p></body></html>")
+    return "page0.html"
+
+
+def generate_query_log(queries: int = 200, vocabulary: int = 5000, skew: float = 1.1, seed: int = 1) -> List[str]:
+    """Queries of one to three words with the corpus' word distribution; one in ten is a phrase."""
+    rng = random.Random(seed)
+    sampler = ZipfSampler(vocabulary, skew, rng)
+    log = []
+    for _ in range(queries):
+        words = sampler.sample(rng.choice([1, 1, 2, 2, 2, 3]))
+        log.append(f'"{" ".join(words)}"' if len(words) > 1 and rng.random() < 0.1 else " ".join(words))
+    return log
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile (p in 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(pages: int = 200, fanout: int = 5, vocabulary: int = 5000, skew: float = 1.1,
+                  queries: int = 200, seed: int = 0, top_k: int = 50) -> dict:
+    """Generate and serve a synthetic site, crawl it, index it again from memory, and time a query log."""
+    tmp_dir = tempfile.mkdtemp()
+    site = os.path.join(tmp_dir, "site")
+    start_page = generate_site(site, pages, fanout, vocabulary, skew, seed=seed)
+    server, base = serve_directory(site)
+    try:
+        # Crawl: fetch, parse and index, as main.py does
+        crawler = Crawler(base + start_page, max_pages=pages, db_name=os.path.join(tmp_dir, "crawl.db"))
+        crawler.delay = 0
+        start = time.perf_counter()
+        crawler.crawl()
+        crawl_seconds = time.perf_counter() - start
+        crawled = crawler.index.get_total_doc_count()
+
+        # Indexing alone: parse and index pages already in memory into an empty database
+        fetcher = Fetcher()
+        responses = [(base + f"page{i}.html", fetcher.fetch(base + f"page{i}.html")) for i in range(pages)]
+        fetcher.close()
+        indexer = Crawler(None, db_name=os.path.join(tmp_dir, "index.db"))
+        start = time.perf_counter()
+        for url, response in responses:
+            indexer._index_page(url, None, indexer._parse_page(url, response))
+        index_seconds = time.perf_counter() - start
+        indexer.close()
+
+        size_raw = database_size(crawler.index)
+        compaction = compact(crawler.index)
+
+        latencies = []
+        for query in generate_query_log(queries, vocabulary, skew, seed + 1):
+            start = time.perf_counter()
+            search_engine(crawler, query, top_k=top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        crawler.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp_dir)
+
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'config': {'pages': pages, 'fanout': fanout, 'vocabulary': vocabulary, 'skew': skew,
+                   'queries': queries, 'seed': seed, 'top_k': top_k},
+        'crawl': {'pages': crawled, 'seconds': crawl_seconds, 'pages_per_sec': crawled / crawl_seconds},
+        'index': {'pages': pages, 'seconds': index_seconds, 'pages_per_sec': pages / index_seconds},
+        'db_bytes': {'after_crawl': size_raw, 'after_compaction': compaction['size_after']},
+        'query_ms': {'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95),
+                     'p99': percentile(latencies, 99), 'mean': sum(latencies) / len(latencies) if latencies else 0.0},
+    }
+
+
+# (section, key, True if higher is better)
+METRICS = [
+    ('crawl', 'pages_per_sec', True),
+    ('index', 'pages_per_sec', True),
+    ('db_bytes', 'after_compaction', False),
+    ('query_ms', 'p50', False),
+    ('query_ms', 'p95', False),
+    ('query_ms', 'p99', False),
+]
+
+
+def compare(old: dict, new: dict) -> List[str]:
+    """One line per metric: old value, new value and the change, flagged when it got worse by more than 10%."""
+    lines = []
+    for section, key, higher_is_better in METRICS:
+        before, after = old[section][key], new[section][key]
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > 0.10 else ""
+        lines.append(f"{section}.{key}: {before:.2f} -> {after:.2f} ({change:+.1%}){flag}")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark crawling, indexing and queries on a synthetic site.")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--fanout", type=int, default=5, help="links per page")
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of word frequencies")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="JSON file for the results (default: bench_results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            print("\n".join(compare(json.load(f_old), json.load(f_new))))
+    else:
+        results = run_benchmark(args.pages, args.fanout, args.vocabulary, args.skew, args.queries, args.seed)
+        out = args.out or os.path.join("bench_results", f"{results['commit'] or 'results'}.json")
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(json.dumps(results, indent=2))
+        print(f"Saved to {out}")
@@ -0,0 +1,308 @@
+import math
+import re
+from typing import List, Tuple
+from nltk.stem import PorterStemmer
+
+OPERATORS = {"AND", "OR", "NOT"}
+
+# Tokens: quoted phrase, parenthesis, or a word. Operators must be written in upper case.
+_TOKEN_RE = re.compile(r'"([^"]+)"|(\()|(\))|([\w\']+)')
+
+
+def is_boolean_query(query: str) -> bool:
+    """
+    True if the query uses AND/OR/NOT or parentheses and parses as a boolean query.
+    Malformed ones (e.g. an unbalanced parenthesis) are searched as free text, so callers never see BooleanQueryError.
+    """
+    if not any(lparen or rparen or word in OPERATORS for phrase, lparen, rparen, word in _TOKEN_RE.findall(query)):
+        return False
+    try:
+        parse_boolean_query(query)
+    except BooleanQueryError:
+        return False
+    return True
+
+
+class BooleanQueryError(ValueError):
+    """Raised for malformed boolean queries (unbalanced parentheses, dangling operators)."""
+
+
+class _Parser:
+    """
+    Recursive-descent parser. Grammar (NOT binds tightest, adjacent operands mean AND):
+        or_expr  := and_expr ("OR" and_expr)*
+        and_expr := not_expr (["AND"] not_expr)*
+        not_expr := "NOT" not_expr | atom
+        atom     := "(" or_expr ")" | phrase | term
+    Nodes are tuples: ('term', word), ('phrase', [words]), ('and', [nodes]), ('or', [nodes]), ('not', node).
+    Stopword terms are dropped and become None.
+    """
+
+    def __init__(self, query: str, stopwords):
+        self.stemmer = PorterStemmer()
+        self.stopwords = stopwords
+        self.tokens = []
+        for phrase, lparen, rparen, word in _TOKEN_RE.findall(query):
+            if phrase:
+                self.tokens.append(("phrase", phrase))
+            elif lparen or rparen:
+                self.tokens.append((lparen or rparen, None))
+            elif word in OPERATORS:
+                self.tokens.append((word, None))
+            else:
+                self.tokens.append(("term", word))
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            return None
+        node = self._or_expr()
+        if self.pos != len(self.tokens):
+            raise BooleanQueryError(f"Unexpected '{self.tokens[self.pos][1] or self.tokens[self.pos][0]}'")
+        return node
+
+    def _or_expr(self):
+        children = [self._and_expr()]
+        while self._peek() == "OR":
+            self._next()
+            children.append(self._and_expr())
+        return _combine("or", children)
+
+    def _and_expr(self):
+        children = [self._not_expr()]
+        while self._peek() in ("AND", "NOT", "(", "phrase", "term"):
+            if self._peek() == "AND":
+                self._next()
+            children.append(self._not_expr())
+        return _combine("and", children)
+
+    def _not_expr(self):
+        if self._peek() == "NOT":
+            self._next()
+            child = self._not_expr()
+            return ("not", child) if child is not None else None
+        return self._atom()
+
+    def _atom(self):
+        kind = self._peek()
+        if kind is None:
+            raise BooleanQueryError("Query ends with an operator")
+        if kind == "(":
+            self._next()
+            node = self._or_expr()
+            if self._peek() != ")":
+                raise BooleanQueryError("Missing ')'")
+            self._next()
+            return node
+        if kind == "phrase":
+            words = [self.stemmer.stem(w.lower()) for w in re.findall(r"\b[\w']+\b", self._next()[1])]
+            return ("phrase", words) if words else None
+        if kind == "term":
+            word = self.stemmer.stem(self._next()[1].lower())
+            return None if word in self.stopwords else ("term", word)
+        raise BooleanQueryError(f"Unexpected '{kind}'")
+
+
+def _combine(op, children):
+    children = [c for c in children if c is not None]
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return (op, children)
+
+
+def parse_boolean_query(query: str, stopwords=()):
+    """Parse a boolean query into a node tree (see _Parser). Returns None if nothing is left."""
+    return _Parser(query, stopwords).parse()
+
+
+def positive_terms(node) -> Tuple[List[str], List[List[str]]]:
+    """Return (terms, phrases) that are not under a NOT, in the format of search.parse_query()."""
+    terms, phrases = [], []
+
+    def walk(n):
+        if n is None or n[0] == "not":
+            return
+        if n[0] == "term":
+            terms.append(n[1])
+        elif n[0] == "phrase":
+            phrases.append(n[1])
+        else:
+            for child in n[1]:
+                walk(child)
+
+    walk(node)
+    return terms, phrases
+
+
+class PostingsList:
+    """Sorted page_id postings with skip pointers every ~sqrt(n) entries."""
+
+    def __init__(self, page_ids: List[int]):
+        self.page_ids = page_ids
+        self.skip = int(math.sqrt(len(page_ids))) if len(page_ids) > 3 else 0
+
+    def __len__(self):
+        return len(self.page_ids)
+
+    def has_skip(self, i: int) -> bool:
+        return self.skip > 0 and i % self.skip == 0 and i + self.skip < len(self.page_ids)
+
+
+class PostingsStats:
+    """Counts how many postings entries the evaluation looked at."""
+
+    def __init__(self):
+        self.touched = 0
+
+
+def intersect(a: PostingsList, b: PostingsList, stats: PostingsStats = None) -> PostingsList:
+    """Intersect two postings lists, following skip pointers past runs that cannot match."""
+    result = []
+    i = j = touched = 0
+    pa, pb = a.page_ids, b.page_ids
+    while i < len(pa) and j < len(pb):
+        touched += 1
+        if pa[i] == pb[j]:
+            result.append(pa[i])
+            i += 1
+            j += 1
+        elif pa[i] < pb[j]:
+            if a.has_skip(i) and pa[i + a.skip] <= pb[j]:
+                while a.has_skip(i) and pa[i + a.skip] <= pb[j]:
+                    i += a.skip
+                    touched += 1
+            else:
+                i += 1
+        else:
+            if b.has_skip(j) and pb[j + b.skip] <= pa[i]:
+                while b.has_skip(j) and pb[j + b.skip] <= pa[i]:
+                    j += b.skip
+                    touched += 1
+            else:
+                j += 1
+    if stats is not None:
+        stats.touched += touched
+    return PostingsList(result)
+
+
+def union(a: PostingsList, b: PostingsList, stats: PostingsStats = None) -> PostingsList:
+    """Merge two sorted postings lists."""
+    result = []
+    i = j = 0
+    pa, pb = a.page_ids, b.page_ids
+    while i < len(pa) and j < len(pb):
+        if pa[i] == pb[j]:
+            result.append(pa[i])
+            i += 1
+            j += 1
+        elif pa[i] < pb[j]:
+            result.append(pa[i])
+            i += 1
+        else:
+            result.append(pb[j])
+            j += 1
+    result.extend(pa[i:])
+    result.extend(pb[j:])
+    if stats is not None:
+        stats.touched += len(pa) + len(pb)
+    return PostingsList(result)
+
+
+def difference(a: PostingsList, b: PostingsList, stats: PostingsStats = None) -> PostingsList:
+    """Return the entries of a that are not in b (a AND NOT b), skipping through b."""
+    result = []
+    j = touched = 0
+    pb = b.page_ids
+    for page_id in a.page_ids:
+        touched += 1
+        while j < len(pb) and pb[j] < page_id:
+            if b.has_skip(j) and pb[j + b.skip] < page_id:
+                j += b.skip
+            else:
+                j += 1
+            touched += 1
+        if j >= len(pb) or pb[j] != page_id:
+            result.append(page_id)
+    if stats is not None:
+        stats.touched += touched
+    return PostingsList(result)
+
+
+class BooleanEvaluator:
+    """Evaluates a parsed boolean query against a Database, returning sorted page_ids."""
+
+    def __init__(self, index):
+        self.index = index
+        self.stats = PostingsStats()
+        self._all_pages = None
+
+    def all_pages(self) -> PostingsList:
+        if self._all_pages is None:
+            self._all_pages = PostingsList(self.index.get_all_page_ids())
+        return self._all_pages
+
+    def evaluate(self, node) -> PostingsList:
+        if node is None:
+            return PostingsList([])
+        kind = node[0]
+        if kind == "term":
+            return PostingsList(self.index.get_page_ids_containing_word(node[1]))
+        if kind == "phrase":
+            return self._phrase(node[1])
+        if kind == "not":
+            return difference(self.all_pages(), self.evaluate(node[1]), self.stats)
+        if kind == "or":
+            result = PostingsList([])
+            for child in node[1]:
+                result = union(result, self.evaluate(child), self.stats)
+            return result
+        return self._and(node[1])
+
+    def _and(self, children) -> PostingsList:
+        positives = [self.evaluate(c) for c in children if c[0] != "not"]
+        negatives = [self.evaluate(c[1]) for c in children if c[0] == "not"]
+        if positives:
+            positives.sort(key=len)  # Start from the rarest list so intermediate results stay small
+            result = positives[0]
+            for postings in positives[1:]:
+                if not result:
+                    break
+                result = intersect(result, postings, self.stats)
+        else:
+            result = self.all_pages()
+        for postings in negatives:
+            if not result:
+                break
+            result = difference(result, postings, self.stats)
+        return result
+
+    def _phrase(self, words: List[str]) -> PostingsList:
+        """Intersect the body postings of the phrase words, then verify positions on the survivors."""
+        lists = sorted((PostingsList(self.index.get_page_ids_containing_word_body(w)) for w in words), key=len)
+        candidates = lists[0]
+        for postings in lists[1:]:
+            if not candidates:
+                break
+            candidates = intersect(candidates, postings, self.stats)
+        if not candidates or len(words) == 1:
+            return candidates
+
+        positions = [self.index.get_body_positions_by_page(w) for w in words]
+        result = []
+        for page_id in candidates.page_ids:
+            following = [set(p.get(page_id, ())) for p in positions[1:]]
+            for start in positions[0].get(page_id, ()):
+                if all(start + offset in following[offset - 1] for offset in range(1, len(words))):
+                    result.append(page_id)
+                    break
+        return PostingsList(result)
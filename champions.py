@@ -0,0 +1,149 @@
+import argparse
+import heapq
+import math
+import time
+from itertools import groupby
+from typing import Dict, List
+
+from database import Database
+from search import TITLE_WEIGHT, search_engine
+
+CHAMPION_SIZE = 50      # r: pages kept per term; should be at least the usual top_k
+QUALITY_WEIGHT = 0.25   # Max relative bonus a page gets from its static quality
+
+
+def build_page_quality(index: Database) -> Dict[int, float]:
+    """
+    Static, query-independent quality of every page: log in-link count scaled to [0, 1].
+    Stored in page_quality and returned as {page_id: quality}.
+    """
+    index.cursor.execute('''
+        SELECT p.page_id, COUNT(pc.parent_id)
+        FROM pages p
+        LEFT JOIN parent_child_links pc ON pc.child_id = p.page_id
+        GROUP BY p.page_id
+    ''')
+    inlinks = dict(index.cursor.fetchall())
+    top = math.log1p(max(inlinks.values(), default=0)) or 1.0
+    quality = {page_id: math.log1p(count) / top for page_id, count in inlinks.items()}
+    index.cursor.execute("DELETE FROM page_quality")
+    index.cursor.executemany("INSERT INTO page_quality (page_id, quality) VALUES (?, ?)", quality.items())
+    index.conn.commit()
+    return quality
+
+
+def build_champion_lists(index: Database, r: int = CHAMPION_SIZE) -> int:
+    """
+    For every word keep the r pages where it has the highest normalized tf-idf weight (the weight
+    search.build_doc_vector gives it, divided by the document norm), boosted by static page quality.
+    Returns the number of rows written.
+    """
+    quality = build_page_quality(index)
+    N = index.get_total_doc_count()
+
+    index.cursor.execute('''
+        SELECT p.page_id,
+               MAX(COALESCE(b.maxtf, 0), ? * COALESCE(t.maxtf, 0), 1)
+        FROM pages p
+        LEFT JOIN forward_index_body_page2maxtf b ON b.page_id = p.page_id
+        LEFT JOIN forward_index_title_page2maxtf t ON t.page_id = p.page_id
+    ''', (TITLE_WEIGHT,))
+    max_tf = dict(index.cursor.fetchall())
+
+    index.cursor.execute('''
+        SELECT w.word_id, COALESCE(b.df, 0) + COALESCE(t.df, 0)
+        FROM words w
+        LEFT JOIN inverted_index_body_word2df b ON b.word_id = w.word_id
+        LEFT JOIN inverted_index_title_word2df t ON t.word_id = w.word_id
+    ''')
+    df = dict(index.cursor.fetchall())
+
+    def weighted_postings():
+        """Yield (word_id, [(page_id, weight)]) word by word, the weight being the doc-vector tf-idf."""
+        read = index.conn.cursor()
+        read.execute('''
+            SELECT word_id, page_id, SUM(tf) FROM (
+                SELECT word_id, page_id, frequency AS tf FROM inverted_index_body
+                UNION ALL
+                SELECT word_id, page_id, ? * frequency FROM inverted_index_title
+            )
+            GROUP BY word_id, page_id
+            ORDER BY word_id
+        ''', (TITLE_WEIGHT,))
+        for word_id, postings in groupby(read, key=lambda row: row[0]):
+            idf = math.log(N / max(df.get(word_id, 0), 1))
+            yield word_id, [(page_id, (tf * idf) / max_tf.get(page_id, 1)) for _, page_id, tf in postings]
+        read.close()
+
+    # First pass: document vector norms, so weights can be ranked by their share of the cosine score
+    norm_sq = {}
+    for word_id, postings in weighted_postings():
+        for page_id, weight in postings:
+            norm_sq[page_id] = norm_sq.get(page_id, 0.0) + weight ** 2
+
+    # Second pass: keep the r best pages per word, holding only one word in memory at a time
+    index.cursor.execute("DELETE FROM champion_lists")
+    index.cursor.execute("DELETE FROM champion_words")
+    rows = 0
+    for word_id, postings in weighted_postings():
+        scored = (
+            (weight / math.sqrt(norm_sq[page_id]) * (1 + QUALITY_WEIGHT * quality.get(page_id, 0.0)), page_id)
+            for page_id, weight in postings if norm_sq[page_id] > 0
+        )
+        champions = heapq.nlargest(r, scored)
+        index.cursor.executemany(
+            "INSERT INTO champion_lists (word_id, page_id, score) VALUES (?, ?, ?)",
+            [(word_id, page_id, score) for score, page_id in champions])
+        index.cursor.execute("INSERT INTO champion_words (word_id, truncated) VALUES (?, ?)",
+                             (word_id, len(champions) < len(postings)))
+        rows += len(champions)
+    index.conn.commit()
+    index.set_meta('champion_generation', index.get_generation())
+    return rows
+
+
+def compare_with_exhaustive(crawler, queries: List[str], top_k: int = 10) -> List[dict]:
+    """
+    Run every query exhaustively and with the champion tier; report latency of both and the
+    fraction of the exhaustive top-k that the champion tier also returns.
+    """
+    report = []
+    for query in queries:
+        start = time.perf_counter()
+        exhaustive = search_engine(crawler, query, top_k=top_k)
+        exhaustive_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tiered = search_engine(crawler, query, top_k=top_k, champions=True)
+        tiered_time = time.perf_counter() - start
+
+        expected = {url for url, score in exhaustive}
+        overlap = len(expected & {url for url, score in tiered}) / len(expected) if expected else 1.0
+        report.append({
+            'query': query,
+            'exhaustive_ms': exhaustive_time * 1000,
+            'champion_ms': tiered_time * 1000,
+            'overlap': overlap,
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build champion lists and compare them with exhaustive scoring.")
+    parser.add_argument("--db", help="update this database in place instead of publishing a new snapshot")
+    parser.add_argument("-r", type=int, default=CHAMPION_SIZE, help="pages kept per term")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("queries", nargs="*")
+    args = parser.parse_args()
+
+    from crawler import Crawler
+    from snapshots import snapshot_update
+    with snapshot_update(args.db) as db_name:
+        crawler = Crawler(None, db_name=db_name)
+        start = time.perf_counter()
+        rows = build_champion_lists(crawler.index, args.r)
+        print(f"Built {rows} champion entries (r={args.r}) in {time.perf_counter() - start:.2f}s")
+        for row in compare_with_exhaustive(crawler, args.queries, args.top_k):
+            print(f"{row['query']}: exhaustive {row['exhaustive_ms']:.1f} ms, "
+                  f"champions {row['champion_ms']:.1f} ms, overlap@{args.top_k} {row['overlap']:.2f}")
+        crawler.close()
@@ -0,0 +1,207 @@
+import argparse
+import math
+import time
+
+from database import Database
+from fts import build_fts_index
+from search import TITLE_WEIGHT
+
+# Every column holding a page id or a word id, the id table first
+PAGE_ID_COLUMNS = [
+    ("pages", "page_id"),
+    ("inverted_index_body", "page_id"),
+    ("inverted_index_title", "page_id"),
+    ("parent_child_links", "parent_id"),
+    ("parent_child_links", "child_id"),
+    ("forward_index_body_page2maxtf", "page_id"),
+    ("forward_index_title_page2maxtf", "page_id"),
+    ("page_quality", "page_id"),
+    ("page_fingerprints", "page_id"),
+    ("fingerprint_bands", "page_id"),
+    ("duplicate_pages", "duplicate_of"),
+    ("page_history", "page_id"),
+    ("champion_lists", "page_id"),
+    ("page_norms", "page_id"),
+]
+WORD_ID_COLUMNS = [
+    ("words", "word_id"),
+    ("inverted_index_body", "word_id"),
+    ("inverted_index_title", "word_id"),
+    ("inverted_index_body_word2df", "word_id"),
+    ("inverted_index_title_word2df", "word_id"),
+    ("champion_lists", "word_id"),
+    ("champion_words", "word_id"),
+]
+
+
+def database_size(index: Database) -> int:
+    """Size of the database file in bytes."""
+    page_count = index.conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = index.conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
+
+
+def _delete_dangling(index: Database, columns, id_table: str, id_column: str) -> int:
+    """Delete the rows referencing ids missing from id_table; returns the number of postings deleted."""
+    postings = 0
+    for table, column in columns[1:]:
+        index.cursor.execute(f'''
+            DELETE FROM {table} WHERE {column} IS NOT NULL AND {column} NOT IN (SELECT {id_column} FROM {id_table})
+        ''')
+        if table.startswith("inverted_index") and not table.endswith("word2df"):
+            postings += index.cursor.rowcount
+    return postings
+
+
+def collect_garbage(index: Database) -> dict:
+    """
+    Delete pages that were never fetched and that nothing links to, words without postings
+    (query words added by _get_or_create_word_id, words of removed pages), and every row referencing them.
+    """
+    index.cursor.execute('''
+        DELETE FROM pages
+        WHERE size IS NULL
+          AND page_id NOT IN (SELECT parent_id FROM parent_child_links)
+          AND page_id NOT IN (SELECT child_id FROM parent_child_links)
+          AND page_id NOT IN (SELECT duplicate_of FROM duplicate_pages WHERE duplicate_of IS NOT NULL)
+    ''')
+    pages = index.cursor.rowcount
+    postings = _delete_dangling(index, PAGE_ID_COLUMNS, "pages", "page_id")
+
+    index.cursor.execute('''
+        DELETE FROM words
+        WHERE word_id NOT IN (SELECT word_id FROM inverted_index_body)
+          AND word_id NOT IN (SELECT word_id FROM inverted_index_title)
+    ''')
+    words = index.cursor.rowcount
+    postings += _delete_dangling(index, WORD_ID_COLUMNS, "words", "word_id")
+    return {'pages_removed': pages, 'words_removed': words, 'postings_removed': postings}
+
+
+def _renumber(index: Database, columns) -> int:
+    """Renumber the ids of columns[0] as 1..n in their current order; returns the number of ids that changed."""
+    id_table, id_column = columns[0]
+    max_id, count = index.cursor.execute(f"SELECT COALESCE(MAX({id_column}), 0), COUNT(*) FROM {id_table}").fetchone()
+    if max_id == count:
+        return 0    # Already dense
+    index.cursor.execute("DROP TABLE IF EXISTS temp.id_map")
+    index.cursor.execute(f'''
+        CREATE TEMP TABLE id_map AS
+        SELECT {id_column} AS old_id, ROW_NUMBER() OVER (ORDER BY {id_column}) AS new_id FROM {id_table}
+    ''')
+    index.cursor.execute("CREATE UNIQUE INDEX temp.id_map_old ON id_map (old_id)")
+    changed = index.cursor.execute("SELECT COUNT(*) FROM id_map WHERE old_id != new_id").fetchone()[0]
+    for table, column in columns:
+        # Shift every id above max_id first, so an id never collides with one that is not renumbered yet
+        index.cursor.execute(f"UPDATE {table} SET {column} = {column} + ?", (max_id,))
+        index.cursor.execute(f'''
+            UPDATE {table} SET {column} = (SELECT new_id FROM id_map WHERE old_id = {table}.{column} - ?)
+        ''', (max_id,))
+    index.cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (count, id_table))
+    index.cursor.execute("DROP TABLE temp.id_map")
+    return changed
+
+
+def renumber_ids(index: Database) -> dict:
+    """Make page and word ids dense (1..n), so arrays indexed by id have no holes."""
+    return {'page_ids_changed': _renumber(index, PAGE_ID_COLUMNS),
+            'word_ids_changed': _renumber(index, WORD_ID_COLUMNS)}
+
+
+def rebuild_statistics(index: Database):
+    """Recompute df, max tf and document vector norms from the postings, one statement each."""
+    for field in ("body", "title"):
+        index.cursor.execute(f"DELETE FROM inverted_index_{field}_word2df")
+        index.cursor.execute(f'''
+            INSERT INTO inverted_index_{field}_word2df (word_id, df)
+            SELECT word_id, COUNT(*) FROM inverted_index_{field} GROUP BY word_id
+        ''')
+        index.cursor.execute(f"DELETE FROM forward_index_{field}_page2maxtf")
+        index.cursor.execute(f'''
+            INSERT INTO forward_index_{field}_page2maxtf (page_id, maxtf)
+            SELECT p.page_id, COALESCE(MAX(i.frequency), 0)
+            FROM pages p LEFT JOIN inverted_index_{field} i ON i.page_id = p.page_id
+            WHERE p.size IS NOT NULL
+            GROUP BY p.page_id
+        ''')
+
+    # Norm of the vector search.build_doc_vector builds for every page
+    index.conn.create_function("idf", 2, lambda n, df: math.log(n / max(df, 1)), deterministic=True)
+    index.conn.create_function("sqrt", 1, math.sqrt, deterministic=True)
+    index.cursor.execute("DELETE FROM page_norms")
+    index.cursor.execute('''
+        INSERT INTO page_norms (page_id, norm)
+        SELECT page_id, sqrt(SUM(w * w)) FROM (
+            SELECT tf.page_id, tf.weight * idf(?, df.df) AS w FROM (
+                SELECT word_id, t.page_id, SUM(tf) * 1.0 / m.max_tf AS weight FROM (
+                    SELECT word_id, page_id, frequency AS tf FROM inverted_index_body
+                    UNION ALL
+                    SELECT word_id, page_id, ? * frequency FROM inverted_index_title
+                ) t
+                JOIN (
+                    SELECT p.page_id, MAX(COALESCE(b.maxtf, 0), ? * COALESCE(t.maxtf, 0), 1) AS max_tf
+                    FROM pages p
+                    LEFT JOIN forward_index_body_page2maxtf b ON b.page_id = p.page_id
+                    LEFT JOIN forward_index_title_page2maxtf t ON t.page_id = p.page_id
+                ) m ON m.page_id = t.page_id
+                GROUP BY word_id, t.page_id
+            ) tf
+            JOIN (
+                SELECT w.word_id, COALESCE(b.df, 0) + COALESCE(t.df, 0) AS df
+                FROM words w
+                LEFT JOIN inverted_index_body_word2df b ON b.word_id = w.word_id
+                LEFT JOIN inverted_index_title_word2df t ON t.word_id = w.word_id
+            ) df ON df.word_id = tf.word_id
+        )
+        GROUP BY page_id
+    ''', (index.get_total_doc_count(), TITLE_WEIGHT, TITLE_WEIGHT))
+
+
+def compact(index: Database, renumber: bool = True) -> dict:
+    """
+    Garbage-collect, renumber ids, rebuild statistics and vacuum the index.
+    Returns the counts of what was removed, the sizes before and after, and the time taken.
+    """
+    start = time.perf_counter()
+    size_before = database_size(index)
+    champions_fresh = index.has_fresh_champion_lists()
+
+    report = collect_garbage(index)
+    if renumber:
+        report.update(renumber_ids(index))
+    rebuild_statistics(index)
+    if index.has_fts_table():
+        build_fts_index(index)      # Its rowids are page ids
+    index.conn.commit()
+
+    # Ids changed: drop cached postings; champion lists were renumbered with everything else
+    index.bump_generation()
+    index.set_meta('norms_generation', index.get_generation())
+    if champions_fresh:
+        index.set_meta('champion_generation', index.get_generation())
+    index.conn.execute("VACUUM")
+
+    report.update({
+        'size_before': size_before,
+        'size_after': database_size(index),
+        'seconds': time.perf_counter() - start,
+    })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact the index and rebuild its statistics.")
+    parser.add_argument("--db", help="update this database in place instead of publishing a new snapshot")
+    parser.add_argument("--no-renumber", action="store_true", help="keep page and word ids as they are")
+    args = parser.parse_args()
+
+    from snapshots import snapshot_update
+    with snapshot_update(args.db) as db_name:
+        index = Database(db_name)
+        report = compact(index, renumber=not args.no_renumber)
+        index.close()
+    print(f"Removed {report['pages_removed']} pages, {report['words_removed']} words, "
+          f"{report['postings_removed']} postings")
+    if not args.no_renumber:
+        print(f"Renumbered {report['page_ids_changed']} page ids, {report['word_ids_changed']} word ids")
+    print(f"Size {report['size_before']} -> {report['size_after']} bytes in {report['seconds']:.2f}s")
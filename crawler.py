@@ -1,29 +1,47 @@
 from bs4 import BeautifulSoup
+import hashlib
 from urllib.parse import urljoin
 import requests
 import re
 from typing import List
 from database import Database
+from fetcher import Fetcher, FetchRejected
+import metrics
+from simhash import simhash
+from fts import token_stream
+from page_text import compress_text
+from recrawl import RecrawlScheduler
 from collections import deque
+from itertools import groupby
 import time
 from nltk.stem import PorterStemmer
 
 
 class Crawler:
-    def __init__(self, start_url: str, max_pages: int = 300):
+    def __init__(self, start_url: str, max_pages: int = 300, db_name: str = "search_engine.db", detect_duplicates: bool = True,
+                 read_only: bool = False):
         self.title=""
         self.start_url = start_url
         self.max_pages = max_pages
-        self.index = Database()
+        self.detect_duplicates = detect_duplicates  # Skip pages whose SimHash is close to an indexed page
+        self.duplicates_skipped = 0
+        self.duplicate_bytes_skipped = 0
+        self.duplicate_postings_skipped = 0
+        self.index = Database(db_name, read_only=read_only)   # read_only: search only, the file is never written
         self.visited = set()
         self.queue = deque([(start_url, None)])  # (url, parent_url), BFS queue
+        self.stemmer = PorterStemmer()
         self.stopwords = self._load_stopwords("stopwords.txt")
         self.upload_file = "spider_result.txt"
+        self.delay = 1  # Seconds to wait between requests (politeness)
+        self.fetcher = Fetcher()
 
     def close(self):
         """Close the database connection"""
         if hasattr(self, 'index'):
             self.index.close()
+        if hasattr(self, 'fetcher'):
+            self.fetcher.close()
 
     def _load_stopwords(self, path: str) -> set:
         """Load and stem stopwords from a file."""
@@ -39,18 +57,12 @@ class Crawler:
             print(f"Error decoding {path}. Check the file encoding.")
             raise
 
-    def _should_fetch(self, url: str) -> bool:
-        """Check if the URL needs to be fetched (based on last_modified)."""
+    def _indexed_copy(self, url: str):
+        """(last_modified, size) of the indexed copy of url, or (None, None) if it was never fetched."""
 
-        self.index.cursor.execute('SELECT last_modified FROM pages WHERE url = ?', (url,))
+        self.index.cursor.execute('SELECT last_modified, size FROM pages WHERE url = ? AND size IS NOT NULL', (url,))
         row = self.index.cursor.fetchone()
-        if not row:
-            return True  
-        else:
-            response = requests.get(url, timeout=10)
-            if row[0] != response.headers.get("Last-Modified", ""):
-                return True
-            return False
+        return (row[0] or None, row[1]) if row else (None, None)
 
     def _extract_title(self, html: str) -> str:
         """Extract title from HTML."""
@@ -61,98 +73,207 @@ class Crawler:
     def crawl(self):
         """Crawl using BFS (queue structure used) and populate the database."""
 
-        stemmer = PorterStemmer()
-
         page_count = 0
         while self.queue and page_count < self.max_pages:       #queue used for BFS
             url, parent_url = self.queue.popleft()
-            if url in self.visited or not self._should_fetch(url):
+            if url in self.visited:
                 continue
 
             print(f"Crawling: {url}")
             try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                html = response.text
-                soup = BeautifulSoup(html, "html.parser")
-
-
-                # Extract and index title words
-                self.title = self._extract_title(html)
-                title_words = []
-                title_words_positions = []
-                pos = 0
-                for word in re.findall(r"\b[\w']+\b", self.title):
-                    if stemmer.stem(word.lower()) not in self.stopwords:
-                        title_words.append(stemmer.stem(word.lower()))
-                        title_words_positions.append(pos)
-                    pos += 1
-
-                # title_words = [
-                #     stemmer.stem(word.lower()) for word in re.findall(r"\b[\w']+\b", self.title)
-                #     if stemmer.stem(word.lower()) not in self.stopwords
-                # ]
-
-                # Extract and index body words (filter stopwords)
-                body_text = soup.get_text(separator=" ", strip=True)
-                body_words = []
-                body_words_positions = []
-                pos = 0
-                for word in re.findall(r"\b[\w']+\b", body_text):
-                    if stemmer.stem(word.lower()) not in self.stopwords:
-                        body_words.append(stemmer.stem(word.lower()))
-                        body_words_positions.append(pos)
-                    pos += 1
-
-                # body_words = [
-                #     stemmer.stem(word.lower()) for word in re.findall(r"\b[\w']+\b", body_text)
-                #     if stemmer.stem(word.lower()) not in self.stopwords
-                # ]
-
-                self.index.add_entry_body(self.title,
-                    url, body_words, body_words_positions,
-                    last_modified=response.headers.get("Last-Modified", ""),
-                    size=len(response.content)
-                )
-
-                self.index.add_entry_title(
-                    self.title,
-                    url, title_words, title_words_positions,
-                    last_modified=response.headers.get("Last-Modified", ""),
-                    size=len(response.content)
-                )
-
-                # Extract links and add to queue
-                links = []
-                for tag in soup.find_all("a", href=True):
-                    href = tag["href"].strip()
-                    if href and not href.startswith("javascript:"):
-                        absolute_url = urljoin(url, href)
-                        links.append(absolute_url)
-                        self.queue.append((absolute_url, url))
-
-                # Record parent-child links
-                if parent_url:
-                    self.index.add_parent_child_link(self.title, parent_url, url)
-
+                # One conditional GET: an indexed page that has not changed costs a 304
+                last_modified, size = self._indexed_copy(url)
+                response = self.fetcher.fetch(url, if_modified_since=last_modified, known_size=size)
+                if response.status_code == 304:
+                    self.index.record_page_check(self.index.get_page_id(url), None, time.time())
+                    continue
+                self._process_page(url, parent_url, response)
                 self.visited.add(url)
                 page_count += 1
-                time.sleep(1)
+                time.sleep(self.delay)
+
+            except FetchRejected as e:
+                print(f"Skipping {url}: {e}")
+                self.visited.add(url)
+            except requests.RequestException as e:
+                print(f"Error fetching {url}: {e}")
+
+        # Postings may have changed: invalidate the postings caches of the readers
+        self.index.bump_generation()
 
+        if self.duplicates_skipped:
+            print(f"Skipped {self.duplicates_skipped} near-duplicate pages "
+                  f"({self.duplicate_bytes_skipped} bytes, {self.duplicate_postings_skipped} postings not indexed)")
+        stats = self.fetcher.stats
+        print(f"Fetched {stats['pages']} pages ({stats['wire_bytes']} bytes received, {stats['content_bytes']} decoded), "
+              f"{stats['not_modified']} not modified, {stats['rejected_type'] + stats['rejected_size']} rejected; "
+              f"{stats['bytes_saved']} bytes not downloaded")
+
+    def recrawl(self, budget: int = 50):
+        """
+        Refetch the `budget` pages most likely to have changed since their last fetch (see recrawl.py),
+        with conditional requests so unchanged pages cost a 304 instead of a full download.
+        Returns {'fetched', 'not_modified', 'changed'} counts.
+        """
+        stats = {'fetched': 0, 'not_modified': 0, 'changed': 0}
+        scheduler = RecrawlScheduler(self.index)
+        for url, priority in scheduler.plan(budget):
+            print(f"Recrawling: {url} (p_changed={priority:.2f})")
+            last_modified, size = self._indexed_copy(url)
+            try:
+                response = self.fetcher.fetch(url, if_modified_since=last_modified, known_size=size)
+                stats['fetched'] += 1
+                if response.status_code == 304:
+                    self.index.record_page_check(self.index.get_page_id(url), None, time.time())
+                    stats['not_modified'] += 1
+                elif self._process_page(url, None, response, follow_links=False):
+                    stats['changed'] += 1
+                time.sleep(self.delay)
             except requests.RequestException as e:
                 print(f"Error fetching {url}: {e}")
 
+        self.index.bump_generation()
+        return stats
+
+    def _tokenize(self, text: str):
+        """Return (stemmed words without stopwords, their positions in the original text)."""
+        words = []
+        positions = []
+        pos = 0
+        for word in re.findall(r"\b[\w']+\b", text):
+            stemmed = self.stemmer.stem(word.lower())
+            if stemmed not in self.stopwords:
+                words.append(stemmed)
+                positions.append(pos)
+            pos += 1
+        return words, positions
+
+    def _parse_page(self, url: str, response) -> dict:
+        """
+        Extract title, stemmed words with positions and links from a fetched page.
+        Does not touch the database, so crawler worker processes can parse pages for a separate index writer.
+        """
+        html = response.text
+        soup = BeautifulSoup(html, "html.parser")
+
+        # Extract title words
+        self.title = self._extract_title(html)
+        title_words, title_words_positions = self._tokenize(self.title)
+
+        # Extract body words (filter stopwords)
+        body_text = soup.get_text(separator=" ", strip=True)
+        body_words, body_words_positions = self._tokenize(body_text)
+
+        # Extract links
+        links = []
+        for tag in soup.find_all("a", href=True):
+            href = tag["href"].strip()
+            if href and not href.startswith("javascript:"):
+                links.append(urljoin(url, href))
+
+        return {
+            'title': self.title,
+            'title_words': title_words,
+            'title_positions': title_words_positions,
+            'body_words': body_words,
+            'body_positions': body_words_positions,
+            'body_text': body_text,
+            'links': links,
+            'last_modified': response.headers.get("Last-Modified", ""),
+            'size': len(response.content),
+            'content_hash': hashlib.sha1(response.content).hexdigest(),
+        }
+
+    def _index_page(self, url: str, parent_url: str, page: dict):
+        """
+        Index a parsed page (see _parse_page), record its change history and its parent link.
+        Returns (indexed, canonical_url): indexed is False if the page was unchanged or a near-duplicate,
+        canonical_url is the indexed page it duplicates (or url itself).
+        """
+        title, size, last_modified = page['title'], page['size'], page['last_modified']
+        title_words, body_words = page['title_words'], page['body_words']
+
+        # Pages whose content did not change since the last fetch are not re-indexed
+        page_id = self.index.get_page_id(url)
+        unchanged = page_id is not None and self.index.get_content_hash(page_id) == page['content_hash']
+
+        # Near-duplicates of an indexed page are recorded against it instead of being indexed again
+        canonical_url = url
+        fingerprint = None
+        if self.detect_duplicates and not unchanged:
+            fingerprint = simhash(title_words + body_words)
+            duplicate_of = self.index.find_near_duplicate(fingerprint, page_id)
+            if duplicate_of is not None:
+                canonical_url = self.index.get_page_urls([duplicate_of])[duplicate_of]
+                self.index.add_duplicate_page(url, duplicate_of, size)
+                self.duplicates_skipped += 1
+                self.duplicate_bytes_skipped += size
+                self.duplicate_postings_skipped += len(set(body_words)) + len(set(title_words))
+                print(f"Skipping near-duplicate of {canonical_url}")
+                if page_id is not None:     # Indexed before: its old content must not stay searchable
+                    self.index.clear_page(page_id, duplicate_of)
+
+        indexed = canonical_url == url and not unchanged
+        if indexed:
+            start = time.perf_counter()
+            if page_id is not None:     # Changed page: drop its old postings first
+                self.index.remove_page_postings(page_id)
+                self.index.update_page(page_id, title, last_modified, size)
+            self.index.remove_duplicate_page(url)     # It may have been recorded as a near-duplicate until now
+
+            self.index.add_entry_body(title,
+                url, body_words, page['body_positions'],
+                last_modified=last_modified,
+                size=size
+            )
+
+            self.index.add_entry_title(
+                title,
+                url, title_words, page['title_positions'],
+                last_modified=last_modified,
+                size=size
+            )
+            page_id = self.index.get_page_id(url)
+            if fingerprint is not None:
+                self.index.store_fingerprint(page_id, fingerprint)
+            self.index.store_page_text(page_id, compress_text(page['body_text']))
+            if self.index.has_fts_table():
+                self.index.add_fts_entry(page_id, token_stream(title_words, page['title_positions']),
+                                         token_stream(body_words, page['body_positions']))
+            metrics.inc('pages_indexed_total')
+            metrics.observe('index_seconds', time.perf_counter() - start)
+
+        if canonical_url == url:
+            self.index.record_page_check(page_id, page['content_hash'], time.time())
+
+        # Record parent-child links (a parent that was itself a duplicate is replaced by its original)
+        if parent_url:
+            self.index.add_parent_child_link(title, self.index.resolve_duplicate(parent_url), canonical_url)
+        return indexed, canonical_url
+
+    def _process_page(self, url: str, parent_url: str, response, follow_links: bool = True) -> bool:
+        """
+        Index a fetched page and queue its links.
+        Returns True if the page was (re-)indexed, False if it was unchanged or a near-duplicate.
+        """
+        page = self._parse_page(url, response)
+        indexed, canonical_url = self._index_page(url, parent_url, page)
+
+        # Add links to queue
+        if follow_links:
+            for link in page['links']:
+                self.queue.append((link, canonical_url))
+        return indexed
+
     def generate_spider_result(self):
         """Generate spider_result.txt with per-page blocks separated by hyphens."""
 
-        with open(self.upload_file, "w") as f:
-            # Fetch all crawled pages
-            self.index.cursor.execute('''
-                SELECT title, url, last_modified, size FROM pages
-            ''')
-            pages = self.index.cursor.fetchall()
+        with open(self.upload_file, "w", buffering=1 << 20) as f:   # Large buffer: few write syscalls
+            for idx, (title, url, last_modified, size, keywords, parents, children) in enumerate(self.iter_spider_result()):
+                # Add separator (hyphens) between pages
+                if idx > 0:
+                    f.write("\n----------------\n\n")
 
-            for idx, (title, url, last_modified, size) in enumerate(pages):
                 # Page metadata
                 f.write(f"Page title: {title}\n")
                 f.write(f"URL: {url}\n")
@@ -160,20 +281,76 @@ class Crawler:
                 f.write(f"Size: {size} bytes\n")
 
                 # Top 5 keywords (excluding stopwords)
-                keywords = self._get_top_keywords(url)
-                f.write(f"Keywords: {keywords}\n")
+                keywords = '; '.join(f"{word}({total})" for word, total in keywords)
+                f.write(f"Keywords: {keywords if keywords else 'None'}\n")
 
                 # Parent links
-                parents = self._get_parent_links(url)
                 f.write(f"Parent Links: {', '.join(parents) if parents else 'None'}\n")
 
                 # Child links
-                children  = self._get_child_links(url)
                 f.write(f"Child Links: {',\n'.join(children) if children else 'None'}\n")
 
-                # Add separator (hyphens) after each page except the last one
-                if idx < len(pages) - 1:
-                    f.write("\n----------------\n\n")
+    def iter_spider_result(self):
+        """
+        Stream (title, url, last_modified, size, keywords, parent urls, child urls) for every page in page_id order.
+        Pages, top-5 keywords, parents and children come from four queries that are all ordered by page_id
+        and walked side by side, so memory use does not grow with the number of pages.
+        """
+        pages = self.index.conn.cursor()
+        pages.execute('''
+            SELECT page_id, title, url, last_modified, size FROM pages ORDER BY page_id
+        ''')
+
+        keywords = self.index.conn.cursor()
+        keywords.execute('''
+            SELECT page_id, word, total FROM (
+                SELECT k.page_id, w.word, k.total,
+                    ROW_NUMBER() OVER (PARTITION BY k.page_id ORDER BY k.total DESC, w.word) AS rn
+                FROM (
+                    SELECT page_id, word_id, SUM(frequency) AS total FROM (
+                        SELECT page_id, word_id, frequency FROM inverted_index_body
+                        UNION ALL
+                        SELECT page_id, word_id, frequency FROM inverted_index_title
+                    )
+                    GROUP BY page_id, word_id
+                ) k
+                JOIN words w ON w.word_id = k.word_id
+                WHERE w.word NOT IN ({})
+            )
+            WHERE rn <= 5
+            ORDER BY page_id, rn
+        '''.format(', '.join(['?'] * len(self.stopwords))), tuple(self.stopwords))
+
+        parents = self.index.conn.cursor()
+        parents.execute('''
+            SELECT pc.child_id, p.url
+            FROM parent_child_links pc
+            JOIN pages p ON pc.parent_id = p.page_id
+            ORDER BY pc.child_id, pc.parent_id
+        ''')
+
+        children = self.index.conn.cursor()
+        children.execute('''
+            SELECT parent_id, url FROM (
+                SELECT pc.parent_id, p.url,
+                    ROW_NUMBER() OVER (PARTITION BY pc.parent_id ORDER BY pc.child_id) AS rn
+                FROM parent_child_links pc
+                JOIN pages p ON pc.child_id = p.page_id
+            )
+            WHERE rn <= 10
+            ORDER BY parent_id, rn
+        ''')
+
+        keyword_groups = _PageGroups(keywords, lambda row: (row[1], row[2]))
+        parent_groups = _PageGroups(parents, lambda row: row[1])
+        child_groups = _PageGroups(children, lambda row: row[1])
+        try:
+            for page_id, title, url, last_modified, size in pages:
+                yield (title, url, last_modified, size,
+                       keyword_groups.take(page_id), parent_groups.take(page_id), child_groups.take(page_id))
+        finally:
+            for cursor in (pages, keywords, parents, children):
+                cursor.close()
 
     def _get_child_links(self, url: str) -> List[str]:
         self.index.cursor.execute('''
@@ -198,25 +375,30 @@ class Crawler:
         parents = [row[0] for row in self.index.cursor.fetchall()]
         return parents if parents else []
 
-    def _get_top_keywords(self, url: str) -> str:
-        """Get top 5 stemmed keywords (excluding stopwords) for a page."""
+    def _top_keywords(self, url: str, k: int = 5) -> List[tuple]:
+        """Return the k most frequent stemmed keywords (excluding stopwords) of a page as (word, total)."""
+        # Start from the page's own postings (page_id indexes) instead of every row of words
         self.index.cursor.execute('''
-            SELECT w.word, 
-                (COALESCE(ib.frequency, 0) + COALESCE(it.frequency, 0)) AS total
-            FROM words w
-            LEFT JOIN inverted_index_body ib 
-                ON w.word_id = ib.word_id 
-                AND ib.page_id = (SELECT page_id FROM pages WHERE url = ?)
-            LEFT JOIN inverted_index_title it 
-                ON w.word_id = it.word_id 
-                AND it.page_id = (SELECT page_id FROM pages WHERE url = ?)
+            SELECT w.word, SUM(k.frequency) AS total
+            FROM (
+                SELECT word_id, frequency FROM inverted_index_body
+                WHERE page_id = (SELECT page_id FROM pages WHERE url = ?)
+                UNION ALL
+                SELECT word_id, frequency FROM inverted_index_title
+                WHERE page_id = (SELECT page_id FROM pages WHERE url = ?)
+            ) k
+            JOIN words w ON w.word_id = k.word_id
             WHERE w.word NOT IN ({})
-            ORDER BY total DESC
-            LIMIT 5
-        '''.format(', '.join(['?'] * len(self.stopwords))), 
-        (url, url, *self.stopwords))
-        
-        keywords = [f"{word}({total})" for word, total in self.index.cursor.fetchall()]
+            GROUP BY w.word_id
+            ORDER BY total DESC, w.word
+            LIMIT ?
+        '''.format(', '.join(['?'] * len(self.stopwords))),
+        (url, url, *self.stopwords, k))
+        return self.index.cursor.fetchall()
+
+    def _get_top_keywords(self, url: str) -> str:
+        """Get top 5 stemmed keywords (excluding stopwords) for a page."""
+        keywords = [f"{word}({total})" for word, total in self._top_keywords(url)]
         return '; '.join(keywords) if keywords else "None"    
         
     # def _get_top_keywords(self, url: str) -> str:
@@ -273,7 +455,9 @@ class Crawler:
             return 0 
         page_id = page_row[0]
         
-        word_id = self.index._get_or_create_word_id(word)
+        word_id = self.index.get_word_id(word)    # Lookups never insert query words
+        if word_id is None:
+            return 0
         
         # Get this word's frequency in the document
         self.index.cursor.execute('''
@@ -300,7 +484,9 @@ class Crawler:
             return []
         page_id = page_row[0]
         
-        word_id = self.index._get_or_create_word_id(word)
+        word_id = self.index.get_word_id(word)
+        if word_id is None:
+            return []
         
         # Get positions string from database
         self.index.cursor.execute('''
@@ -320,7 +506,9 @@ class Crawler:
         Calculate document frequency (DF) of a word in all bodies.
         Returns number of documents containing this word in their body.
         """
-        word_id = self.index._get_or_create_word_id(word)
+        word_id = self.index.get_word_id(word)
+        if word_id is None:
+            return 0
         
         self.index.cursor.execute('''
             SELECT df FROM inverted_index_body_word2df
@@ -370,7 +558,9 @@ class Crawler:
             return 0
         page_id = page_row[0]
         
-        word_id = self.index._get_or_create_word_id(word)
+        word_id = self.index.get_word_id(word)
+        if word_id is None:
+            return 0
         
         # Get this word's frequency in the title
         self.index.cursor.execute('''
@@ -396,7 +586,9 @@ class Crawler:
             return []
         page_id = page_row[0]
         
-        word_id = self.index._get_or_create_word_id(word)
+        word_id = self.index.get_word_id(word)
+        if word_id is None:
+            return []
         
         # Get positions string from database
         self.index.cursor.execute('''
@@ -416,7 +608,9 @@ class Crawler:
         Calculate document frequency (DF) of a word in all titles.
         Returns number of documents containing this word in their title.
         """
-        word_id = self.index._get_or_create_word_id(word)
+        word_id = self.index.get_word_id(word)
+        if word_id is None:
+            return 0
         
         self.index.cursor.execute('''
             SELECT df FROM inverted_index_title_word2df
@@ -495,21 +689,24 @@ class Crawler:
         Extract the top 5 most frequent keywords (excluding stopwords) from the given page.
         Returns a list of keywords to be used as a new query for 'get similar pages'.
         """
-        self.index.cursor.execute('''
-            SELECT w.word, 
-                (COALESCE(ib.frequency, 0) + COALESCE(it.frequency, 0)) AS total
-            FROM words w
-            LEFT JOIN inverted_index_body ib 
-                ON w.word_id = ib.word_id 
-                AND ib.page_id = (SELECT page_id FROM pages WHERE url = ?)
-            LEFT JOIN inverted_index_title it 
-                ON w.word_id = it.word_id 
-                AND it.page_id = (SELECT page_id FROM pages WHERE url = ?)
-            WHERE w.word NOT IN ({})
-            ORDER BY total DESC
-            LIMIT 5
-        '''.format(', '.join(['?'] * len(self.stopwords))),
-        (url, url, *self.stopwords))
-        keywords = [word for word, total in self.index.cursor.fetchall()]
+        keywords = [word for word, total in self._top_keywords(url)]
         return keywords
 
+
+class _PageGroups:
+    """Walks rows ordered by page_id (first column) in step with an ascending sequence of page_ids."""
+
+    def __init__(self, rows, value):
+        self.groups = groupby(rows, key=lambda row: row[0])
+        self.value = value
+        self.current = next(self.groups, None)
+
+    def take(self, page_id: int) -> list:
+        """Return the values of the rows for page_id (empty if it has none)."""
+        while self.current is not None and self.current[0] < page_id:
+            self.current = next(self.groups, None)
+        if self.current is not None and self.current[0] == page_id:
+            values = [self.value(row) for row in self.current[1]]
+            self.current = next(self.groups, None)
+            return values
+        return []
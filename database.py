@@ -1,11 +1,52 @@
 import sqlite3
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+import metrics
+from postings_cache import Postings, shared_cache
+from simhash import BANDS, MAX_DISTANCE, bands, hamming_distance, to_signed, to_unsigned
+
+# Schema changes made after the tables were created, applied in order; PRAGMA user_version counts those applied
+MIGRATIONS = [
+    # 1: parents of a page, and the postings of a page (its terms, max tf rebuilds, re-indexing)
+    '''
+    CREATE INDEX IF NOT EXISTS parent_child_links_child ON parent_child_links (child_id, parent_id);
+    CREATE INDEX IF NOT EXISTS inverted_index_body_page ON inverted_index_body (page_id, word_id, frequency);
+    CREATE INDEX IF NOT EXISTS inverted_index_title_page ON inverted_index_title (page_id, word_id, frequency);
+    CREATE INDEX IF NOT EXISTS fingerprint_bands_page ON fingerprint_bands (page_id);
+    ''',
+    # 2: whether a champion list holds fewer pages than the word occurs in; lists built before it are stale
+    '''
+    CREATE TABLE IF NOT EXISTS champion_words (
+        word_id INTEGER PRIMARY KEY,
+        truncated INTEGER,
+        FOREIGN KEY (word_id) REFERENCES words(word_id)
+    );
+    DELETE FROM index_meta WHERE key = 'champion_generation';
+    ''',
+    # 3: the URLs recorded as duplicates of a page (re-pointed when the page itself stops being indexed)
+    '''
+    CREATE INDEX IF NOT EXISTS duplicate_pages_original ON duplicate_pages (duplicate_of);
+    ''',
+]
 
 class Database:
-    def __init__(self, db_name: str = "search_engine.db"):  # Create a database connection and cursor at search_engine.db
-        self.conn = sqlite3.connect(db_name)
+    trace_callback = None   # Called with every SQL statement run by any Database (query plan tests)
+
+    def __init__(self, db_name: str = "search_engine.db", read_only: bool = False):  # Create a database connection and cursor at search_engine.db
+        # read_only opens an existing database as is: no tables are created and no migration runs
+        target, options = (f"file:{db_name}?mode=ro", {'uri': True}) if read_only else (db_name, {})
+        # Count statements and rows read only when instrumentation is on
+        if metrics.enabled:
+            options['factory'] = metrics.CountingConnection
+        self.conn = sqlite3.connect(target, **options)
+        if Database.trace_callback:
+            self.conn.set_trace_callback(Database.trace_callback)
         self.cursor = self.conn.cursor()
-        self._create_tables()
+        if not read_only:
+            self._create_tables()
+        elif self.conn.execute("PRAGMA user_version").fetchone()[0] < len(MIGRATIONS):
+            raise sqlite3.OperationalError(f"{db_name} has an older schema: open it once without read_only to migrate it")
+        self.postings_cache = shared_cache(db_name)
+        self._cache_checked = False
 
     def _create_tables(self):      
         """Create all tables per the schema design."""
@@ -81,9 +122,77 @@ class Database:
                 PRIMARY KEY (page_id)
                 FOREIGN KEY (page_id) REFERENCES pages(page_id)
             );
+
+            CREATE TABLE IF NOT EXISTS index_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            );
+
+            CREATE TABLE IF NOT EXISTS page_quality (
+                page_id INTEGER,
+                quality REAL,
+                PRIMARY KEY (page_id)
+                FOREIGN KEY (page_id) REFERENCES pages(page_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS page_fingerprints (
+                page_id INTEGER,
+                fingerprint INTEGER,
+                PRIMARY KEY (page_id)
+                FOREIGN KEY (page_id) REFERENCES pages(page_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS fingerprint_bands (
+                band INTEGER,
+                band_value INTEGER,
+                page_id INTEGER,
+                PRIMARY KEY (band, band_value, page_id),
+                FOREIGN KEY (page_id) REFERENCES pages(page_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS duplicate_pages (
+                url TEXT PRIMARY KEY,
+                duplicate_of INTEGER,
+                size INTEGER,
+                FOREIGN KEY (duplicate_of) REFERENCES pages(page_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS page_history (
+                page_id INTEGER,
+                content_hash TEXT,
+                checks INTEGER,
+                changes INTEGER,
+                first_checked REAL,
+                last_checked REAL,
+                PRIMARY KEY (page_id)
+                FOREIGN KEY (page_id) REFERENCES pages(page_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS champion_lists (
+                word_id INTEGER,
+                page_id INTEGER,
+                score REAL,
+                PRIMARY KEY (word_id, page_id),
+                FOREIGN KEY (word_id) REFERENCES words(word_id),
+                FOREIGN KEY (page_id) REFERENCES pages(page_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS page_norms (
+                page_id INTEGER,
+                norm REAL,
+                PRIMARY KEY (page_id)
+                FOREIGN KEY (page_id) REFERENCES pages(page_id)
+            );
                                   
         ''')
         self.conn.commit()
+        self._migrate()
+
+    def _migrate(self):
+        """Apply the migrations this database has not had yet, each in its own transaction."""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], version + 1):
+            self.cursor.executescript(f"BEGIN; {script} PRAGMA user_version = {number}; COMMIT;")
 
     def _get_or_create_word_id(self, word: str) -> int: 
         """Get word_id or insert a new word into `words` table."""
@@ -251,28 +360,352 @@ class Database:
             VALUES (?, ?)
         ''', (parent_id, child_id))
         self.conn.commit()
-    def get_docs_containing_word_body(self, word: str):
-        """Return list of URLs where 'word' appears in the body."""
+    def get_word_id(self, word: str):
+        """Return the word_id of 'word' without inserting it (None if unknown)."""
+        self.cursor.execute('SELECT word_id FROM words WHERE word = ?', (word,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def get_generation(self) -> int:
+        """Return the index generation, bumped every time a crawl changes the index."""
+        return self.get_meta('generation')
+
+    def bump_generation(self):
+        """Mark the index as changed so cached postings are dropped."""
+        fts_fresh = self.has_fresh_fts_index()  # Crawls update pages_fts as they index, it stays fresh
+        self.cursor.execute('''
+            INSERT OR REPLACE INTO index_meta (key, value)
+            VALUES ('generation', COALESCE((SELECT value FROM index_meta WHERE key = 'generation'), 0) + 1)
+        ''')
+        self.conn.commit()
+        self._cache_checked = False     # This object's own cache is stale too
+        if fts_fresh:
+            self.set_meta('fts_generation', self.get_generation())
+
+    def get_meta(self, key: str, default: int = 0) -> int:
+        """Return an integer from index_meta."""
+        self.cursor.execute("SELECT value FROM index_meta WHERE key = ?", (key,))
+        row = self.cursor.fetchone()
+        return int(row[0]) if row else default
+
+    def set_meta(self, key: str, value: int):
+        self.cursor.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)", (key, value))
+        self.conn.commit()
+
+    def has_fresh_champion_lists(self) -> bool:
+        """True if champion lists were built for the current index generation."""
+        return self.get_meta('champion_generation', -1) == self.get_generation()
+
+    def get_champion_list(self, word: str) -> Tuple[List[str], bool]:
+        """
+        Return (URLs in the champion list of 'word', truncated), best first.
+        truncated is True when the word occurs in more pages than its champion list holds.
+        """
         self.cursor.execute("""
-            SELECT DISTINCT p.url
-            FROM inverted_index_body i
-            JOIN pages p ON i.page_id = p.page_id
-            JOIN words w ON i.word_id = w.word_id
+            SELECT p.url FROM champion_lists c
+            JOIN words w ON c.word_id = w.word_id
+            JOIN pages p ON c.page_id = p.page_id
             WHERE w.word = ?
+            ORDER BY c.score DESC
         """, (word,))
+        urls = [row[0] for row in self.cursor.fetchall()]
+        # Stored by build_champion_lists, so the full postings are not read here
+        self.cursor.execute("""
+            SELECT c.truncated FROM champion_words c JOIN words w ON c.word_id = w.word_id WHERE w.word = ?
+        """, (word,))
+        row = self.cursor.fetchone()
+        return urls, bool(row and row[0])
+
+    def has_fresh_page_norms(self) -> bool:
+        """True if document vector norms were computed (by compact.py) for the current index generation."""
+        return self.get_meta('norms_generation', -1) == self.get_generation()
+
+    def get_page_norms(self, urls: List[str]) -> Dict[str, float]:
+        """Return {url: document vector norm} for the given URLs that have a stored norm."""
+        norms = {}
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            self.cursor.execute(f'''
+                SELECT p.url, n.norm FROM pages p JOIN page_norms n ON n.page_id = p.page_id
+                WHERE p.url IN ({','.join('?' * len(chunk))})
+            ''', chunk)
+            norms.update(self.cursor.fetchall())
+        return norms
+
+    def create_fts_table(self):
+        """
+        Create pages_fts, the FTS5 mirror of the stemmed title and body token streams (rowid = page_id).
+        Tokens are split on spaces only: apostrophes and underscores stay in words, and '~' is the
+        stopword filler of fts.token_stream.
+        """
+        self.cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+                title, body, tokenize="unicode61 remove_diacritics 0 tokenchars '''_~'", columnsize=0
+            )
+        """)
+        self.conn.commit()
+
+    def has_fts_table(self) -> bool:
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'pages_fts'")
+        return self.cursor.fetchone() is not None
+
+    def has_fresh_fts_index(self) -> bool:
+        """True if pages_fts was built (by fts.py) and kept up to date for the current index generation."""
+        return self.get_meta('fts_generation', -1) == self.get_generation() and self.has_fts_table()
+
+    def add_fts_entry(self, page_id: int, title: str, body: str):
+        """Mirror the token streams of a page (fts.token_stream) into pages_fts."""
+        self.cursor.execute("DELETE FROM pages_fts WHERE rowid = ?", (page_id,))
+        self.cursor.execute("INSERT INTO pages_fts (rowid, title, body) VALUES (?, ?, ?)", (page_id, title, body))
+        self.conn.commit()
+
+    def get_fts_matches(self, expression: str) -> List[str]:
+        """URLs of the pages matching an FTS5 query."""
+        self.cursor.execute('''
+            SELECT p.url FROM pages_fts f JOIN pages p ON p.page_id = f.rowid
+            WHERE pages_fts MATCH ?
+        ''', (expression,))
         return [row[0] for row in self.cursor.fetchall()]
 
+    def get_postings(self, field: str, word: str) -> Postings:
+        """
+        Return the decoded postings of 'word' in field ('body' or 'title'), through the postings cache.
+        Unknown words get an empty list and are not inserted into `words`.
+        """
+        if not self._cache_checked:     # Check the generation once per Database object
+            self.postings_cache.check_generation(self.get_generation())
+            self._cache_checked = True
+        word_id = self.get_word_id(word)
+        if word_id is None:
+            return Postings([])
+        key = (field, word_id)
+        postings = self.postings_cache.get(key)
+        if postings is None:
+            self.cursor.execute(f'''
+                SELECT page_id, frequency, positions FROM inverted_index_{field}
+                WHERE word_id = ?
+                ORDER BY page_id
+            ''', (word_id,))
+            postings = Postings(self.cursor.fetchall())
+            self.postings_cache.put(key, postings)
+        return postings
+
+    def refresh_postings_cache(self):
+        """Re-check the index generation (for long-lived Database objects)."""
+        self._cache_checked = False
+
+    def get_page_id(self, url: str):
+        """Return the page_id of 'url' without inserting it (None if unknown)."""
+        self.cursor.execute('SELECT page_id FROM pages WHERE url = ?', (url,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def store_fingerprint(self, page_id: int, fingerprint: int):
+        """Save a page's SimHash fingerprint and its bands."""
+        self.cursor.execute('DELETE FROM fingerprint_bands WHERE page_id = ?', (page_id,))
+        self.cursor.execute('''
+            INSERT OR REPLACE INTO page_fingerprints (page_id, fingerprint) VALUES (?, ?)
+        ''', (page_id, to_signed(fingerprint)))
+        self.cursor.executemany('''
+            INSERT INTO fingerprint_bands (band, band_value, page_id) VALUES (?, ?, ?)
+        ''', [(band, value, page_id) for band, value in enumerate(bands(fingerprint))])
+        self.conn.commit()
+
+    def find_near_duplicate(self, fingerprint: int, exclude_page_id: int = None):
+        """
+        Return the page_id of the closest indexed page within MAX_DISTANCE bits of fingerprint, or None.
+        Only pages sharing at least one band are compared, which still finds every page within MAX_DISTANCE.
+        """
+        conditions = ' OR '.join(['(b.band = ? AND b.band_value = ?)'] * BANDS)
+        params = [x for band, value in enumerate(bands(fingerprint)) for x in (band, value)]
+        self.cursor.execute(f'''
+            SELECT DISTINCT f.page_id, f.fingerprint
+            FROM fingerprint_bands b
+            JOIN page_fingerprints f ON f.page_id = b.page_id
+            WHERE {conditions}
+        ''', params)
+        best = None
+        for page_id, other in self.cursor.fetchall():
+            if page_id == exclude_page_id:
+                continue
+            distance = hamming_distance(fingerprint, to_unsigned(other))
+            if distance <= MAX_DISTANCE and (best is None or distance < best[0]):
+                best = (distance, page_id)
+        return best[1] if best else None
+
+    def add_duplicate_page(self, url: str, duplicate_of: int, size: int):
+        """Record a URL that was not indexed because it duplicates page duplicate_of."""
+        self.cursor.execute('''
+            INSERT OR REPLACE INTO duplicate_pages (url, duplicate_of, size) VALUES (?, ?, ?)
+        ''', (url, duplicate_of, size))
+        self.conn.commit()
+
+    def remove_duplicate_page(self, url: str):
+        """Forget that a URL duplicates another page (it is indexed on its own again)."""
+        self.cursor.execute('DELETE FROM duplicate_pages WHERE url = ?', (url,))
+        self.conn.commit()
+
+    def get_content_hash(self, page_id: int):
+        """Return the content hash recorded at the last fetch of a page (None if never recorded)."""
+        self.cursor.execute('SELECT content_hash FROM page_history WHERE page_id = ?', (page_id,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def record_page_check(self, page_id: int, content_hash, checked_at: float) -> bool:
+        """
+        Record one fetch of a page in page_history. content_hash None means the server answered
+        304 Not Modified. Returns True if the content changed since the previous fetch.
+        """
+        self.cursor.execute('SELECT content_hash FROM page_history WHERE page_id = ?', (page_id,))
+        row = self.cursor.fetchone()
+        if not row:
+            self.cursor.execute('''
+                INSERT INTO page_history (page_id, content_hash, checks, changes, first_checked, last_checked)
+                VALUES (?, ?, 1, 0, ?, ?)
+            ''', (page_id, content_hash, checked_at, checked_at))
+            self.conn.commit()
+            return False
+        changed = content_hash is not None and content_hash != row[0]
+        self.cursor.execute('''
+            UPDATE page_history
+            SET content_hash = COALESCE(?, content_hash), checks = checks + 1,
+                changes = changes + ?, last_checked = ?
+            WHERE page_id = ?
+        ''', (content_hash, int(changed), checked_at, page_id))
+        self.conn.commit()
+        return changed
+
+    def get_page_history(self) -> List[Tuple[str, str, int, int, float, float]]:
+        """
+        Return (url, last_modified, checks, changes, first_checked, last_checked) for every fetched page.
+        Pages indexed before history was recorded have None in the history columns.
+        """
+        self.cursor.execute('''
+            SELECT p.url, p.last_modified, h.checks, h.changes, h.first_checked, h.last_checked
+            FROM pages p
+            LEFT JOIN page_history h ON p.page_id = h.page_id
+            WHERE p.size IS NOT NULL
+        ''')
+        return self.cursor.fetchall()
+
+    def update_page(self, page_id: int, title: str, last_modified: str, size: int):
+        """Update the metadata of a page that has been fetched again."""
+        self.cursor.execute('''
+            UPDATE pages SET title = ?, last_modified = ?, size = ? WHERE page_id = ?
+        ''', (title, last_modified, size, page_id))
+        self.conn.commit()
+
+    def remove_page_postings(self, page_id: int):
+        """Delete the postings and maxtf of a page and decrement the df of its words, before re-indexing it."""
+        for field in ('body', 'title'):
+            self.cursor.execute(f'''
+                UPDATE inverted_index_{field}_word2df SET df = df - 1
+                WHERE word_id IN (SELECT word_id FROM inverted_index_{field} WHERE page_id = ?)
+            ''', (page_id,))
+            self.cursor.execute(f'DELETE FROM inverted_index_{field} WHERE page_id = ?', (page_id,))
+            self.cursor.execute(f'DELETE FROM forward_index_{field}_page2maxtf WHERE page_id = ?', (page_id,))
+        if self.has_fts_table():
+            self.cursor.execute('DELETE FROM pages_fts WHERE rowid = ?', (page_id,))
+        self.conn.commit()
+
+    def clear_page(self, page_id: int, duplicate_of: int = None):
+        """
+        Drop what was indexed for a page that is no longer indexed (it became a near-duplicate of duplicate_of):
+        postings, FTS row, text, norm and fingerprint. URLs recorded as duplicates of the page are re-pointed to
+        duplicate_of (dropped without one). The pages row, its history and its links stay.
+        """
+        self.remove_page_postings(page_id)
+        if duplicate_of is None:
+            self.cursor.execute('DELETE FROM duplicate_pages WHERE duplicate_of = ?', (page_id,))
+        else:
+            self.cursor.execute('UPDATE duplicate_pages SET duplicate_of = ? WHERE duplicate_of = ?',
+                                (duplicate_of, page_id))
+        self.cursor.execute('UPDATE pages SET body = NULL WHERE page_id = ?', (page_id,))
+        self.cursor.execute('DELETE FROM page_norms WHERE page_id = ?', (page_id,))
+        self.cursor.execute('DELETE FROM page_fingerprints WHERE page_id = ?', (page_id,))
+        self.cursor.execute('DELETE FROM fingerprint_bands WHERE page_id = ?', (page_id,))
+        self.conn.commit()
+
+    def store_page_text(self, page_id: int, blob: bytes):
+        """Save the compressed text of a page (page_text.compress_text) in pages.body."""
+        self.cursor.execute("UPDATE pages SET body = ? WHERE page_id = ?", (blob, page_id))
+        self.conn.commit()
+
+    def get_page_text(self, url: str):
+        """Return (page_id, compressed text) of a page; the text is None for pages crawled before it was stored."""
+        self.cursor.execute("SELECT page_id, body FROM pages WHERE url = ?", (url,))
+        row = self.cursor.fetchone()
+        return row if row else (None, None)
+
+    def resolve_duplicate(self, url: str) -> str:
+        """Return the URL of the indexed page that 'url' duplicates, or 'url' itself."""
+        self.cursor.execute('''
+            SELECT p.url FROM duplicate_pages d JOIN pages p ON p.page_id = d.duplicate_of
+            WHERE d.url = ?
+        ''', (url,))
+        row = self.cursor.fetchone()
+        return row[0] if row else url
+
+    def get_docs_containing_word_body(self, word: str):
+        """Return list of URLs where 'word' appears in the body."""
+        return self.get_urls_for_page_ids(self.get_postings('body', word).page_ids)
+
     def get_docs_containing_word_title(self, word: str):
         """Return list of URLs where 'word' appears in the title."""
-        self.cursor.execute("""
-            SELECT DISTINCT p.url
-            FROM inverted_index_title i
-            JOIN pages p ON i.page_id = p.page_id
-            JOIN words w ON i.word_id = w.word_id
-            WHERE w.word = ?
-        """, (word,))
+        return self.get_urls_for_page_ids(self.get_postings('title', word).page_ids)
+
+    def get_page_ids_containing_word(self, word: str) -> List[int]:
+        """Return sorted page_ids where 'word' appears in the body or title."""
+        body = self.get_postings('body', word).page_ids
+        title = self.get_postings('title', word).page_ids
+        return sorted(set(body).union(title))
+
+    def get_page_ids_containing_word_body(self, word: str) -> List[int]:
+        """Return sorted page_ids where 'word' appears in the body."""
+        return list(self.get_postings('body', word).page_ids)
+
+    def get_body_positions_by_page(self, word: str) -> Dict[int, List[int]]:
+        """Return {page_id: sorted positions} of 'word' in every page body."""
+        return self.get_postings('body', word).positions_by_page()
+
+    def get_body_positions_by_url(self, word: str) -> Dict[str, List[int]]:
+        """Return {url: sorted positions} of 'word' in every page body."""
+        positions = self.get_body_positions_by_page(word)
+        urls = self.get_page_urls(positions)
+        return {urls[page_id]: pos for page_id, pos in positions.items() if page_id in urls}
+
+    def get_all_page_ids(self) -> List[int]:
+        """Return every page_id in ascending order."""
+        self.cursor.execute("SELECT page_id FROM pages ORDER BY page_id")
         return [row[0] for row in self.cursor.fetchall()]
 
+    def get_page_urls(self, page_ids) -> Dict[int, str]:
+        """Return {page_id: url} for the given page_ids."""
+        urls = {}
+        page_ids = list(page_ids)
+        for i in range(0, len(page_ids), 500):  # Stay below SQLite's host parameter limit
+            chunk = page_ids[i:i + 500]
+            self.cursor.execute(
+                f"SELECT page_id, url FROM pages WHERE page_id IN ({', '.join(['?'] * len(chunk))})", chunk)
+            urls.update(self.cursor.fetchall())
+        return urls
+
+    def get_urls_for_page_ids(self, page_ids) -> List[str]:
+        """Map page_ids to URLs, keeping their order."""
+        urls = self.get_page_urls(page_ids)
+        return [urls[page_id] for page_id in page_ids if page_id in urls]
+
+    def get_vocabulary_with_df(self) -> List[Tuple[str, int]]:
+        """Return (word, df) for every word with at least one posting, df counting body and title."""
+        self.cursor.execute("""
+            SELECT w.word, COALESCE(b.df, 0) + COALESCE(t.df, 0) AS total_df
+            FROM words w
+            LEFT JOIN inverted_index_body_word2df b ON b.word_id = w.word_id
+            LEFT JOIN inverted_index_title_word2df t ON t.word_id = w.word_id
+            WHERE total_df > 0
+        """)
+        return self.cursor.fetchall()
+
     def get_total_doc_count(self):
         """Return the total number of documents in the database."""
         self.cursor.execute("SELECT COUNT(*) FROM pages")
@@ -0,0 +1,238 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+import requests
+
+from crawler import Crawler
+from fetcher import Fetcher
+
+FRONTIER_DB = "frontier.db"
+LEASE_SECONDS = 60      # A URL leased by a worker that has not finished it by then is handed out again
+LEASE_BATCH = 5         # URLs leased per request
+MAX_ATTEMPTS = 3        # Leases per URL before it is marked as failed
+
+
+class Frontier:
+    """
+    Crawl frontier shared by several processes through a SQLite file.
+    Workers lease URLs for a limited time, push parsed pages to a queue for the single index writer,
+    and add the links they found. URLs whose lease expires (dead or stuck worker) are leased again.
+    """
+
+    def __init__(self, path: str = FRONTIER_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)    # Explicit transactions
+        self.conn.execute("PRAGMA journal_mode=WAL")    # Readers do not block the writers
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS frontier (
+                url TEXT PRIMARY KEY,
+                parent_url TEXT,
+                seq INTEGER,
+                state TEXT,             -- pending, leased, done (parsed) or failed
+                lease_owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER DEFAULT 0
+            );
+
+            CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state, seq);
+
+            CREATE TABLE IF NOT EXISTS parsed_pages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT,
+                parent_url TEXT,
+                page TEXT               -- JSON from Crawler._parse_page
+            );
+        ''')
+
+    def reset(self):
+        """Forget the URLs and parsed pages of earlier runs."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("DELETE FROM frontier")
+        self.conn.execute("DELETE FROM parsed_pages")
+        self.conn.execute("COMMIT")
+
+    def add(self, links: List[Tuple[str, Optional[str]]]):
+        """Queue (url, parent_url) pairs; URLs already in the frontier are ignored (BFS order by seq)."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM frontier").fetchone()[0]
+        for i, (url, parent_url) in enumerate(links, 1):
+            self.conn.execute('''
+                INSERT OR IGNORE INTO frontier (url, parent_url, seq, state) VALUES (?, ?, ?, 'pending')
+            ''', (url, parent_url, seq + i))
+        self.conn.execute("COMMIT")
+
+    def lease(self, owner: str, n: int = LEASE_BATCH, lease_seconds: float = LEASE_SECONDS,
+              max_pages: int = None) -> List[Tuple[str, Optional[str]]]:
+        """Lease up to n pending (or expired) URLs to owner, never more than max_pages parsed or in progress."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")    # One leaser at a time, so no URL is leased twice
+        try:
+            self.conn.execute('''
+                UPDATE frontier SET state = 'failed'
+                WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?
+            ''', (now, MAX_ATTEMPTS))
+            if max_pages is not None:
+                busy = self.conn.execute('''
+                    SELECT COUNT(*) FROM frontier
+                    WHERE state = 'done' OR (state = 'leased' AND lease_expires >= ?)
+                ''', (now,)).fetchone()[0]
+                n = min(n, max_pages - busy)
+            rows = []
+            if n > 0:
+                rows = self.conn.execute('''
+                    SELECT url, parent_url FROM frontier
+                    WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+                    ORDER BY seq LIMIT ?
+                ''', (now, n)).fetchall()
+                self.conn.executemany('''
+                    UPDATE frontier SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                    WHERE url = ?
+                ''', [(owner, now + lease_seconds, url) for url, parent_url in rows])
+            self.conn.execute("COMMIT")
+            return rows
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def complete(self, owner: str, url: str, parent_url: Optional[str], page: Optional[dict]):
+        """
+        Finish a leased URL: queue its parsed page for the index writer and add its links.
+        A URL without a page (fetch failed or rejected) is marked failed and does not count against max_pages.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        updated = self.conn.execute('''
+            UPDATE frontier SET state = ? WHERE url = ? AND state = 'leased' AND lease_owner = ?
+        ''', ('done' if page is not None else 'failed', url, owner)).rowcount
+        if updated and page is not None:    # Lost leases were re-issued: the new owner reports the page
+            self.conn.execute('''
+                INSERT INTO parsed_pages (url, parent_url, page) VALUES (?, ?, ?)
+            ''', (url, parent_url, json.dumps(page)))
+            seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM frontier").fetchone()[0]
+            self.conn.executemany('''
+                INSERT OR IGNORE INTO frontier (url, parent_url, seq, state) VALUES (?, ?, ?, 'pending')
+            ''', [(link, url, seq + i) for i, link in enumerate(page['links'], 1)])
+        self.conn.execute("COMMIT")
+
+    def take_parsed(self, n: int = 50) -> List[Tuple[int, str, Optional[str], dict]]:
+        rows = self.conn.execute('''
+            SELECT id, url, parent_url, page FROM parsed_pages ORDER BY id LIMIT ?
+        ''', (n,)).fetchall()
+        return [(row_id, url, parent_url, json.loads(page)) for row_id, url, parent_url, page in rows]
+
+    def remove_parsed(self, row_id: int):
+        self.conn.execute("DELETE FROM parsed_pages WHERE id = ?", (row_id,))
+
+    def in_progress(self) -> int:
+        """URLs leased out and not yet expired."""
+        return self.conn.execute('''
+            SELECT COUNT(*) FROM frontier WHERE state = 'leased' AND lease_expires >= ?
+        ''', (time.time(),)).fetchone()[0]
+
+    def counts(self) -> dict:
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+def run_worker(frontier_path: str, max_pages: int, delay: float = 1, lease_seconds: float = LEASE_SECONDS,
+               owner: str = None):
+    """
+    Crawler worker process: lease URLs, fetch and parse them, report results to the frontier.
+    Exits once there is nothing left to lease and no other worker still holds a lease.
+    """
+    owner = owner or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    frontier = Frontier(frontier_path)
+    parser = Crawler(None, db_name=":memory:")    # Only used to parse pages; the writer owns the index
+    fetcher = Fetcher()     # Keep-alive connections, type and size filtering
+    while True:
+        leased = frontier.lease(owner, lease_seconds=lease_seconds, max_pages=max_pages)
+        if not leased:
+            if frontier.in_progress() == 0:
+                break
+            time.sleep(0.2)     # Others may still add links or drop their leases
+            continue
+        for url, parent_url in leased:
+            page = None
+            try:
+                response = fetcher.fetch(url)
+                page = parser._parse_page(url, response)
+            except requests.RequestException as e:
+                print(f"Error fetching {url}: {e}")
+            frontier.complete(owner, url, parent_url, page)
+            time.sleep(delay)
+    fetcher.close()
+    parser.close()
+    frontier.close()
+
+
+def run_index_writer(crawler: Crawler, frontier: Frontier, workers: List[multiprocessing.Process]) -> int:
+    """Index parsed pages from the frontier until every worker has exited; returns pages consumed."""
+    consumed = 0
+    while True:
+        workers_alive = any(w.is_alive() for w in workers)
+        batch = frontier.take_parsed()
+        for row_id, url, parent_url, page in batch:
+            print(f"Indexing: {url}")
+            crawler._index_page(url, parent_url, page)
+            frontier.remove_parsed(row_id)
+            consumed += 1
+        if not batch:
+            if not workers_alive:
+                break
+            time.sleep(0.2)
+    crawler.index.bump_generation()
+    return consumed
+
+
+def distributed_crawl(start_url: str, workers: int = 4, max_pages: int = 300, db_name: str = "search_engine.db",
+                      frontier_path: str = FRONTIER_DB, delay: float = 1, lease_seconds: float = LEASE_SECONDS,
+                      resume: bool = False) -> dict:
+    """
+    Crawl with several worker processes sharing a leased frontier, while this process is the only index writer.
+    The frontier starts empty unless resume is set, which continues the one left by an interrupted run.
+    Returns the frontier state counts.
+    """
+    frontier = Frontier(frontier_path)
+    if not resume:
+        frontier.reset()
+    frontier.add([(start_url, None)])
+    context = multiprocessing.get_context("spawn")     # Fresh interpreters: no inherited connections or threads
+    processes = [
+        context.Process(target=run_worker, args=(frontier_path, max_pages, delay, lease_seconds))
+        for _ in range(workers)
+    ]
+    for p in processes:
+        p.start()
+
+    crawler = Crawler(start_url, max_pages, db_name=db_name)
+    try:
+        run_index_writer(crawler, frontier, processes)
+    finally:
+        for p in processes:
+            p.join()
+        crawler.close()
+    counts = frontier.counts()
+    frontier.close()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl with several worker processes and one index writer.")
+    parser.add_argument("--start-url", default="https://www.cse.ust.hk/~kwtleung/COMP4321/testpage.htm")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-pages", type=int, default=300)
+    parser.add_argument("--db", help="update this database in place instead of publishing a new snapshot")
+    parser.add_argument("--frontier", default=FRONTIER_DB)
+    parser.add_argument("--resume", action="store_true", help="continue the frontier of an interrupted run")
+    args = parser.parse_args()
+    from snapshots import snapshot_update
+    with snapshot_update(args.db) as db_name:
+        print(distributed_crawl(args.start_url, args.workers, args.max_pages, db_name, args.frontier,
+                                resume=args.resume))
@@ -0,0 +1,151 @@
+import argparse
+import json
+import math
+import time
+from typing import Dict, List, Tuple
+
+from benchmark import percentile
+from search import search_engine
+
+P_AT = (5, 10)      # Cutoffs of the precision@k columns
+NDCG_AT = 10
+
+
+def load_judgments(path: str) -> Dict[str, Dict[str, int]]:
+    """
+    Read a relevance file: one `query<TAB>url<TAB>grade` line per judged page (grade 0 = not relevant,
+    higher = more relevant); blank lines and lines starting with '#' are skipped. Returns {query: {url: grade}}.
+    """
+    judgments = {}
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            parts = line.split("\t")
+            if len(parts) != 3:
+                raise ValueError(f"{path}:{line_no}: expected query, url and grade separated by tabs")
+            query, url, grade = parts
+            judgments.setdefault(query.strip(), {})[url.strip()] = int(grade)
+    return judgments
+
+
+def average_precision(ranked: List[str], grades: Dict[str, int]) -> float:
+    """Mean of the precision at every relevant page retrieved, over all relevant judged pages."""
+    relevant = sum(1 for grade in grades.values() if grade > 0)
+    if relevant == 0:
+        return 0.0
+    hits, total = 0, 0.0
+    for i, url in enumerate(ranked, 1):
+        if grades.get(url, 0) > 0:
+            hits += 1
+            total += hits / i
+    return total / relevant
+
+
+def ndcg(ranked: List[str], grades: Dict[str, int], k: int = NDCG_AT) -> float:
+    """Normalized discounted cumulative gain at k, gain 2^grade - 1 (unjudged pages count as grade 0)."""
+    dcg = lambda gains: sum((2 ** g - 1) / math.log2(i + 1) for i, g in enumerate(gains, 1))
+    ideal = dcg(sorted(grades.values(), reverse=True)[:k])
+    return dcg([grades.get(url, 0) for url in ranked[:k]]) / ideal if ideal else 0.0
+
+
+def precision_at(ranked: List[str], grades: Dict[str, int], k: int) -> float:
+    return sum(1 for url in ranked[:k] if grades.get(url, 0) > 0) / k
+
+
+def overlap_at(ranked: List[str], reference: List[str], k: int = NDCG_AT) -> float:
+    """Share of the reference top-k that the ranking also returns in its top-k."""
+    expected = set(reference[:k])
+    return len(expected & set(ranked[:k])) / len(expected) if expected else 1.0
+
+
+def _timed(crawler, query, top_k, options) -> Tuple[List[str], float]:
+    start = time.perf_counter()
+    results = search_engine(crawler, query, top_k=top_k, **options)
+    return [url for url, score in results], (time.perf_counter() - start) * 1000
+
+
+def _summary(rows: List[dict], prefix: str = '') -> dict:
+    mean = lambda key: sum(row[prefix + key] for row in rows) / len(rows) if rows else 0.0
+    latencies = [row[prefix + 'ms'] for row in rows]
+    summary = {'map': mean('ap'), f'ndcg@{NDCG_AT}': mean('ndcg')}
+    summary.update({f'p@{k}': mean(f'p@{k}') for k in P_AT})
+    summary.update({'p50_ms': percentile(latencies, 50), 'p95_ms': percentile(latencies, 95),
+                    'p99_ms': percentile(latencies, 99)})
+    return summary
+
+
+def evaluate(crawler, judgments: Dict[str, Dict[str, int]], top_k: int = 50, **options) -> dict:
+    """
+    Run every judged query with the search options under test (spelling, proximity, champions, fts) and
+    with the reference exhaustive cosine ranking (no options). Returns the per-query rows and, for both,
+    MAP, nDCG@10, P@k and latency percentiles, plus the mean overlap@10 of the tested ranking with the reference.
+    """
+    # A first pass gets the reference rankings and warms the caches, so both timed runs below start warm
+    references = {query: _timed(crawler, query, top_k, {})[0] for query in judgments}
+    rows = []
+    for query, grades in judgments.items():
+        ranked, ms = _timed(crawler, query, top_k, options)
+        reference = references[query]
+        reference_ms = _timed(crawler, query, top_k, {})[1]
+        row = {'query': query, 'ms': ms, 'ap': average_precision(ranked, grades), 'ndcg': ndcg(ranked, grades),
+               'overlap': overlap_at(ranked, reference),
+               'ref_ms': reference_ms, 'ref_ap': average_precision(reference, grades),
+               'ref_ndcg': ndcg(reference, grades)}
+        for k in P_AT:
+            row[f'p@{k}'] = precision_at(ranked, grades, k)
+            row[f'ref_p@{k}'] = precision_at(reference, grades, k)
+        rows.append(row)
+    summary = _summary(rows)
+    summary[f'overlap@{NDCG_AT}'] = sum(row['overlap'] for row in rows) / len(rows) if rows else 1.0
+    return {
+        'options': {name: bool(value) for name, value in options.items()},
+        'queries': len(rows),
+        'summary': summary,
+        'reference': _summary(rows, 'ref_'),
+        'rows': rows,
+    }
+
+
+def regressions(report: dict, tolerance: float = 0.01) -> List[str]:
+    """Quality metrics of the tested configuration more than `tolerance` below the reference ranking."""
+    return [f"{name}: {report['summary'][name]:.4f} vs {report['reference'][name]:.4f} (reference)"
+            for name in ['map', f'ndcg@{NDCG_AT}'] + [f'p@{k}' for k in P_AT]
+            if report['summary'][name] < report['reference'][name] - tolerance]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure ranking quality and latency against relevance judgments.")
+    parser.add_argument("judgments", help="TSV file of query, url, grade")
+    parser.add_argument("--db", help="database to read (default: the served index)")
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--fuzzy", action="store_true", help="replace misspelled words (FUZZY_EXPANSION)")
+    parser.add_argument("--proximity", action="store_true")
+    parser.add_argument("--champions", action="store_true")
+    parser.add_argument("--fts", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="largest drop below the reference ranking that is still accepted")
+    parser.add_argument("--out", help="save the full report as JSON")
+    args = parser.parse_args()
+
+    from crawler import Crawler
+    from spelling import SpellingIndex
+    from snapshots import current_snapshot
+    crawler = Crawler(None, db_name=args.db or current_snapshot(), read_only=True)
+    spelling = SpellingIndex(crawler.index.get_vocabulary_with_df()) if args.fuzzy else None
+    report = evaluate(crawler, load_judgments(args.judgments), args.top_k, spelling=spelling,
+                      proximity=args.proximity, champions=args.champions, fts=args.fts)
+    crawler.close()
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{report['queries']} queries, options: {', '.join(n for n, on in report['options'].items() if on) or 'none'}")
+    for label, summary in (("tested", report['summary']), ("reference", report['reference'])):
+        print(f"{label}: " + ", ".join(f"{name} {value:.4f}" if not name.endswith('_ms') else f"{name} {value:.1f}"
+                                       for name, value in summary.items()))
+    failed = regressions(report, args.tolerance)
+    for line in failed:
+        print(f"REGRESSION {line}")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,108 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+ALLOWED_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+MAX_PAGE_BYTES = 2 * 1024 * 1024    # Pages larger than this are not downloaded past the cap
+CHUNK_BYTES = 64 * 1024
+USER_AGENT = "COMP4321-Spider/1.0"
+
+
+class FetchRejected(requests.RequestException):
+    """The response was dropped because of its type or size (not an error of the site)."""
+
+
+class Fetcher:
+    """
+    Fetch layer shared by the crawlers: one Session with pooled keep-alive connections and gzip,
+    a single conditional GET per page (no HEAD or separate freshness request), rejection of
+    non-HTML and oversized responses from their headers, and a byte cap while streaming the body.
+    """
+
+    def __init__(self, max_bytes: int = MAX_PAGE_BYTES, allowed_types=ALLOWED_CONTENT_TYPES,
+                 timeout: float = 10, pool_size: int = 10):
+        self.max_bytes = max_bytes
+        self.allowed_types = allowed_types
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"})
+        self.stats = {
+            'requests': 0,
+            'pages': 0,
+            'not_modified': 0,
+            'rejected_type': 0,
+            'rejected_size': 0,
+            'wire_bytes': 0,        # Bytes received (compressed)
+            'content_bytes': 0,     # Bytes of page content after decompression
+            'bytes_saved': 0,       # Known bytes not downloaded: rejected bodies and 304s
+        }
+
+    def fetch(self, url: str, if_modified_since: str = None, known_size: int = None) -> requests.Response:
+        """
+        GET url and return the response with its body read (at most max_bytes).
+        With if_modified_since the request is conditional: a 304 response is returned without a body,
+        known_size being the size of the copy we already have. Raises FetchRejected for unwanted
+        responses and requests.RequestException for errors.
+        """
+        start = time.perf_counter()
+        try:
+            return self._fetch(url, if_modified_since, known_size)
+        except FetchRejected:
+            raise
+        except requests.RequestException:
+            metrics.inc('fetch_errors_total')
+            raise
+        finally:
+            metrics.observe('fetch_seconds', time.perf_counter() - start)
+
+    def _fetch(self, url: str, if_modified_since: str, known_size: int) -> requests.Response:
+        headers = {"If-Modified-Since": if_modified_since} if if_modified_since else {}
+        self.stats['requests'] += 1
+        response = self.session.get(url, timeout=self.timeout, headers=headers, stream=True)
+        with response:
+            if response.status_code == 304:
+                self.stats['not_modified'] += 1
+                self.stats['bytes_saved'] += known_size or 0
+                response._content = b""
+                return response
+            response.raise_for_status()
+
+            content_type = response.headers.get("Content-Type", "text/html").split(";")[0].strip().lower()
+            declared = int(response.headers.get("Content-Length", 0) or 0)
+            if content_type not in self.allowed_types:
+                self.stats['rejected_type'] += 1
+                metrics.inc('fetch_rejected_total', reason='type')
+                self.stats['bytes_saved'] += declared
+                raise FetchRejected(f"Skipping {content_type} response", response=response)
+            if declared > self.max_bytes:
+                self.stats['rejected_size'] += 1
+                metrics.inc('fetch_rejected_total', reason='size')
+                self.stats['bytes_saved'] += declared
+                raise FetchRejected(f"Skipping {declared} byte response", response=response)
+
+            chunks = []
+            received = 0
+            for chunk in response.iter_content(CHUNK_BYTES):
+                received += len(chunk)
+                if received > self.max_bytes:   # No or wrong Content-Length: stop reading at the cap
+                    self.stats['rejected_size'] += 1
+                    self.stats['wire_bytes'] += response.raw.tell()
+                    metrics.inc('fetch_rejected_total', reason='size')
+                    metrics.inc('fetch_bytes_total', response.raw.tell())
+                    raise FetchRejected(f"Response exceeds {self.max_bytes} bytes", response=response)
+                chunks.append(chunk)
+            self.stats['wire_bytes'] += response.raw.tell()
+            metrics.inc('fetch_bytes_total', response.raw.tell())
+            self.stats['content_bytes'] += received
+            self.stats['pages'] += 1
+            response._content = b"".join(chunks)    # Lets .content / .text work on the streamed body
+            return response
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,143 @@
+import argparse
+import sqlite3
+import time
+from itertools import groupby
+from typing import Dict, List
+
+from database import Database
+from search import parse_query, gather_candidates, gather_fts_candidates, search_engine
+
+# Stands for the stopwords skipped between two indexed words, so a phrase only matches adjacent words.
+# Query words come from [\w']+ and never contain it.
+FTS_FILLER = "~"
+
+
+def fts_available() -> bool:
+    """True if this SQLite build has the FTS5 extension."""
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+def token_stream(words: List[str], positions: List[int]) -> str:
+    """The stemmed words of a field in position order, one filler wherever stopwords were left out."""
+    tokens = []
+    previous = None
+    for word, pos in sorted(zip(words, positions), key=lambda x: x[1]):
+        if previous is not None and pos > previous + 1:
+            tokens.append(FTS_FILLER)
+        tokens.append(word)
+        previous = pos
+    return " ".join(tokens)
+
+
+def build_fts_index(index: Database) -> int:
+    """
+    (Re)build pages_fts from the postings: title and body token streams rebuilt from the stored positions.
+    Crawls keep it up to date afterwards (Crawler._index_page). Returns the number of pages written.
+    """
+    index.create_fts_table()
+    index.cursor.execute("DELETE FROM pages_fts")
+    streams = {}    # page_id -> {field: stream}
+    for field in ("title", "body"):
+        read = index.conn.cursor()
+        read.execute(f'''
+            SELECT i.page_id, w.word, i.positions FROM inverted_index_{field} i
+            JOIN words w ON w.word_id = i.word_id
+            ORDER BY i.page_id
+        ''')
+        for page_id, rows in groupby(read, key=lambda row: row[0]):
+            words, positions = [], []
+            for _, word, pos in rows:
+                for p in (pos.split(',') if pos else []):
+                    words.append(word)
+                    positions.append(int(p))
+            streams.setdefault(page_id, {})[field] = token_stream(words, positions)
+        read.close()
+    index.cursor.executemany(
+        "INSERT INTO pages_fts (rowid, title, body) VALUES (?, ?, ?)",
+        [(page_id, s.get('title', ''), s.get('body', '')) for page_id, s in streams.items()])
+    index.conn.commit()
+    index.set_meta('fts_generation', index.get_generation())
+    return len(streams)
+
+
+def table_sizes(index: Database) -> Dict[str, int]:
+    """Bytes used by the custom inverted index and by pages_fts (needs the dbstat virtual table)."""
+    try:
+        index.cursor.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")
+    except sqlite3.OperationalError:
+        return {}
+    sizes = dict(index.cursor.fetchall())
+    inverted = [name for name in sizes if name.startswith(("inverted_index", "sqlite_autoindex_inverted_index"))]
+    return {
+        'inverted_index': sum(sizes[name] for name in inverted),
+        'fts': sum(size for name, size in sizes.items() if name.startswith("pages_fts")),
+    }
+
+
+def compare_with_inverted_index(crawler, queries: List[str], top_k: int = 50) -> List[dict]:
+    """
+    Time candidate generation and the whole search with the custom inverted index and with FTS5,
+    and check both give the same candidates and scores.
+    """
+    report = []
+    for query in queries:
+        terms, phrases = parse_query(query)
+        start = time.perf_counter()
+        custom = gather_candidates(crawler, terms, phrases) or set()
+        custom_candidates = time.perf_counter() - start
+        start = time.perf_counter()
+        fts = gather_fts_candidates(crawler, terms, phrases) or set()
+        fts_candidates = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = search_engine(crawler, query, top_k=top_k)
+        custom_search = time.perf_counter() - start
+        start = time.perf_counter()
+        results = search_engine(crawler, query, top_k=top_k, fts=True)
+        fts_search = time.perf_counter() - start
+
+        expected_scores = dict(expected)
+        report.append({
+            'query': query,
+            'candidates': len(custom),
+            'custom_candidates_ms': custom_candidates * 1000,
+            'fts_candidates_ms': fts_candidates * 1000,
+            'custom_search_ms': custom_search * 1000,
+            'fts_search_ms': fts_search * 1000,
+            'same_results': custom == fts and len(results) == len(expected) and all(
+                url in expected_scores and abs(expected_scores[url] - score) < 1e-9 for url, score in results),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the FTS5 candidate index and compare it with the inverted index.")
+    parser.add_argument("--db", help="update this database in place instead of publishing a new snapshot")
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("queries", nargs="*")
+    args = parser.parse_args()
+
+    if not fts_available():
+        raise SystemExit("This SQLite build has no FTS5.")
+    from crawler import Crawler
+    from snapshots import snapshot_update
+    with snapshot_update(args.db) as db_name:
+        crawler = Crawler(None, db_name=db_name)
+        start = time.perf_counter()
+        pages = build_fts_index(crawler.index)
+        print(f"Indexed {pages} pages into pages_fts in {time.perf_counter() - start:.2f}s")
+        for name, size in table_sizes(crawler.index).items():
+            print(f"{name}: {size / 1024:.0f} KiB")
+        for row in compare_with_inverted_index(crawler, args.queries, args.top_k):
+            print(f"{row['query']}: {row['candidates']} candidates, "
+                  f"custom {row['custom_candidates_ms']:.1f} ms / {row['custom_search_ms']:.1f} ms, "
+                  f"fts {row['fts_candidates_ms']:.1f} ms / {row['fts_search_ms']:.1f} ms "
+                  f"(candidates / search), same results: {row['same_results']}")
+        crawler.close()
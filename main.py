@@ -1,7 +1,21 @@
 from crawler import Crawler
-crawler = Crawler(start_url= "https://www.cse.ust.hk/~kwtleung/COMP4321/testpage.htm", max_pages= 300)
+from champions import build_champion_lists
+from compact import compact
+from fts import fts_available
+from snapshots import create_snapshot, publish_snapshot
+import metrics
+metrics.enable()    # Crawl counters, saved to crawl_metrics.prom at the end
+# Crawl into a copy of the served index; app.py switches to it once it is published
+snapshot = create_snapshot()
+crawler = Crawler(start_url= "https://www.cse.ust.hk/~kwtleung/COMP4321/testpage.htm", max_pages= 300, db_name=snapshot)
 crawler.crawl()
+if fts_available():
+    crawler.index.create_fts_table()     # Filled by compact(), kept up to date by later crawls
+compact(crawler.index)
+build_champion_lists(crawler.index)
 crawler.generate_spider_result()
+publish_snapshot(snapshot)
+metrics.write_textfile("crawl_metrics.prom")
 # print("total frequency for cse in all page bodies:", crawler.get_word_frequency_body("hkust"))
 # print("total frequency for cse in all page titles:", crawler.get_word_frequency_title("hkust"))
 from database import Database
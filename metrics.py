@@ -0,0 +1,246 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+# Instrumentation is off unless enable() is called (app.py: METRICS=1 in .env; main.py always)
+enabled = False
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_QUERY_SECONDS = 0.5
+
+HELP = {
+    'search_requests_total': ('counter', 'Searches served'),
+    'search_seconds': ('histogram', 'Time to answer a search, including result hydration'),
+    'search_stage_seconds': ('histogram', 'Time spent in each search stage'),
+    'slow_queries_total': ('counter', 'Searches slower than the slow query threshold'),
+    'sql_statements_total': ('counter', 'SQL statements executed'),
+    'sql_rows_read_total': ('counter', 'Rows fetched from SQL statements'),
+    'fetch_seconds': ('histogram', 'Time to fetch a page, body included'),
+    'fetch_bytes_total': ('counter', 'Bytes received while fetching pages'),
+    'fetch_errors_total': ('counter', 'Fetches that failed'),
+    'fetch_rejected_total': ('counter', 'Responses dropped because of their type or size'),
+    'pages_indexed_total': ('counter', 'Pages parsed and written to the index'),
+    'index_seconds': ('histogram', 'Time to index one page'),
+    'postings_cache_hits_total': ('counter', 'Postings cache hits'),
+    'postings_cache_misses_total': ('counter', 'Postings cache misses'),
+    'postings_cache_resident_bytes': ('gauge', 'Bytes held by the postings cache'),
+}
+
+slow_log = logging.getLogger("slow_queries")
+
+_lock = threading.Lock()
+_counters = {}      # (name, labels) -> value
+_histograms = {}    # (name, labels) -> [count per bucket..., count, sum]
+_local = threading.local()
+
+
+def enable(on: bool = True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def inc(name: str, value: float = 1, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(SECONDS_BUCKETS) + 2)
+        bucket = bisect_left(SECONDS_BUCKETS, seconds)
+        if bucket < len(SECONDS_BUCKETS):
+            h[bucket] += 1
+        h[-2] += 1
+        h[-1] += seconds
+
+
+class RequestStats:
+    """What one request (or one search) did: time per stage, SQL statements and rows read."""
+
+    def __init__(self):
+        self.stages = {}
+        self.statements = 0
+        self.rows = 0
+        self.start = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+
+def current() -> Optional[RequestStats]:
+    return getattr(_local, 'request', None)
+
+
+def start_request() -> Optional[RequestStats]:
+    """Start collecting per-request numbers on this thread (None when instrumentation is off)."""
+    _local.request = RequestStats() if enabled else None
+    return _local.request
+
+
+def finish_request(query: str = None) -> Optional[RequestStats]:
+    """Stop collecting; a search slower than SLOW_QUERY_SECONDS goes to the slow query log."""
+    request = current()
+    _local.request = None
+    if request is None:
+        return None
+    seconds = request.elapsed()
+    if query is not None:
+        inc('search_requests_total')
+        observe('search_seconds', seconds)
+        if seconds >= SLOW_QUERY_SECONDS:
+            inc('slow_queries_total')
+            stages = ", ".join(f"{stage}={t * 1000:.1f}ms" for stage, t in request.stages.items())
+            slow_log.warning("slow query %r: %.1f ms (%s; %d SQL statements, %d rows)",
+                             query, seconds * 1000, stages, request.statements, request.rows)
+    return request
+
+
+_disabled_stage = nullcontext()
+
+
+def stage(name: str):
+    """Time a block as a search stage; a shared no-op when instrumentation is off."""
+    if not enabled:
+        return _disabled_stage
+    return _timed_stage(name)
+
+
+@contextmanager
+def _timed_stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe('search_stage_seconds', seconds, stage=name)
+        request = current()
+        if request is not None:
+            request.stages[name] = request.stages.get(name, 0.0) + seconds
+
+
+def _count_sql(statements: int = 0, rows: int = 0):
+    request = current()
+    if request is not None:
+        request.statements += statements
+        request.rows += rows
+    if statements:
+        inc('sql_statements_total', statements)
+    if rows:
+        inc('sql_rows_read_total', rows)
+
+
+class CountingCursor(sqlite3.Cursor):
+    """Cursor counting statements and fetched rows (used by Database when instrumentation is on)."""
+
+    def execute(self, *args):
+        _count_sql(statements=1)
+        return super().execute(*args)
+
+    def executemany(self, *args):
+        _count_sql(statements=1)
+        return super().executemany(*args)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            _count_sql(rows=1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = super().fetchmany(*args)
+        _count_sql(rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        _count_sql(rows=len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        _count_sql(rows=1)
+        return row
+
+
+class CountingConnection(sqlite3.Connection):
+    """Connection whose cursors, including those of conn.execute, are CountingCursors."""
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+
+def _labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def render(postings_caches: Dict[str, dict] = None) -> str:
+    """All metrics in the Prometheus text format; postings_caches maps a database name to its cache stats()."""
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(h) for key, h in _histograms.items()}
+    gauges = {}
+    for db_name, stats in (postings_caches or {}).items():
+        labels = (('db', os.path.basename(db_name)),)
+        counters[('postings_cache_hits_total', labels)] = stats['hits']
+        counters[('postings_cache_misses_total', labels)] = stats['misses']
+        gauges[('postings_cache_resident_bytes', labels)] = stats['resident_bytes']
+
+    described = set()
+
+    def describe(name):
+        if name not in described:
+            described.add(name)
+            kind, text = HELP.get(name, ('untyped', name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted({**counters, **gauges}.items()):
+        describe(name)
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), h in sorted(histograms.items()):
+        describe(name)
+        cumulative = 0
+        for bound, count in zip(SECONDS_BUCKETS, h):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {h[-2]}")
+        lines.append(f"{name}_count{_labels(labels)} {h[-2]}")
+        lines.append(f"{name}_sum{_labels(labels)} {h[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str):
+    """Save the metrics of a process that does not serve HTTP (a crawl), e.g. for a textfile collector."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render())
+    os.replace(tmp, path)
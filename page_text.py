@@ -0,0 +1,124 @@
+import re
+from bisect import bisect_left
+import struct
+import zlib
+from typing import List, Optional, Tuple
+
+WORD = re.compile(r"\b[\w']+\b")   # The tokens Crawler._tokenize numbers; positions index this sequence
+BLOCK_WORDS = 256       # Words per compressed block: a snippet window decompresses at most two
+SNIPPET_WORDS = 30      # Words shown in a snippet
+MAX_POSITIONS = 1000    # Query term positions looked at per page, so the window search stays bounded
+
+
+def compress_text(text: str) -> bytes:
+    """
+    Page text as independently zlib-compressed blocks of BLOCK_WORDS words (stored in pages.body).
+    Layout: block count, word count, the end offset of every block, then the blocks. Block i holds the text
+    from word i * BLOCK_WORDS up to the next block's first word.
+    """
+    starts = [m.start() for m in WORD.finditer(text)]
+    block_starts = starts[::BLOCK_WORDS]
+    blocks = [zlib.compress(text[start:end].encode("utf-8"))
+              for start, end in zip(block_starts, block_starts[1:] + [len(text)])]
+    ends = []
+    offset = 0
+    for block in blocks:
+        offset += len(block)
+        ends.append(offset)
+    return struct.pack(f"<II{len(blocks)}I", len(blocks), len(starts), *ends) + b"".join(blocks)
+
+
+def word_count(blob: bytes) -> int:
+    return struct.unpack_from("<II", blob)[1]
+
+
+def read_words(blob: bytes, first: int, last: int) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    Text of words first..last (positions), decompressing only the blocks holding them.
+    Returns (text, [(start, end) of every word in text]).
+    """
+    n_blocks, n_words = struct.unpack_from("<II", blob)
+    ends = struct.unpack_from(f"<{n_blocks}I", blob, 8)
+    data_start = 8 + 4 * n_blocks
+    first_block, last_block = first // BLOCK_WORDS, min(last // BLOCK_WORDS, n_blocks - 1)
+    chunk = "".join(
+        zlib.decompress(blob[data_start + (ends[b - 1] if b else 0):data_start + ends[b]]).decode("utf-8")
+        for b in range(first_block, last_block + 1))
+    spans = [m.span() for m in WORD.finditer(chunk)]
+    skip = first - first_block * BLOCK_WORDS
+    spans = spans[skip:skip + last - first + 1]
+    if not spans:
+        return "", []
+    start, end = spans[0][0], spans[-1][1]
+    return chunk[start:end], [(s - start, e - start) for s, e in spans]
+
+
+def best_window(term_positions: List[List[int]], width: int = SNIPPET_WORDS) -> Optional[int]:
+    """
+    First position of the width-word window holding the most distinct query terms, then the most
+    occurrences (None if no term occurs).
+    """
+    events = sorted((pos, i) for i, positions in enumerate(term_positions) for pos in positions[:MAX_POSITIONS])
+    if not events:
+        return None
+    best, best_score = None, None
+    counts = {}
+    left = 0
+    for pos, i in events:
+        counts[i] = counts.get(i, 0) + 1
+        while events[left][0] <= pos - width:
+            left_i = events[left][1]
+            counts[left_i] -= 1
+            if counts[left_i] == 0:
+                del counts[left_i]
+            left += 1
+        score = (len(counts), sum(counts.values()))
+        if best_score is None or score > best_score:
+            best, best_score = events[left][0], score
+    return best
+
+
+def make_snippet(blob: bytes, term_positions: List[List[int]], width: int = SNIPPET_WORDS) -> Optional[dict]:
+    """
+    Snippet around the best window of query term positions, or the first words of the page if none occurs.
+    Returns {'text', 'highlights': [(start, end) of every query term occurrence in text]} (None without text).
+    """
+    if not blob:
+        return None
+    total = word_count(blob)
+    if total == 0:
+        return None
+    first = best_window(term_positions, width)
+    matches = {pos for positions in term_positions for pos in positions}
+    if first is None:
+        first = 0
+    else:
+        # Center the occurrences in the window
+        last_match = max(pos for pos in matches if first <= pos < first + width)
+        first = max(0, min(first - (width - (last_match - first + 1)) // 2, total - width))
+    last = min(first + width, total) - 1
+    text, spans = read_words(blob, first, last)
+    highlights = [span for pos, span in enumerate(spans, first) if pos in matches]
+    prefix = "... " if first > 0 else ""
+    suffix = " ..." if last < total - 1 else ""
+    return {
+        'text': prefix + text + suffix,
+        'highlights': [(s + len(prefix), e + len(prefix)) for s, e in highlights],
+    }
+
+
+def page_snippet(index, url: str, terms: List[str], width: int = SNIPPET_WORDS) -> Optional[dict]:
+    """
+    Snippet of a page for stemmed query terms: the positions come from the (usually cached) body postings,
+    and only the blocks of the chosen window are decompressed, so the cost per result stays small and fixed.
+    """
+    page_id, blob = index.get_page_text(url)
+    if not blob:
+        return None
+    term_positions = []
+    for term in dict.fromkeys(terms):
+        postings = index.get_postings('body', term)
+        i = bisect_left(postings.page_ids, page_id)
+        if i < len(postings) and postings.page_ids[i] == page_id:
+            term_positions.append(list(postings.positions[i]))
+    return make_snippet(blob, term_positions, width)
@@ -0,0 +1,125 @@
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+POSTINGS_CACHE_BYTES = 32 * 1024 * 1024   # Default memory budget of one cache
+
+
+class Postings:
+    """Decoded postings list of one word in one field (body or title), sorted by page_id."""
+
+    __slots__ = ('page_ids', 'frequencies', 'positions', 'nbytes')
+
+    def __init__(self, rows):
+        """rows: (page_id, frequency, positions string) sorted by page_id."""
+        self.page_ids = array('i')
+        self.frequencies = array('i')
+        self.positions = []
+        for page_id, frequency, positions in rows:
+            self.page_ids.append(page_id)
+            self.frequencies.append(frequency)
+            self.positions.append(array('i', (int(p) for p in positions.split(','))) if positions else array('i'))
+        self.nbytes = (
+            sys.getsizeof(self) + sys.getsizeof(self.page_ids) + sys.getsizeof(self.frequencies)
+            + sys.getsizeof(self.positions) + sum(sys.getsizeof(p) for p in self.positions)
+        )
+
+    def __len__(self):
+        return len(self.page_ids)
+
+    def positions_by_page(self) -> Dict[int, List[int]]:
+        return {page_id: list(positions) for page_id, positions in zip(self.page_ids, self.positions) if positions}
+
+
+class PostingsCache:
+    """
+    LRU cache of decoded postings keyed by (field, word_id), evicting least recently used lists
+    once the estimated resident bytes exceed max_bytes. Everything is dropped when the index
+    generation stored in the database changes.
+    """
+
+    def __init__(self, max_bytes: int = POSTINGS_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.resident_bytes = 0
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()    # Flask serves requests from several threads
+
+    def check_generation(self, generation: int):
+        """Invalidate the cache if the index has been rebuilt since it was filled."""
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.resident_bytes = 0
+                self.generation = generation
+
+    def get(self, key) -> Optional[Postings]:
+        with self.lock:
+            postings = self.entries.get(key)
+            if postings is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return postings
+
+    def put(self, key, postings: Postings):
+        with self.lock:
+            if postings.nbytes > self.max_bytes:
+                return  # Larger than the whole budget, not worth evicting everything for
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.resident_bytes -= old.nbytes
+            self.entries[key] = postings
+            self.resident_bytes += postings.nbytes
+            while self.resident_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.resident_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'resident_bytes': self.resident_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def shared_cache(db_name: str) -> PostingsCache:
+    """Return the process-wide cache for a database file, so short-lived Database objects share it."""
+    key = os.path.abspath(db_name)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = PostingsCache()
+        return _caches[key]
+
+
+def all_cache_stats() -> Dict[str, dict]:
+    """Return {database file: stats()} for every shared cache of this process."""
+    with _caches_lock:
+        return {db_name: cache.stats() for db_name, cache in _caches.items()}
+
+
+def drop_shared_cache(db_name: str):
+    """Forget the cache of a database file that is no longer served (Database objects still using it keep it)."""
+    with _caches_lock:
+        _caches.pop(os.path.abspath(db_name), None)
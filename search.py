@@ -1,7 +1,11 @@
 import math
 from nltk.stem import PorterStemmer
 import re
+import heapq
 from collections import Counter, defaultdict
+from boolean_query import is_boolean_query, parse_boolean_query, positive_terms, BooleanEvaluator
+from spelling import suggest_query
+import metrics
 
 def parse_query(query):
     """
@@ -49,25 +53,31 @@ def get_docs_for_phrase(crawler, phrase):
                 break
     return result
 
-def search_engine(crawler, query, top_k=50):
-    terms, phrases = parse_query(query)
-    N = crawler.index.get_total_doc_count()
-    if N == 0:
-        print("No documents in DB. Did you crawl yet?")
-        return []
+TITLE_WEIGHT = 2.0  # Weight multiplier for title matches
+PROXIMITY_WEIGHT = 0.5  # Max relative boost for pages where all query terms are adjacent
 
-    # 1. Get candidate docs for each term/phrase
+def document_frequency(crawler, term):
+    """Return df of a stemmed term, counting body and title postings."""
+    return crawler.calculate_body_df(term) + crawler.calculate_title_df(term)
+
+def gather_candidates(crawler, terms, phrases):
+    """Return the union of the docs matching any term or phrase (None if the query is empty)."""
     doc_sets = []
     for t in terms:
         doc_sets.append(get_docs_for_term(crawler, t))
     for phrase in phrases:
         doc_sets.append(get_docs_for_phrase(crawler, phrase))
     if not doc_sets:
-        print("No query terms found.")
-        return []
-    candidate_docs = set.union(*doc_sets) if doc_sets else set()
+        return None
+    return set.union(*doc_sets)
 
-    # 2. Build query vector (weight per term)
+def build_query_vector(crawler, terms, phrases, N, df_fn=None):
+    """
+    Build the query vector (weight per term).
+    df_fn: optional term -> df lookup, defaults to the crawler's own statistics.
+    """
+    if df_fn is None:
+        df_fn = lambda t: document_frequency(crawler, t)
     query_counts = Counter(terms)
     for phrase in phrases:
         query_counts[' '.join(phrase)] += 1
@@ -77,51 +87,219 @@ def search_engine(crawler, query, top_k=50):
         if ' ' in term:
             # phrase: get df using min df of words in phrase
             phrase_words = term.split()
-            dfs = [crawler.calculate_body_df(w) + crawler.calculate_title_df(w) for w in phrase_words]
+            dfs = [df_fn(w) for w in phrase_words]
             df = min(dfs) if dfs else 1
             if df == 0: df = 1
         else:
-            df = crawler.calculate_body_df(term) + crawler.calculate_title_df(term)
+            df = df_fn(term)
             if df == 0: df = 1
         idf = math.log(N / df)
         tf = query_counts[term]
         max_tf = tf
         query_vector[term] = (tf / max_tf) * idf  # always idf for query
+    return query_vector
 
-    # 3. For each doc, build document vector (weight per term in the document)
-    doc_vectors = {}
-    TITLE_WEIGHT = 2.0  # Weight multiplier for title matches
-    for doc in candidate_docs:
-        vec = {}
-        # Efficiently get max_tf using DB-backed methods
-        body_maxtf = crawler.calculate_body_maxtf(doc)
-        title_maxtf = crawler.calculate_title_maxtf(doc)
-        max_tf = max(body_maxtf, TITLE_WEIGHT * title_maxtf, 1)  # Ensure at least 1
-
-        # Retrieve all terms in the document
-        all_terms = crawler.get_all_terms_in_doc(doc)  # Assume this method retrieves all terms in the document
-
-        for term in all_terms:  # Use all terms in the document, not just query terms
-            tf_body = crawler.calculate_body_tf(doc, term)
-            tf_title = crawler.calculate_title_tf(doc, term)
-            tf = tf_body + TITLE_WEIGHT * tf_title  # Apply title weight multiplier
-            df = crawler.calculate_body_df(term) + crawler.calculate_title_df(term)
-            if df == 0: df = 1
-            idf = math.log(N / df)
-            vec[term] = (tf * idf) / max_tf if max_tf > 0 else 0.0
-        doc_vectors[doc] = vec
+def build_doc_vector(crawler, doc, N, df_fn=None, terms=None):
+    """
+    Build the document vector (weight per term in the document).
+    terms: only weigh these terms (enough for a dot product with a query vector).
+    """
+    if df_fn is None:
+        df_fn = lambda t: document_frequency(crawler, t)
+    vec = {}
+    # Efficiently get max_tf using DB-backed methods
+    body_maxtf = crawler.calculate_body_maxtf(doc)
+    title_maxtf = crawler.calculate_title_maxtf(doc)
+    max_tf = max(body_maxtf, TITLE_WEIGHT * title_maxtf, 1)  # Ensure at least 1
+
+    # Retrieve all terms in the document
+    all_terms = crawler.get_all_terms_in_doc(doc) if terms is None else [t for t in terms if ' ' not in t]
 
-    # 4. Cosine similarity
+    for term in all_terms:  # Use all terms in the document, not just query terms
+        tf_body = crawler.calculate_body_tf(doc, term)
+        tf_title = crawler.calculate_title_tf(doc, term)
+        tf = tf_body + TITLE_WEIGHT * tf_title  # Apply title weight multiplier
+        if tf == 0:
+            continue
+        df = df_fn(term)
+        if df == 0: df = 1
+        idf = math.log(N / df)
+        vec[term] = (tf * idf) / max_tf if max_tf > 0 else 0.0
+    return vec
+
+def rank_candidates(crawler, candidate_docs, query_vector, N, df_fn=None):
+    """Score candidate docs by cosine similarity, best first."""
     results = []
-    for doc, vec in doc_vectors.items():
+    query_norm = math.sqrt(sum(v**2 for v in query_vector.values()))
+    # Norms stored by compact.py spare building the whole vector of every candidate
+    norms = {}
+    if df_fn is None and crawler.index.has_fresh_page_norms():
+        norms = crawler.index.get_page_norms(list(candidate_docs))
+    for doc in candidate_docs:
+        if doc in norms:
+            vec = build_doc_vector(crawler, doc, N, df_fn, terms=query_vector)
+            doc_norm = norms[doc]
+        else:
+            vec = build_doc_vector(crawler, doc, N, df_fn)
+            doc_norm = math.sqrt(sum(v**2 for v in vec.values()))
         dot = sum(vec.get(t, 0) * query_vector.get(t, 0) for t in query_vector)  # Use .get to handle missing terms
-        doc_norm = math.sqrt(sum(v**2 for v in vec.values()))
-        query_norm = math.sqrt(sum(v**2 for v in query_vector.values()))
         score = dot / (doc_norm * query_norm) if doc_norm and query_norm else 0.0
         results.append((doc, score))
-
-    # 5. Top 50
     results.sort(key=lambda x: x[1], reverse=True)
+    return results
+
+def min_cover_window(position_lists):
+    """
+    Length of the smallest span of positions containing at least one position from every list
+    (None if a list is empty). All lists are merged in one sorted sweep with a sliding window,
+    so the cost is linear in the total number of positions.
+    """
+    k = len(position_lists)
+    if k == 0 or any(not positions for positions in position_lists):
+        return None
+    events = list(heapq.merge(*[[(pos, i) for pos in positions] for i, positions in enumerate(position_lists)]))
+    counts = [0] * k
+    covered = 0
+    left = 0
+    best = None
+    for pos, i in events:
+        if counts[i] == 0:
+            covered += 1
+        counts[i] += 1
+        while covered == k:     # Shrink from the left while every list is still covered
+            left_pos, left_i = events[left]
+            width = pos - left_pos + 1
+            if best is None or width < best:
+                best = width
+            counts[left_i] -= 1
+            if counts[left_i] == 0:
+                covered -= 1
+            left += 1
+    return best
+
+def apply_proximity_boost(crawler, results, terms, phrases):
+    """
+    Multiply each score by 1 + PROXIMITY_WEIGHT * (terms / window), where window is the smallest body
+    span covering all distinct query words. Pages missing a word, and single-word queries, are unchanged.
+    """
+    words = list(dict.fromkeys(terms + [w for phrase in phrases for w in phrase]))
+    if len(words) < 2 or not results:
+        return results
+    positions = [crawler.index.get_body_positions_by_url(w) for w in words]  # One query per word
+    boosted = []
+    for doc, score in results:
+        window = min_cover_window([p.get(doc, []) for p in positions])
+        if window:
+            score *= 1 + PROXIMITY_WEIGHT * min(1.0, len(words) / window)
+        boosted.append((doc, score))
+    boosted.sort(key=lambda x: x[1], reverse=True)
+    return boosted
+
+def gather_boolean_candidates(crawler, query):
+    """
+    Evaluate an AND/OR/NOT query over sorted page_id postings.
+    Returns (terms, phrases, candidate URLs), where terms/phrases are the non-negated ones used for scoring.
+    """
+    tree = parse_boolean_query(query, crawler.stopwords)
+    terms, phrases = positive_terms(tree)
+    if tree is None or (not terms and not phrases):
+        return terms, phrases, None
+    page_ids = BooleanEvaluator(crawler.index).evaluate(tree).page_ids
+    return terms, phrases, set(crawler.index.get_urls_for_page_ids(page_ids))
+
+def gather_champion_candidates(crawler, terms, phrases):
+    """
+    Union of the champion lists of the terms (phrases still use their full matches).
+    Returns (candidate URLs or None if the query is empty, whether any champion list was truncated).
+    """
+    if not terms and not phrases:
+        return None, False
+    candidate_docs = set()
+    truncated = False
+    for t in set(terms):
+        urls, term_truncated = crawler.index.get_champion_list(t)
+        candidate_docs.update(urls)
+        truncated = truncated or term_truncated
+    for phrase in phrases:
+        candidate_docs |= get_docs_for_phrase(crawler, phrase)
+    return candidate_docs, truncated
+
+def fts_match_expression(terms, phrases):
+    """FTS5 query matching what gather_candidates matches: any term in title or body, phrases in the body."""
+    quote = lambda s: '"' + s.replace('"', '""') + '"'
+    clauses = [quote(t) for t in dict.fromkeys(terms)]
+    clauses += ["body:" + quote(" ".join(phrase)) for phrase in phrases]
+    return " OR ".join(clauses)
+
+def gather_fts_candidates(crawler, terms, phrases):
+    """Same candidates as gather_candidates, from the FTS5 mirror of the token streams (built by fts.py)."""
+    if not terms and not phrases:
+        return None
+    return set(crawler.index.get_fts_matches(fts_match_expression(terms, phrases)))
+
+def query_words(crawler, query):
+    """Stemmed words a result should show: the terms and phrase words (positive ones for boolean queries)."""
+    if is_boolean_query(query):
+        terms, phrases = positive_terms(parse_boolean_query(query, crawler.stopwords))
+    else:
+        terms, phrases = parse_query(query)
+    return list(dict.fromkeys(terms + [w for phrase in phrases for w in phrase]))
+
+def search_engine(crawler, query, top_k=50, spelling=None, proximity=False, champions=False, fts=False):
+    """
+    Rank pages for the query, best first, as a list of (url, score).
+    spelling: optional SpellingIndex; when given, unknown query words are replaced by their best correction.
+    proximity: boost pages where the query words appear close together in the body.
+    champions: score only the champion lists of the terms first, and fall back to the full postings
+        when they give fewer than top_k results (needs up-to-date lists from champions.py).
+    fts: gather candidates and match phrases with the FTS5 index (needs an up-to-date one from fts.py).
+    """
+    N = crawler.index.get_total_doc_count()
+    if N == 0:
+        print("No documents in DB. Did you crawl yet?")
+        return []
+
+    with metrics.stage('parse'):
+        if spelling is not None:
+            query = suggest_query(query, spelling, crawler.stopwords) or query
+        boolean = is_boolean_query(query)
+        if not boolean:
+            terms, phrases = parse_query(query)
+
+    # 1. Get candidate docs for each term/phrase
+    use_champions = champions and not boolean and crawler.index.has_fresh_champion_lists()
+    use_fts = fts and not boolean and not use_champions and crawler.index.has_fresh_fts_index()
+    truncated = False
+    with metrics.stage('candidates'):
+        if boolean:
+            terms, phrases, candidate_docs = gather_boolean_candidates(crawler, query)
+        elif use_champions:
+            candidate_docs, truncated = gather_champion_candidates(crawler, terms, phrases)
+        elif use_fts:
+            candidate_docs = gather_fts_candidates(crawler, terms, phrases)
+        else:
+            candidate_docs = gather_candidates(crawler, terms, phrases)
+    if candidate_docs is None:
+        print("No query terms found.")
+        return []
+
+    # 2. Build query vector (weight per term)
+    with metrics.stage('query_vector'):
+        query_vector = build_query_vector(crawler, terms, phrases, N)
+
+    # 3. Build document vectors and score them by cosine similarity
+    with metrics.stage('rank'):
+        results = rank_candidates(crawler, candidate_docs, query_vector, N)
+        if truncated and len(results) < top_k:
+            # The champion tier is too small: score the remaining pages of the full postings too
+            rest = gather_candidates(crawler, terms, phrases) - candidate_docs
+            results += rank_candidates(crawler, rest, query_vector, N)
+            results.sort(key=lambda x: x[1], reverse=True)
+    if proximity:
+        with metrics.stage('proximity'):
+            results = apply_proximity_boost(crawler, results, terms, phrases)
+
+    # 4. Top 50
     return results[:top_k]
 
 def print_results(crawler, results):
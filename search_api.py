@@ -0,0 +1,133 @@
+import base64
+import binascii
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, List, Optional, Set, Tuple
+
+from page_text import page_snippet
+
+RESULT_FIELDS = ('title', 'last_modified', 'size', 'snippet', 'keywords', 'parent_links', 'child_links')
+LIST_TTL_SECONDS = 600      # How long a ranked list (and the cursors into it) stays valid
+MAX_LISTS = 256             # Ranked lists kept at most; the least recently used go first
+
+
+class CursorError(ValueError):
+    """A cursor is malformed or its ranked list has expired."""
+
+
+def encode_cursor(list_id: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{list_id}:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        list_id, offset = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        offset = int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise CursorError("Invalid cursor")
+    if offset < 0:
+        raise CursorError("Invalid cursor")
+    return list_id, offset
+
+
+def parse_fields(fields: Optional[str]) -> Set[str]:
+    """Result fields asked for in a comma-separated list (all of them if None); url, rank and score are always sent."""
+    if fields is None:
+        return set(RESULT_FIELDS)
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(RESULT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
+
+
+class RankedListStore:
+    """
+    Ranked results kept server-side for a while, so the later pages of a query (and the cursors of the
+    JSON API) slice a stored list instead of running the query again.
+    """
+
+    def __init__(self, ttl: float = LIST_TTL_SECONDS, max_lists: int = MAX_LISTS):
+        self.ttl = ttl
+        self.max_lists = max_lists
+        self._lists = OrderedDict()     # list_id -> (key, query, results, expires)
+        self._by_key = {}               # key -> list_id
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        # Lists are in least recently used order, not expiry order: this drops the oldest ones
+        # beyond max_lists and expired ones at the front; _live() checks the list being looked up
+        while self._lists:
+            list_id, (key, query, results, expires) = next(iter(self._lists.items()))
+            if expires > now and len(self._lists) <= self.max_lists:
+                break
+            self._drop(list_id)
+
+    def _drop(self, list_id: str):
+        key = self._lists.pop(list_id)[0]
+        del self._by_key[key]
+
+    def _live(self, list_id: Optional[str], now: float) -> bool:
+        """True if list_id is stored and not expired; an expired list is dropped."""
+        if list_id not in self._lists:
+            return False
+        if self._lists[list_id][3] <= now:
+            self._drop(list_id)
+            return False
+        return True
+
+    def rank(self, key, query: str, ranker: Callable[[], List[Tuple[str, float]]]) -> Tuple[str, list]:
+        """
+        Return (list id, results) for key, calling ranker() only if no live list exists for it.
+        key must identify everything the ranking depends on (snapshot, query, options).
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            list_id = self._by_key.get(key)
+            if self._live(list_id, now):
+                self._lists.move_to_end(list_id)
+                return list_id, self._lists[list_id][2]
+        results = ranker()      # Not under the lock: other queries are ranked meanwhile
+        with self._lock:
+            list_id = uuid.uuid4().hex
+            old_id = self._by_key.get(key)
+            if old_id is not None:
+                self._drop(old_id)
+            self._lists[list_id] = (key, query, results, now + self.ttl)
+            self._by_key[key] = list_id
+            self._expire(now)
+        return list_id, results
+
+    def get(self, list_id: str) -> Tuple[str, list]:
+        """Return (query, results) of a stored list; raises CursorError once it expired."""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if not self._live(list_id, now):
+                raise CursorError("Cursor expired, run the query again")
+            self._lists.move_to_end(list_id)
+            key, query, results, expires = self._lists[list_id]
+            return query, results
+
+
+def hydrate(crawler, rank: int, url: str, score: float, fields: Set[str], words: List[str] = ()) -> dict:
+    """A JSON result with the requested fields; skipped fields cost no query. words: stemmed query words."""
+    result = {'rank': rank, 'url': url, 'score': score}
+    if fields & {'title', 'last_modified', 'size'}:
+        crawler.index.cursor.execute("SELECT title, last_modified, size FROM pages WHERE url = ?", (url,))
+        row = crawler.index.cursor.fetchone() or (None, None, None)
+        for name, value in zip(('title', 'last_modified', 'size'), row):
+            if name in fields:
+                result[name] = value
+    if 'snippet' in fields:
+        result['snippet'] = page_snippet(crawler.index, url, words)
+    if 'keywords' in fields:
+        result['keywords'] = [{'word': word, 'frequency': total} for word, total in crawler._top_keywords(url)]
+    if 'parent_links' in fields:
+        result['parent_links'] = crawler._get_parent_links(url)
+    if 'child_links' in fields:
+        result['child_links'] = crawler._get_child_links(url)
+    return result
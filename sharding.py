@@ -0,0 +1,194 @@
+import argparse
+import heapq
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from crawler import Crawler
+from database import Database
+from search import parse_query, gather_candidates, build_query_vector, rank_candidates
+
+SHARD_DIR = "shards"
+
+
+def shard_path(shard_dir: str, shard_no: int) -> str:
+    """Return the database file used by shard number `shard_no`."""
+    return os.path.join(shard_dir, f"shard_{shard_no}.db")
+
+
+def build_shards(source_db: str = "search_engine.db", num_shards: int = 4, shard_dir: str = SHARD_DIR) -> List[str]:
+    """
+    Partition the pages of `source_db` into `num_shards` databases (page_id % num_shards).
+    Each shard gets the schema of Database, its pages and postings, its own local df / maxtf statistics,
+    and a copy of the source's df (global_df), so queries are scored with the statistics search_engine()
+    uses even where they no longer match the postings. Returns the list of shard paths.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    paths = []
+    for shard_no in range(num_shards):
+        path = shard_path(shard_dir, shard_no)
+        if os.path.exists(path):
+            os.remove(path)
+        shard = Database(path)
+        cur = shard.cursor
+        cur.execute("ATTACH DATABASE ? AS src", (source_db,))
+        part = (num_shards, shard_no)
+        cur.execute('''
+            INSERT INTO pages (title, body, page_id, url, last_modified, size)
+            SELECT title, body, page_id, url, last_modified, size FROM src.pages
+            WHERE page_id % ? = ?
+        ''', part)
+        for table in ("inverted_index_body", "inverted_index_title"):
+            cur.execute(f'''
+                INSERT INTO {table} (word_id, page_id, frequency, positions)
+                SELECT word_id, page_id, frequency, positions FROM src.{table}
+                WHERE page_id % ? = ?
+            ''', part)
+            # Local statistics, recomputed from this shard's postings only
+            cur.execute(f'''
+                INSERT INTO {table}_word2df (word_id, df)
+                SELECT word_id, COUNT(*) FROM {table} GROUP BY word_id
+            ''')
+        cur.execute('''
+            INSERT INTO forward_index_body_page2maxtf (page_id, maxtf)
+            SELECT page_id, maxtf FROM src.forward_index_body_page2maxtf WHERE page_id % ? = ?
+        ''', part)
+        cur.execute('''
+            INSERT INTO forward_index_title_page2maxtf (page_id, maxtf)
+            SELECT page_id, maxtf FROM src.forward_index_title_page2maxtf WHERE page_id % ? = ?
+        ''', part)
+        # The source's df of every word, body and title together, as document_frequency() reads it
+        cur.execute("CREATE TABLE global_df (word_id INTEGER PRIMARY KEY, df INTEGER)")
+        cur.execute('''
+            INSERT INTO global_df (word_id, df)
+            SELECT w.word_id, COALESCE(b.df, 0) + COALESCE(t.df, 0) FROM src.words w
+            LEFT JOIN src.inverted_index_body_word2df b ON b.word_id = w.word_id
+            LEFT JOIN src.inverted_index_title_word2df t ON t.word_id = w.word_id
+            WHERE COALESCE(b.df, 0) + COALESCE(t.df, 0) > 0
+        ''')
+        # Keep the global word_ids so postings stay valid without renumbering
+        cur.execute('''
+            INSERT INTO words (word_id, word)
+            SELECT word_id, word FROM src.words
+            WHERE word_id IN (SELECT word_id FROM inverted_index_body
+                              UNION SELECT word_id FROM inverted_index_title
+                              UNION SELECT word_id FROM global_df)
+        ''')
+        shard.conn.commit()
+        cur.execute("DETACH DATABASE src")
+        shard.close()
+        paths.append(path)
+    return paths
+
+
+def load_global_stats(paths: List[str]) -> Tuple[Dict[str, int], int]:
+    """Global (df, N): the source df copied into the shards, and the page counts of every shard summed."""
+    N = 0
+    for path in paths:
+        shard = Database(path, read_only=True)
+        N += shard.get_total_doc_count()
+        shard.close()
+    shard = Database(paths[0], read_only=True)
+    shard.cursor.execute("SELECT w.word, g.df FROM global_df g JOIN words w ON w.word_id = g.word_id")
+    global_df = dict(shard.cursor.fetchall())
+    shard.close()
+    return global_df, N
+
+
+# Per-process worker state, filled in by _init_worker
+_worker = {}
+
+
+def _init_worker(paths: List[str], global_df: Dict[str, int], N: int):
+    _worker['paths'] = paths
+    _worker['df'] = global_df
+    _worker['N'] = N
+    _worker['crawlers'] = {}
+
+
+def _search_shard(shard_no: int, terms: List[str], phrases: List[List[str]], query_vector: Dict[str, float], top_k: int):
+    """Score one shard with the global statistics; returns (shard_no, top-k results, seconds)."""
+    start = time.perf_counter()
+    crawlers = _worker['crawlers']
+    if shard_no not in crawlers:
+        crawlers[shard_no] = Crawler(None, db_name=_worker['paths'][shard_no], read_only=True)
+    crawler = crawlers[shard_no]
+    global_df = _worker['df']
+    df_fn = lambda t: global_df.get(t, 0)
+
+    candidate_docs = gather_candidates(crawler, terms, phrases) or set()
+    results = rank_candidates(crawler, candidate_docs, query_vector, _worker['N'], df_fn)
+    return shard_no, results[:top_k], time.perf_counter() - start
+
+
+class ShardedSearchEngine:
+    """
+    Coordinator for a set of shard databases built by build_shards().
+    Queries are fanned out to a process pool, each shard returns its local top-k scored with the
+    global df/N, and the coordinator merges them into the same ranking as search_engine().
+    """
+
+    def __init__(self, shard_dir: str = SHARD_DIR, num_shards: int = 4, workers: int = None):
+        self.paths = [shard_path(shard_dir, i) for i in range(num_shards)]
+        for path in self.paths:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"{path} not found. Run build_shards() first.")
+        self.global_df, self.N = load_global_stats(self.paths)
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers or num_shards,
+            initializer=_init_worker,
+            initargs=(self.paths, self.global_df, self.N),
+        )
+        self.last_shard_latencies = {}  # shard_no -> seconds spent by the last query
+
+    def search(self, query: str, top_k: int = 50) -> List[Tuple[str, float]]:
+        terms, phrases = parse_query(query)
+        if self.N == 0:
+            print("No documents in shards. Did you crawl yet?")
+            return []
+        if not terms and not phrases:
+            print("No query terms found.")
+            return []
+
+        query_vector = build_query_vector(None, terms, phrases, self.N, lambda t: self.global_df.get(t, 0))
+        futures = [
+            self.pool.submit(_search_shard, shard_no, terms, phrases, query_vector, top_k)
+            for shard_no in range(len(self.paths))
+        ]
+
+        shard_results = []
+        self.last_shard_latencies = {}
+        for future in futures:
+            shard_no, results, elapsed = future.result()
+            shard_results.append(results)
+            self.last_shard_latencies[shard_no] = elapsed
+
+        # Every shard list is already sorted by score, so a k-way merge is enough
+        merged = heapq.merge(*shard_results, key=lambda x: x[1], reverse=True)
+        return list(merged)[:top_k]
+
+    def close(self):
+        self.pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build shards or run a sharded query.")
+    parser.add_argument("--db", help="database to read (default: the served index)")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--dir", default=SHARD_DIR)
+    parser.add_argument("--build", action="store_true", help="(re)build the shard databases")
+    parser.add_argument("query", nargs="?")
+    args = parser.parse_args()
+
+    if args.build:
+        from snapshots import current_snapshot
+        for path in build_shards(args.db or current_snapshot(), args.shards, args.dir):
+            print(f"Built {path}")
+    if args.query:
+        engine = ShardedSearchEngine(args.dir, args.shards)
+        for rank, (url, score) in enumerate(engine.search(args.query), 1):
+            print(f"{rank}. {url} ({score:.4f})")
+        for shard_no, elapsed in sorted(engine.last_shard_latencies.items()):
+            print(f"shard {shard_no}: {elapsed * 1000:.1f} ms")
+        engine.close()
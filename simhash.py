@@ -0,0 +1,54 @@
+import hashlib
+from collections import Counter
+from typing import Iterable, List
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3    # Consecutive words per feature
+BANDS = 4           # 4 bands of 16 bits: pages within MAX_DISTANCE bits share at least one band
+MAX_DISTANCE = 3    # Max Hamming distance between fingerprints of near-duplicate pages
+BAND_BITS = FINGERPRINT_BITS // BANDS
+
+
+def _hash64(feature: str) -> int:
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def shingles(words: List[str], size: int = SHINGLE_SIZE) -> Iterable[str]:
+    """Overlapping runs of `size` words (the whole text if it is shorter)."""
+    if len(words) <= size:
+        return [' '.join(words)] if words else []
+    return (' '.join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def simhash(words: List[str]) -> int:
+    """64-bit SimHash of a token stream, with word shingles weighted by how often they occur."""
+    totals = [0] * FINGERPRINT_BITS
+    for feature, weight in Counter(shingles(words)).items():
+        h = _hash64(feature)
+        for bit in range(FINGERPRINT_BITS):
+            totals[bit] += weight if h >> bit & 1 else -weight
+    fingerprint = 0
+    for bit, total in enumerate(totals):
+        if total > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def bands(fingerprint: int) -> List[int]:
+    """Split a fingerprint into BANDS integers of BAND_BITS bits."""
+    mask = (1 << BAND_BITS) - 1
+    return [fingerprint >> (band * BAND_BITS) & mask for band in range(BANDS)]
+
+
+def to_signed(fingerprint: int) -> int:
+    """SQLite integers are signed 64-bit."""
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
@@ -0,0 +1,236 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from postings_cache import drop_shared_cache
+
+DEFAULT_DB = "search_engine.db"     # Served until a snapshot is published
+SNAPSHOT_DIR = "snapshots"
+KEEP_SNAPSHOTS = 3                  # Published snapshots kept on disk (the current one and rollback targets)
+
+
+class SnapshotError(Exception):
+    """A snapshot cannot be published or rolled back."""
+
+
+def _snapshot_dir(base_dir: str) -> str:
+    return os.path.join(base_dir, SNAPSHOT_DIR)
+
+
+def _pointer_path(base_dir: str) -> str:
+    return os.path.join(_snapshot_dir(base_dir), "CURRENT")
+
+
+def _history_path(base_dir: str) -> str:
+    return os.path.join(_snapshot_dir(base_dir), "HISTORY")
+
+
+def _write_atomic(path: str, text: str):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)   # Atomic: readers see the old file or the new one, never a partial write
+
+
+def read_history(base_dir: str = ".") -> List[str]:
+    """Names of the published snapshots, oldest first."""
+    try:
+        with open(_history_path(base_dir)) as f:
+            return [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def current_snapshot(base_dir: str = ".") -> str:
+    """Path of the index the web app should serve."""
+    try:
+        with open(_pointer_path(base_dir)) as f:
+            return os.path.join(_snapshot_dir(base_dir), f.read().strip())
+    except FileNotFoundError:
+        return os.path.join(base_dir, DEFAULT_DB)
+
+
+def create_snapshot(base_dir: str = ".") -> str:
+    """Copy the served index into a new snapshot file for a crawl to update; returns its path."""
+    os.makedirs(_snapshot_dir(base_dir), exist_ok=True)
+    name = f"index-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.db"
+    path = os.path.join(_snapshot_dir(base_dir), name)
+    source = sqlite3.connect(current_snapshot(base_dir))
+    target = sqlite3.connect(path)
+    source.backup(target)   # Consistent copy, even while the app is reading the source
+    target.close()
+    source.close()
+    return path
+
+
+def validate_snapshot(path: str) -> List[str]:
+    """Return the problems that make a snapshot unfit to serve (empty list if it is fine)."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        problems = []
+        if conn.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+            return ["integrity check failed"]
+        if conn.execute("SELECT COUNT(*) FROM pages WHERE size IS NOT NULL").fetchone()[0] == 0:
+            problems.append("no indexed pages")
+        for field in ("body", "title"):
+            # Every df must match its postings, and every page with postings needs a max tf
+            wrong_df = conn.execute(f'''
+                SELECT COUNT(*) FROM inverted_index_{field}_word2df d
+                LEFT JOIN (SELECT word_id, COUNT(*) AS n FROM inverted_index_{field} GROUP BY word_id) p
+                    ON p.word_id = d.word_id
+                WHERE d.df != COALESCE(p.n, 0)
+            ''').fetchone()[0]
+            if wrong_df:
+                problems.append(f"{wrong_df} {field} words with a wrong df")
+            missing_maxtf = conn.execute(f'''
+                SELECT COUNT(*) FROM (SELECT DISTINCT page_id FROM inverted_index_{field}) i
+                LEFT JOIN forward_index_{field}_page2maxtf m ON m.page_id = i.page_id
+                WHERE m.page_id IS NULL
+            ''').fetchone()[0]
+            if missing_maxtf:
+                problems.append(f"{missing_maxtf} pages without a {field} max tf")
+        return problems
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    finally:
+        conn.close()
+
+
+def publish_snapshot(path: str, base_dir: str = ".", keep: int = KEEP_SNAPSHOTS) -> str:
+    """
+    Validate a snapshot and make it the served index by atomically replacing the CURRENT pointer.
+    Snapshots older than the last `keep` published ones are deleted.
+    """
+    name = os.path.basename(path)
+    if os.path.abspath(os.path.join(_snapshot_dir(base_dir), name)) != os.path.abspath(path):
+        raise SnapshotError(f"{path} is not in {_snapshot_dir(base_dir)}")
+    problems = validate_snapshot(path)
+    if problems:
+        raise SnapshotError(f"{name} not published: {'; '.join(problems)}")
+
+    history = [n for n in read_history(base_dir) if n != name] + [name]
+    _write_atomic(_history_path(base_dir), "\n".join(history[-keep:]) + "\n")
+    _write_atomic(_pointer_path(base_dir), name)
+    # Readers still on a deleted file keep reading it: the file is only freed once they close it
+    for old in history[:-keep]:
+        try:
+            os.remove(os.path.join(_snapshot_dir(base_dir), old))
+        except FileNotFoundError:
+            pass
+    return path
+
+
+@contextmanager
+def snapshot_update(db: Optional[str] = None, base_dir: str = "."):
+    """
+    Update the served index as main.py does: yield a new snapshot to write into, and publish it once the block
+    finishes (the snapshot is deleted if the block fails). Connections to it must be closed inside the block.
+    db: write into that file in place instead, publishing nothing (for scratch databases that are not served).
+    """
+    if db is not None:
+        yield db
+        return
+    path = create_snapshot(base_dir)
+    try:
+        yield path
+    except BaseException:
+        os.remove(path)
+        raise
+    publish_snapshot(path, base_dir)
+
+
+def rollback_snapshot(base_dir: str = ".") -> str:
+    """Serve the previously published snapshot again (or DEFAULT_DB before the first one); returns its path."""
+    history = read_history(base_dir)
+    current = os.path.basename(current_snapshot(base_dir))
+    if current not in history:
+        raise SnapshotError("No published snapshot to roll back")
+    position = history.index(current)
+    if position == 0:
+        os.remove(_pointer_path(base_dir))
+    else:
+        _write_atomic(_pointer_path(base_dir), history[position - 1])
+    # The rolled back file stays on disk for inspection, but is not a rollback target anymore
+    _write_atomic(_history_path(base_dir), "".join(n + "\n" for n in history[:position]))
+    return current_snapshot(base_dir)
+
+
+class SnapshotReader:
+    """
+    Keeps a serving process on the published snapshot. Each request acquires the current path (one stat
+    of the pointer file) and releases it when done; requests already running when a new snapshot is
+    published keep their connections to the old file and drain, while new requests use the new one.
+    """
+
+    def __init__(self, base_dir: str = ".", on_swap: Optional[Callable[[str], None]] = None):
+        self.base_dir = base_dir
+        self.on_swap = on_swap          # Called with the new path after a swap, e.g. to reload the vocabulary
+        self.path = current_snapshot(base_dir)
+        self.readers = {}               # path -> requests using it
+        self.swaps = 0
+        self._stamp = self._pointer_stamp()
+        self._lock = threading.Lock()
+
+    def _pointer_stamp(self):
+        try:
+            st = os.stat(_pointer_path(self.base_dir))
+            return st.st_ino, st.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def acquire(self) -> str:
+        swapped = None
+        with self._lock:
+            stamp = self._pointer_stamp()
+            if stamp != self._stamp:
+                self._stamp = stamp
+                path = current_snapshot(self.base_dir)
+                if path != self.path:
+                    if not self.readers.get(self.path):
+                        self.readers.pop(self.path, None)
+                        drop_shared_cache(self.path)
+                    self.path = swapped = path
+                    self.swaps += 1
+            path = self.path
+            self.readers[path] = self.readers.get(path, 0) + 1
+        if swapped and self.on_swap:
+            self.on_swap(swapped)
+        return path
+
+    def release(self, path: str):
+        with self._lock:
+            self.readers[path] -= 1
+            if self.readers[path] == 0 and path != self.path:
+                del self.readers[path]
+                drop_shared_cache(path)     # Last reader of a retired snapshot
+
+    @contextmanager
+    def reading(self):
+        path = self.acquire()
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, publish or roll back index snapshots.")
+    parser.add_argument("command", choices=["status", "publish", "rollback"])
+    parser.add_argument("path", nargs="?", help="snapshot to publish")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        print(f"Serving {publish_snapshot(args.path)}")
+    elif args.command == "rollback":
+        print(f"Serving {rollback_snapshot()}")
+    else:
+        print(f"Serving {current_snapshot()}")
+        for name in read_history():
+            print(f"  published: {name}")
@@ -0,0 +1,163 @@
+import random
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from nltk.stem import PorterStemmer
+
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 7   # Only the first characters of a word are used for the delete variants
+
+
+def edit_distance(a: str, b: str, max_distance: int = None) -> int:
+    """Levenshtein distance between a and b, stopping early once it exceeds max_distance."""
+    if abs(len(a) - len(b)) > (max_distance if max_distance is not None else len(a) + len(b)):
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def _deletes(word: str, max_distance: int) -> set:
+    """All strings obtained by deleting up to max_distance characters from word."""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+class SpellingIndex:
+    """
+    Symmetric-delete spelling dictionary over the (word, df) vocabulary.
+    Every word is stored under each string reachable by deleting up to max_distance characters
+    (from its first PREFIX_LENGTH characters); a lookup only generates the deletes of the query
+    term and verifies the few words found under them, instead of scanning the vocabulary.
+    """
+
+    def __init__(self, vocabulary: List[Tuple[str, int]], max_distance: int = MAX_EDIT_DISTANCE):
+        self.max_distance = max_distance
+        self.df = dict(vocabulary)
+        self.deletes = defaultdict(list)    # delete variant -> words
+        for word in self.df:
+            for variant in _deletes(word[:PREFIX_LENGTH], max_distance):
+                self.deletes[variant].append(word)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.df
+
+    def lookup(self, term: str, k: int = 5, max_distance: int = None) -> List[Tuple[str, int, int]]:
+        """Return up to k (word, distance, df) within max_distance of term, closest then most common first."""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        candidates = set()
+        for variant in _deletes(term[:PREFIX_LENGTH], max_distance):
+            candidates.update(self.deletes.get(variant, ()))
+        matches = []
+        for word in candidates:
+            distance = edit_distance(term, word, max_distance)
+            if distance <= max_distance:
+                matches.append((word, distance, self.df[word]))
+        matches.sort(key=lambda m: (m[1], -m[2], m[0]))
+        return matches[:k]
+
+    def suggest(self, term: str) -> Optional[str]:
+        """Best correction for an unknown term (None if the term is known or nothing is close)."""
+        if term in self.df:
+            return None
+        matches = self.lookup(term, k=1)
+        return matches[0][0] if matches else None
+
+
+def naive_lookup(vocabulary: List[Tuple[str, int]], term: str, k: int = 5, max_distance: int = MAX_EDIT_DISTANCE):
+    """Reference implementation: edit distance against every word of the vocabulary."""
+    matches = []
+    for word, df in vocabulary:
+        distance = edit_distance(term, word, max_distance)
+        if distance <= max_distance:
+            matches.append((word, distance, df))
+    matches.sort(key=lambda m: (m[1], -m[2], m[0]))
+    return matches[:k]
+
+
+def suggest_query(query: str, spelling: SpellingIndex, stopwords=()) -> Optional[str]:
+    """
+    Return the query with every unknown word replaced by its best correction (as a stemmed keyword),
+    or None if no word needed correcting. Boolean operators are kept as they are.
+    """
+    stemmer = PorterStemmer()
+    changed = False
+
+    def replace(match):
+        nonlocal changed
+        word = match.group(0)
+        if word in ("AND", "OR", "NOT"):
+            return word
+        stem = stemmer.stem(word.lower())
+        if stem in stopwords:
+            return word
+        suggestion = spelling.suggest(stem)
+        if suggestion is None:
+            return word
+        changed = True
+        return suggestion
+
+    corrected = re.sub(r"\b[\w']+\b", replace, query)
+    return corrected if changed else None
+
+
+def _misspell(word: str, rng: random.Random) -> str:
+    """Apply one random insertion, deletion or substitution."""
+    i = rng.randrange(len(word))
+    letter = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    edit = rng.choice(("insert", "delete", "replace")) if len(word) > 1 else "insert"
+    if edit == "insert":
+        return word[:i] + letter + word[i:]
+    if edit == "delete":
+        return word[:i] + word[i + 1:]
+    return word[:i] + letter + word[i + 1:]
+
+
+def benchmark(vocabulary: List[Tuple[str, int]], queries: int = 200, seed: int = 4321) -> Dict[str, float]:
+    """Time symmetric-delete lookups against the naive scan on randomly misspelled vocabulary words."""
+    rng = random.Random(seed)
+    words = [word for word, df in vocabulary if len(word) > 2]
+    terms = [_misspell(rng.choice(words), rng) for _ in range(queries)]
+
+    start = time.perf_counter()
+    spelling = SpellingIndex(vocabulary)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = [spelling.lookup(t) for t in terms]
+    index_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    slow = [naive_lookup(vocabulary, t) for t in terms]
+    naive_time = time.perf_counter() - start
+
+    return {
+        'vocabulary': len(vocabulary),
+        'queries': queries,
+        'build_ms': build_time * 1000,
+        'index_lookup_ms': index_time * 1000 / queries,
+        'naive_lookup_ms': naive_time * 1000 / queries,
+        'speedup': naive_time / index_time if index_time else float('inf'),
+        'same_results': fast == slow,
+    }
+
+
+if __name__ == "__main__":
+    from database import Database
+    db = Database()
+    vocabulary = db.get_vocabulary_with_df()
+    db.close()
+    for name, value in benchmark(vocabulary).items():
+        print(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
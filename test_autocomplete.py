@@ -0,0 +1,25 @@
+from autocomplete import PrefixIndex
+from database import Database
+from testing_utils import temp_index_copy
+
+def test_prefix_completions_ranked_by_df():
+    index = PrefixIndex([("comput", 40), ("compil", 3), ("compani", 12), ("cat", 50), ("computerworld", 1), ("dog", 7)])
+    assert index.complete("comp", 3) == [("comput", 40), ("compani", 12), ("compil", 3)]
+    assert index.complete("comput") == [("comput", 40), ("computerworld", 1)]
+    assert index.complete("", 2) == [("cat", 50), ("comput", 40)]
+    assert index.complete("x") == []
+    assert index.complete("computerz") == []
+
+def test_prefix_index_matches_vocabulary_scan():
+    with temp_index_copy() as db_path:
+        db = Database(db_path)
+        vocabulary = db.get_vocabulary_with_df()
+        db.close()
+    index = PrefixIndex(vocabulary)
+    for prefix in ["c", "com", "comput", "movi", "zz"]:
+        expected = sorted((p for p in vocabulary if p[0].startswith(prefix)), key=lambda p: (-p[1], p[0]))[:10]
+        assert index.complete(prefix, 10) == expected
+
+if __name__ == "__main__":
+    test_prefix_completions_ranked_by_df()
+    test_prefix_index_matches_vocabulary_scan()
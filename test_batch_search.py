@@ -0,0 +1,22 @@
+from batch_search import batch_search
+from compact import compact
+from search import search_engine
+from testing_utils import temp_crawler
+
+QUERIES = ["movie", "hong kong university", '"computer science" hkust', "movie AND NOT dinosaur", "movie",
+           "zzzqqq", "the"]
+
+def test_batch_matches_single_queries():
+    with temp_crawler() as crawler:  # Work on a copy, lookups may insert query words
+        # Without stored norms the batch computes them itself; a few cheap queries are enough here
+        queries = ['"computer science" hkust', "zzzqqq"]
+        assert batch_search(crawler, queries) == [search_engine(crawler, q) for q in queries]
+
+        compact(crawler.index)
+        expected = [search_engine(crawler, q) for q in QUERIES]
+        assert batch_search(crawler, QUERIES) == expected
+        assert batch_search(crawler, QUERIES, workers=2) == expected
+        assert [len(r) for r in expected][-2:] == [0, 0]
+
+if __name__ == "__main__":
+    test_batch_matches_single_queries()
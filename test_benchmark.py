@@ -0,0 +1,27 @@
+import copy
+import json
+
+from benchmark import compare, generate_query_log, percentile, run_benchmark
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50 and percentile(values, 95) == 95 and percentile(values, 99) == 99
+    assert percentile([7.0], 99) == 7.0 and percentile([], 50) == 0.0
+
+def test_small_benchmark_run():
+    assert generate_query_log(20, seed=3) == generate_query_log(20, seed=3)    # Reproducible
+    results = run_benchmark(pages=20, fanout=3, vocabulary=500, queries=10)
+    json.dumps(results)
+    assert results['crawl']['pages'] == 20 and results['index']['pages_per_sec'] > 0
+    assert results['db_bytes']['after_compaction'] > 0
+    q = results['query_ms']
+    assert 0 < q['p50'] <= q['p95'] <= q['p99']
+
+    slower = copy.deepcopy(results)
+    slower['query_ms']['p95'] *= 2
+    report = compare(results, slower)
+    assert [line for line in report if "REGRESSION" in line] == [line for line in report if line.startswith("query_ms.p95")]
+
+if __name__ == "__main__":
+    test_percentile_nearest_rank()
+    test_small_benchmark_run()
@@ -0,0 +1,45 @@
+from boolean_query import (parse_boolean_query, positive_terms, is_boolean_query,
+                           PostingsList, PostingsStats, intersect, union, difference, BooleanQueryError)
+from search import search_engine, get_docs_for_term
+from testing_utils import temp_crawler
+
+def test_parse_precedence():
+    assert not is_boolean_query('hkust "computer science"')
+    assert is_boolean_query('hkust AND movie')
+    tree = parse_boolean_query('(hkust OR movie) "computer science" NOT the', stopwords={'the'})
+    assert tree == ('and', [('or', [('term', 'hkust'), ('term', 'movi')]), ('phrase', ['comput', 'scienc'])])
+    tree = parse_boolean_query('hkust NOT movie OR love')
+    assert tree == ('or', [('and', [('term', 'hkust'), ('not', ('term', 'movi'))]), ('term', 'love')])
+    assert positive_terms(tree) == (['hkust', 'love'], [])
+    for bad in ['hkust AND (movie', 'hkust OR', ') hkust']:
+        try:
+            parse_boolean_query(bad)
+            assert False, bad
+        except BooleanQueryError:
+            pass
+
+def test_skip_pointer_intersection():
+    a = PostingsList(list(range(0, 1000, 2)))
+    b = PostingsList([3, 4, 500, 998, 999])
+    stats = PostingsStats()
+    assert intersect(a, b, stats).page_ids == [4, 500, 998]
+    assert stats.touched < len(a)  # Skips jump over most of the long list
+    assert union(b, PostingsList([1, 4, 1000])).page_ids == [1, 3, 4, 500, 998, 999, 1000]
+    assert difference(b, a).page_ids == [3, 999]
+
+def test_boolean_search_matches_set_algebra():
+    with temp_crawler() as crawler:
+        hkust = get_docs_for_term(crawler, "hkust")
+        comput = get_docs_for_term(crawler, "comput")
+        results = search_engine(crawler, "hkust AND computer", top_k=1000)
+        assert {url for url, score in results} == hkust & comput
+        results = search_engine(crawler, "computer AND NOT hkust", top_k=1000)
+        assert {url for url, score in results} == comput - hkust
+        # A malformed boolean query is searched as free text instead of raising
+        assert not is_boolean_query("hkust (computer")
+        assert search_engine(crawler, "hkust (computer", top_k=1000) == search_engine(crawler, "hkust computer", top_k=1000)
+
+if __name__ == "__main__":
+    test_parse_precedence()
+    test_skip_pointer_intersection()
+    test_boolean_search_matches_set_algebra()
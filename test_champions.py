@@ -0,0 +1,25 @@
+from champions import build_champion_lists, compare_with_exhaustive
+from search import search_engine
+from testing_utils import temp_crawler
+
+def test_champion_tier_matches_exhaustive_top_k():
+    with temp_crawler() as crawler:
+        assert not crawler.index.has_fresh_champion_lists()
+        build_champion_lists(crawler.index, r=20)
+        assert crawler.index.has_fresh_champion_lists()
+
+        urls, truncated = crawler.index.get_champion_list("movi")
+        assert len(urls) == 20 and truncated
+
+        for row in compare_with_exhaustive(crawler, ["information retrieval", "hkust computer science"], top_k=5):
+            assert row['overlap'] == 1.0
+
+        # A rare term has fewer matches than top_k, so the full postings are used as well
+        exhaustive = search_engine(crawler, "hkust", top_k=50)
+        assert search_engine(crawler, "hkust", top_k=50, champions=True) == exhaustive
+
+        crawler.index.bump_generation()     # Stale lists are ignored
+        assert not crawler.index.has_fresh_champion_lists()
+
+if __name__ == "__main__":
+    test_champion_tier_matches_exhaustive_top_k()
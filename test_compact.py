@@ -0,0 +1,44 @@
+import math
+
+from compact import compact
+from crawler import Crawler
+from search import build_doc_vector, search_engine
+from snapshots import validate_snapshot
+from testing_utils import temp_index_copy
+
+def test_compact_keeps_rankings():
+    with temp_index_copy() as db_path:
+        crawler = Crawler(None, db_name=db_path)
+        index = crawler.index
+        # Leave a hole in the page ids and a query-only word
+        index.remove_page_postings(5)
+        index.cursor.execute("DELETE FROM parent_child_links WHERE parent_id = 5 OR child_id = 5")
+        index.cursor.execute("DELETE FROM pages WHERE page_id = 5")
+        index.conn.commit()
+        index.bump_generation()
+        expected = search_engine(crawler, "information retrieval")
+        junk_id = index._get_or_create_word_id("zzzjunkword")
+        # Drifted statistics
+        index.cursor.execute("UPDATE inverted_index_body_word2df SET df = df + 3 WHERE word_id = 1")
+        index.conn.commit()
+
+        report = compact(index)
+        assert report['words_removed'] >= 1 and report['page_ids_changed'] > 0
+        assert index.get_word_id("zzzjunkword") is None and junk_id is not None
+        for table, column in (("pages", "page_id"), ("words", "word_id")):
+            max_id, count = index.cursor.execute(f"SELECT MAX({column}), COUNT(*) FROM {table}").fetchone()
+            assert max_id == count
+        assert validate_snapshot(db_path) == []
+
+        assert index.has_fresh_page_norms()
+        results = search_engine(crawler, "information retrieval")
+        assert [url for url, score in results] == [url for url, score in expected]
+        assert all(math.isclose(a[1], b[1]) for a, b in zip(results, expected))
+        N = index.get_total_doc_count()
+        for url, score in results[:5]:
+            vec = build_doc_vector(crawler, url, N)
+            assert math.isclose(index.get_page_norms([url])[url], math.sqrt(sum(v * v for v in vec.values())))
+        crawler.close()
+
+if __name__ == "__main__":
+    test_compact_keeps_rankings()
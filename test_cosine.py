@@ -2,20 +2,26 @@ from search import search_engine, parse_query
 import math
 import sqlite3
 
+from testing_utils import temp_index_copy
+
 # Import your actual Crawler class if available
 # from crawler import Crawler
 
 class DummyCrawler:
     def __init__(self, db_path):
         from crawler import Crawler  # Import here to avoid errors if not present
-        self.crawler = Crawler(db_path)
+        self.crawler = Crawler(None, db_name=db_path)
         self.index = self.crawler.index
 
     def __getattr__(self, name):
         return getattr(self.crawler, name)
 
 def test_cosine_similarity_loop():
-    db_path = "search_engine.db"
+    # Opening a database migrates it, so work on a copy and leave the tracked search_engine.db untouched
+    with temp_index_copy() as db_path:
+        _cosine_similarity_loop(db_path)
+
+def _cosine_similarity_loop(db_path):
     crawler = DummyCrawler(db_path)
     query = "information retrieval"
 
@@ -0,0 +1,183 @@
+import os
+import shutil
+import tempfile
+
+from crawler import Crawler
+from fts import build_fts_index, fts_available
+from recrawl import RecrawlScheduler, change_probability, estimate_change_rate
+from simhash import simhash, hamming_distance
+from testing_utils import serve_directory, temp_index_copy
+
+ARTICLE = " ".join(f"word{i} topic{i % 7} detail{i % 11}" for i in range(300))
+
+def test_streamed_spider_result_matches_per_page_queries():
+    with temp_index_copy() as db_path:
+        crawler = Crawler(None, db_name=db_path)
+        crawler.upload_file = os.path.join(os.path.dirname(db_path), "spider_result.txt")
+        rows = list(crawler.iter_spider_result())
+        assert len(rows) == crawler.index.get_total_doc_count()
+        for title, url, last_modified, size, keywords, parents, children in rows[:40]:
+            assert sorted(parents) == sorted(crawler._get_parent_links(url))
+            assert sorted(children) == sorted(crawler._get_child_links(url))
+            totals = [total for word, total in keywords]
+            assert totals == sorted(totals, reverse=True) and len(keywords) <= 5
+        # Same keywords, ties included, as the per-page query used by the web page and the API
+        assert all(keywords == crawler._top_keywords(url) for title, url, last_modified, size, keywords, *_ in rows)
+
+        crawler.generate_spider_result()
+        with open(crawler.upload_file) as f:
+            assert f.read().count("----------------") == len(rows) - 1
+        crawler.close()
+
+def test_simhash_near_duplicates():
+    words = ARTICLE.split()
+    assert hamming_distance(simhash(words), simhash(words[:-2] + ["printview"])) <= 3
+    assert hamming_distance(simhash(words), simhash(list(reversed(words)))) > 3
+
+def test_crawl_skips_near_duplicate_pages():
+    tmp_dir = tempfile.mkdtemp()
+    site = os.path.join(tmp_dir, "site")
+    os.makedirs(site)
+    pages = {
+        "index.html": '<title>Home</title><a href="article.html">a</a> <a href="print.html">p</a> <a href="other.html">o</a>',
+        "article.html": f"<title>Article</title><p>{ARTICLE}</p>",
+        "print.html": f"<title>Article</title><p>{ARTICLE} print</p>",
+        "other.html": "<title>Other</title><p>something completely different about movies and love</p>",
+    }
+    for name, html in pages.items():
+        with open(os.path.join(site, name), "w") as f:
+            f.write(f"<html><body>{html}</body></html>")
+    server, base = serve_directory(site)
+    crawler = Crawler(base + "index.html", max_pages=10, db_name=os.path.join(tmp_dir, "crawl.db"))
+    crawler.delay = 0
+    try:
+        crawler.crawl()
+        assert crawler.duplicates_skipped == 1
+        assert crawler.duplicate_postings_skipped > 0
+        assert crawler.index.get_page_id(base + "print.html") is None
+        crawler.index.cursor.execute("SELECT url, duplicate_of FROM duplicate_pages")
+        assert crawler.index.cursor.fetchall() == [(base + "print.html", crawler.index.get_page_id(base + "article.html"))]
+        assert crawler.index.get_total_doc_count() == 3
+
+        # A page that becomes a copy of another one when re-fetched loses its old postings, text and FTS row
+        if fts_available():
+            build_fts_index(crawler.index)
+        other = crawler.index.get_page_id(base + "other.html")
+        with open(os.path.join(site, "other.html"), "w") as f:
+            f.write(f"<html><body><title>Article</title><p>{ARTICLE} copy</p></body></html>")
+        os.utime(os.path.join(site, "other.html"), (2_000_000_000, 2_000_000_000))
+        crawler.recrawl(budget=10)
+        assert crawler.duplicates_skipped == 2
+        assert crawler.index.resolve_duplicate(base + "other.html") == base + "article.html"
+        assert crawler.index.get_docs_containing_word_body("movi") == []
+        assert crawler.index.get_page_text(base + "other.html") == (other, None)
+        if fts_available():
+            assert crawler.index.get_fts_matches('"movi"') == []
+
+        # Once it differs again it is indexed on its own and no longer resolves to the original
+        with open(os.path.join(site, "other.html"), "w") as f:
+            f.write("<html><body><title>Other</title><p>zebras and lions on the savanna</p></body></html>")
+        os.utime(os.path.join(site, "other.html"), (2_100_000_000, 2_100_000_000))
+        crawler.recrawl(budget=10)
+        assert crawler.index.resolve_duplicate(base + "other.html") == base + "other.html"
+        assert crawler.index.get_docs_containing_word_body("zebra") == [base + "other.html"]
+
+        # When an original stops being indexed, its duplicates follow it to its own original
+        article, home = crawler.index.get_page_id(base + "article.html"), crawler.index.get_page_id(base + "index.html")
+        crawler.index.clear_page(article, home)
+        assert crawler.index.resolve_duplicate(base + "print.html") == base + "index.html"
+    finally:
+        crawler.close()
+        server.shutdown()
+        shutil.rmtree(tmp_dir)
+
+def test_recrawl_prioritises_changing_pages():
+    tmp_dir = tempfile.mkdtemp()
+    site = os.path.join(tmp_dir, "site")
+    os.makedirs(site)
+    def write(name, html, mtime):
+        path = os.path.join(site, name)
+        with open(path, "w") as f:
+            f.write(f"<html><body>{html}</body></html>")
+        os.utime(path, (mtime, mtime))
+    write("index.html", '<title>Home</title><a href="news.html">news</a> static page about movies', 1_000_000)
+    write("news.html", "<title>News</title> breaking story about elephants", 1_000_000)
+    server, base = serve_directory(site)
+    crawler = Crawler(base + "index.html", max_pages=10, db_name=os.path.join(tmp_dir, "crawl.db"))
+    crawler.delay = 0
+    try:
+        crawler.crawl()
+        index = crawler.index
+        home, news = index.get_page_id(base + "index.html"), index.get_page_id(base + "news.html")
+
+        # History: news changed at every hourly check, home never did
+        for hour in range(1, 6):
+            index.record_page_check(home, index.get_content_hash(home), 1000 + hour * 3600)
+            index.record_page_check(news, f"hash{hour}", 1000 + hour * 3600)
+        plan = RecrawlScheduler(index).plan(budget=1, now=1000 + 6 * 3600)
+        assert [url for url, p in plan] == [base + "news.html"]
+
+        write("news.html", "<title>News</title> breaking story about giraffes", 2_000_000)
+        stats = crawler.recrawl(budget=2)
+        assert stats == {'fetched': 2, 'not_modified': 1, 'changed': 1}
+        assert crawler.index.get_docs_containing_word_body("giraff") == [base + "news.html"]
+        assert crawler.index.get_docs_containing_word_body("eleph") == []
+        index.cursor.execute("SELECT df FROM inverted_index_body_word2df WHERE word_id = ?", (index.get_word_id("eleph"),))
+        assert index.cursor.fetchone()[0] == 0
+    finally:
+        crawler.close()
+        server.shutdown()
+        shutil.rmtree(tmp_dir)
+
+def test_unchanged_pages_become_due():
+    # Ten daily checks without a change still give a positive rate, so the page is due once it is old enough
+    day = 24 * 3600
+    rate = estimate_change_rate(11, 0, 0, 10 * day)
+    assert rate > 0
+    assert change_probability(rate, day) < 0.1
+    assert change_probability(rate, 365 * day) > 0.9
+    # ... and it outranks a page that changes at every check but was just fetched
+    assert change_probability(rate, 365 * day) > change_probability(estimate_change_rate(11, 10, 0, 10 * day), 60)
+
+def test_fetcher_rejects_unwanted_responses():
+    tmp_dir = tempfile.mkdtemp()
+    site = os.path.join(tmp_dir, "site")
+    os.makedirs(site)
+    links = '<a href="page.html">page</a> <a href="image.png">image</a> <a href="big.html">big</a>'
+    with open(os.path.join(site, "index.html"), "w") as f:
+        f.write(f"<html><title>Home</title><body>{links} about movies</body></html>")
+    with open(os.path.join(site, "page.html"), "w") as f:
+        f.write("<html><title>Page</title><body>small page about elephants</body></html>")
+    with open(os.path.join(site, "image.png"), "wb") as f:
+        f.write(b"\x89PNG" + b"\0" * 5000)
+    with open(os.path.join(site, "big.html"), "w") as f:
+        f.write(f"<html><body>{ARTICLE * 20}</body></html>")
+    server, base = serve_directory(site)
+    crawler = Crawler(base + "index.html", max_pages=10, db_name=os.path.join(tmp_dir, "crawl.db"))
+    crawler.delay = 0
+    crawler.fetcher.max_bytes = 50_000
+    try:
+        crawler.crawl()
+        stats = crawler.fetcher.stats
+        assert stats['pages'] == 2 and stats['rejected_type'] == 1 and stats['rejected_size'] == 1
+        assert stats['bytes_saved'] == 5004 + os.path.getsize(os.path.join(site, "big.html"))
+        assert crawler.index.get_page_id(base + "page.html") is not None
+        assert crawler.index.get_docs_containing_word_body("eleph") == [base + "page.html"]
+
+        # Second crawl: the start page is unchanged, so it costs a 304 and no body
+        crawler.visited.clear()
+        crawler.queue.append((base + "index.html", None))
+        crawler.crawl()
+        assert stats['not_modified'] == 1 and stats['pages'] == 2
+    finally:
+        crawler.close()
+        server.shutdown()
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    test_simhash_near_duplicates()
+    test_crawl_skips_near_duplicate_pages()
+    test_recrawl_prioritises_changing_pages()
+    test_unchanged_pages_become_due()
+    test_streamed_spider_result_matches_per_page_queries()
+    test_fetcher_rejects_unwanted_responses()
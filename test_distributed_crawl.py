@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+
+from database import Database
+from distributed_crawl import Frontier, distributed_crawl
+from testing_utils import serve_directory
+
+def make_site(path, pages=12):
+    """Page i links to pages 2i+1 and 2i+2 (a binary tree), each with its own words."""
+    os.makedirs(path)
+    for i in range(pages):
+        links = ''.join(f'<a href="page{c}.html">child</a>' for c in (2 * i + 1, 2 * i + 2) if c < pages)
+        with open(os.path.join(path, f"page{i}.html"), "w") as f:
+            f.write(f"<html><title>Page {i}</title><body>{links} content uniqueword{i} " +
+                    " ".join(f"filler{i}x{j}" for j in range(20)) + "</body></html>")
+
+def test_workers_share_frontier_and_recover_dead_leases():
+    tmp_dir = tempfile.mkdtemp()
+    make_site(os.path.join(tmp_dir, "site"))
+    server, base = serve_directory(os.path.join(tmp_dir, "site"))
+    frontier_path = os.path.join(tmp_dir, "frontier.db")
+    db_path = os.path.join(tmp_dir, "crawl.db")
+    try:
+        # A worker leased the start page and died: its lease must expire and be handed to another worker
+        frontier = Frontier(frontier_path)
+        frontier.add([(base + "page0.html", None)])
+        assert frontier.lease("dead-worker", n=1, lease_seconds=1) == [(base + "page0.html", None)]
+        assert frontier.lease("other-worker", n=1) == []
+        frontier.close()
+
+        counts = distributed_crawl(base + "page0.html", workers=3, max_pages=50, db_name=db_path,
+                                   frontier_path=frontier_path, delay=0, lease_seconds=5, resume=True)
+        assert counts == {'done': 12}
+
+        db = Database(db_path)
+        assert db.get_total_doc_count() == 12
+        assert db.get_docs_containing_word_body("uniqueword11") == [base + "page11.html"]
+        db.cursor.execute("SELECT COUNT(*) FROM parent_child_links")
+        assert db.cursor.fetchone()[0] == 11
+        db.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp_dir)
+
+def test_runs_start_fresh_and_count_only_parsed_pages():
+    tmp_dir = tempfile.mkdtemp()
+    site = os.path.join(tmp_dir, "site")
+    make_site(site)
+    with open(os.path.join(site, "page0.html"), "w") as f:     # Two broken links are leased first
+        f.write('<html><title>Page 0</title><body><a href="missing1.html">x</a> <a href="missing2.html">y</a> '
+                '<a href="page1.html">child</a> <a href="page2.html">child</a> content</body></html>')
+    server, base = serve_directory(site)
+    frontier_path = os.path.join(tmp_dir, "frontier.db")
+    try:
+        for run in range(2):    # The same start URL and frontier file: the second run crawls again
+            db_path = os.path.join(tmp_dir, f"crawl{run}.db")
+            counts = distributed_crawl(base + "page0.html", workers=2, max_pages=5, db_name=db_path,
+                                       frontier_path=frontier_path, delay=0)
+            assert counts['done'] == 5 and counts['failed'] == 2
+            db = Database(db_path)
+            assert db.get_total_doc_count() == 5
+            db.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    test_workers_share_frontier_and_recover_dead_leases()
+    test_runs_start_fresh_and_count_only_parsed_pages()
@@ -0,0 +1,41 @@
+import math
+import os
+
+from crawler import Crawler
+from evaluate import average_precision, ndcg, precision_at, overlap_at, load_judgments, evaluate, regressions
+from search import search_engine
+from testing_utils import temp_index_copy
+
+def test_metrics():
+    grades = {"a": 2, "b": 0, "c": 1, "d": 1}
+    ranked = ["a", "b", "c", "x"]
+    assert average_precision(ranked, grades) == (1 / 1 + 2 / 3) / 3    # "d" is never retrieved
+    assert precision_at(ranked, grades, 2) == 0.5
+    dcg = 3 + 1 / math.log2(4)
+    ideal = 3 + 1 / math.log2(3) + 1 / math.log2(4)
+    assert abs(ndcg(ranked, grades) - dcg / ideal) < 1e-12
+    assert overlap_at(["a", "b"], ["b", "c"], k=2) == 0.5
+
+def test_evaluate_against_reference():
+    with temp_index_copy() as db_path:  # Work on a copy, lookups may insert query words
+        crawler = Crawler(None, db_name=db_path)
+        # Judge the top results of the exhaustive ranking: it gets perfect scores
+        path = os.path.join(os.path.dirname(db_path), "judgments.tsv")
+        with open(path, "w") as f:
+            f.write("# query\turl\tgrade\n")
+            for query in ["hong kong university", '"computer science"']:
+                for i, (url, score) in enumerate(search_engine(crawler, query, top_k=5)):
+                    f.write(f"{query}\t{url}\t{2 if i < 2 else 1}\n")
+        judgments = load_judgments(path)
+        assert len(judgments) == 2
+
+        report = evaluate(crawler, judgments, proximity=True)
+        assert report['reference']['map'] == 1.0 and report['reference']['ndcg@10'] == 1.0
+        assert 0 < report['summary']['overlap@10'] <= 1.0
+        assert report['summary']['p50_ms'] > 0
+        assert regressions(report, tolerance=1.0) == []
+        crawler.close()
+
+if __name__ == "__main__":
+    test_metrics()
+    test_evaluate_against_reference()
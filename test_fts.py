@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+
+from crawler import Crawler
+from fts import build_fts_index, compare_with_inverted_index, token_stream, FTS_FILLER
+from search import parse_query, gather_candidates, gather_fts_candidates, search_engine
+from testing_utils import serve_directory, temp_crawler
+
+def test_token_stream_keeps_adjacency():
+    # Positions 0, 1 and 3: the stopword at 2 becomes one filler
+    assert token_stream(["hong", "kong", "univers"], [0, 1, 3]) == f"hong kong {FTS_FILLER} univers"
+
+def test_fts_matches_inverted_index():
+    with temp_crawler() as crawler:  # Work on a copy, lookups may insert query words
+        build_fts_index(crawler.index)
+        queries = ["hong kong university", '"computer science" hkust', '"hong kong"', '"the movie"', "zzzqqq"]
+        for row in compare_with_inverted_index(crawler, queries):
+            assert row['same_results'], row['query']
+
+def test_crawl_keeps_fts_up_to_date():
+    tmp_dir = tempfile.mkdtemp()
+    site = os.path.join(tmp_dir, "site")
+    os.makedirs(site)
+    with open(os.path.join(site, "index.html"), "w") as f:
+        f.write('<html><title>Home</title><body><a href="a.html">a</a> data mining in databases</body></html>')
+    with open(os.path.join(site, "a.html"), "w") as f:
+        f.write('<html><title>Mining</title><body>mining data for databases</body></html>')
+    server, base = serve_directory(site)
+    crawler = Crawler(base + "index.html", max_pages=5, db_name=os.path.join(tmp_dir, "crawl.db"))
+    crawler.delay = 0
+    try:
+        build_fts_index(crawler.index)      # Empty, filled by the crawl
+        crawler.crawl()
+        assert crawler.index.has_fresh_fts_index()
+        for query in ['"data mining"', '"mining data"', '"mining databases"', "mining", "home"]:
+            terms, phrases = parse_query(query)
+            assert gather_fts_candidates(crawler, terms, phrases) == gather_candidates(crawler, terms, phrases)
+        assert search_engine(crawler, '"mining databases"', fts=True) == []    # "in" sits between them
+    finally:
+        crawler.close()
+        server.shutdown()
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    test_token_stream_keeps_adjacency()
+    test_fts_matches_inverted_index()
+    test_crawl_keeps_fts_up_to_date()
@@ -0,0 +1,87 @@
+import logging
+import os
+
+import metrics
+from crawler import Crawler
+from database import Database
+from search import search_engine
+from testing_utils import serve_directory, temp_index_copy
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def test_search_and_crawl_instrumentation():
+    with temp_index_copy() as db_path:
+        _search_and_crawl_instrumentation(db_path)
+
+def _search_and_crawl_instrumentation(db_path):
+    tmp_dir = os.path.dirname(db_path)
+    site = os.path.join(tmp_dir, "site")
+    os.makedirs(site)
+    with open(os.path.join(site, "index.html"), "w") as f:
+        f.write("<html><title>Home</title><body>elephants and giraffes</body></html>")
+    server, base = serve_directory(site)
+    handler = ListHandler()
+    metrics.slow_log.addHandler(handler)
+    metrics.enable()
+    metrics.reset()
+    threshold = metrics.SLOW_QUERY_SECONDS
+    metrics.SLOW_QUERY_SECONDS = 0
+    try:
+        crawler = Crawler(None, db_name=db_path)
+        request = metrics.start_request()
+        search_engine(crawler, "computer science")
+        assert metrics.finish_request("computer science") is request
+        crawler.close()
+        assert {'parse', 'candidates', 'query_vector', 'rank'} <= set(request.stages)
+        assert request.statements > 0 and request.rows > 0
+        assert len(handler.messages) == 1 and "'computer science'" in handler.messages[0]
+
+        crawler = Crawler(base + "index.html", max_pages=1, db_name=os.path.join(tmp_dir, "crawl.db"))
+        crawler.delay = 0
+        crawler.crawl()
+        crawler.close()
+
+        text = metrics.render()
+        assert 'search_stage_seconds_bucket{stage="rank",le="+Inf"} 1' in text
+        assert "search_requests_total 1" in text and "slow_queries_total 1" in text
+        assert "pages_indexed_total 1" in text and "fetch_seconds_count 1" in text
+        assert "# TYPE sql_rows_read_total counter" in text
+
+        # Off: no counting connection, stages are a shared no-op
+        metrics.enable(False)
+        index = Database(db_path)
+        assert type(index.conn) is not metrics.CountingConnection
+        index.close()
+        assert metrics.stage("rank") is metrics.stage("parse")
+        assert metrics.start_request() is None
+    finally:
+        metrics.enable(False)
+        metrics.SLOW_QUERY_SECONDS = threshold
+        metrics.slow_log.removeHandler(handler)
+        server.shutdown()
+
+def test_app_counts_only_searches():
+    with temp_index_copy(app_dir=True):
+        try:
+            import app
+            metrics.enable()    # After the import, which applies the METRICS setting
+            metrics.reset()
+            client = app.app.test_client()
+            client.get("/")
+            client.get("/search", query_string={"query": ""})
+            client.post("/search", data={"query": ""})
+            assert "search_requests_total" not in metrics.render()
+            client.get("/search", query_string={"query": "movie"})
+            assert "search_requests_total 1" in metrics.render()
+        finally:
+            metrics.enable(False)
+
+if __name__ == "__main__":
+    test_search_and_crawl_instrumentation()
+    test_app_counts_only_searches()
@@ -0,0 +1,56 @@
+import os
+import re
+import shutil
+import tempfile
+
+from crawler import Crawler
+from page_text import BLOCK_WORDS, compress_text, read_words, make_snippet, page_snippet, word_count
+from testing_utils import serve_directory
+
+def test_read_words_across_blocks():
+    words = [f"w{i}" for i in range(BLOCK_WORDS * 3 + 10)]
+    text = "  " + ", ".join(words) + "."
+    blob = compress_text(text)
+    assert word_count(blob) == len(words)
+    first, last = BLOCK_WORDS - 2, BLOCK_WORDS + 1     # Spans two blocks
+    chunk, spans = read_words(blob, first, last)
+    assert chunk == ", ".join(words[first:last + 1])
+    assert [chunk[s:e] for s, e in spans] == words[first:last + 1]
+    assert len(blob) < len(text)
+
+def test_snippet_window_and_highlights():
+    words = [f"w{i}" for i in range(1000)]
+    blob = compress_text(" ".join(words))
+    # One term alone early, both terms close together later: the later window wins
+    snippet = make_snippet(blob, [[5, 600], [603]], width=10)
+    text = snippet['text']
+    assert text.startswith("... ") and text.endswith(" ...")
+    assert [text[s:e] for s, e in snippet['highlights']] == ["w600", "w603"]
+    assert len(re.findall(r"w\d+", text)) == 10
+    # No occurrence: the beginning of the page
+    assert make_snippet(blob, [], width=5)['text'] == "w0 w1 w2 w3 w4 ..."
+
+def test_crawl_stores_page_text():
+    tmp_dir = tempfile.mkdtemp()
+    site = os.path.join(tmp_dir, "site")
+    os.makedirs(site)
+    with open(os.path.join(site, "index.html"), "w") as f:
+        f.write('<html><title>Home</title><body>Welcome to the <b>data mining</b> group. ' + "filler " * 500 +
+                'We also teach databases.</body></html>')
+    server, base = serve_directory(site)
+    crawler = Crawler(base + "index.html", max_pages=1, db_name=os.path.join(tmp_dir, "crawl.db"))
+    crawler.delay = 0
+    try:
+        crawler.crawl()
+        snippet = page_snippet(crawler.index, base + "index.html", ["databas", "teach"])
+        assert snippet["text"].endswith("We also teach databases")
+        assert [snippet['text'][s:e] for s, e in snippet['highlights']] == ["teach", "databases"]
+    finally:
+        crawler.close()
+        server.shutdown()
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    test_read_words_across_blocks()
+    test_snippet_window_and_highlights()
+    test_crawl_stores_page_text()
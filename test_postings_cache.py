@@ -0,0 +1,39 @@
+from database import Database
+from postings_cache import Postings, PostingsCache
+from testing_utils import temp_index_copy
+
+def test_lru_eviction_by_bytes():
+    small = Postings([(1, 2, "3,4")])
+    cache = PostingsCache(max_bytes=small.nbytes * 2)
+    cache.check_generation(1)
+    cache.put(("body", 1), small)
+    cache.put(("body", 2), Postings([(1, 2, "3,4")]))
+    assert cache.get(("body", 1)) is small   # 1 is now most recently used
+    cache.put(("body", 3), Postings([(5, 1, "7")]))
+    assert cache.get(("body", 2)) is None
+    assert cache.get(("body", 1)) is small
+    assert cache.resident_bytes <= cache.max_bytes
+    assert cache.evictions == 1
+    assert cache.hits == 2 and cache.misses == 1
+    cache.check_generation(2)
+    assert cache.resident_bytes == 0 and cache.get(("body", 1)) is None
+
+def test_generation_change_invalidates_cached_postings():
+    with temp_index_copy() as db_path:
+        db = Database(db_path)
+        before = db.get_docs_containing_word_body("hkust")
+        assert db.get_docs_containing_word_body("hkust") == before
+        assert db.postings_cache.hits == 1
+
+        word_id = db.get_word_id("hkust")
+        db.cursor.execute("DELETE FROM inverted_index_body WHERE word_id = ?", (word_id,))
+        db.bump_generation()
+        db.close()
+
+        db = Database(db_path)  # A new request sees the new generation
+        assert before and db.get_docs_containing_word_body("hkust") == []
+        db.close()
+
+if __name__ == "__main__":
+    test_lru_eviction_by_bytes()
+    test_generation_change_invalidates_cached_postings()
@@ -0,0 +1,100 @@
+import os
+import re
+import sqlite3
+
+from compact import compact
+from crawler import Crawler
+from database import Database
+from search import search_engine
+from testing_utils import serve_directory, temp_index_copy
+
+# Statements whose job is to read whole tables (spider_result.txt, the vocabulary, the recrawl history, the schema)
+FULL_READS = ("ROW_NUMBER() OVER", "SELECT page_id, title, url, last_modified, size FROM pages ORDER BY page_id",
+              "AS total_df FROM words", "FROM pages p LEFT JOIN page_history", "FROM sqlite_master")
+
+# How a boolean NOT reads every page: only a NOT with nothing to subtract from (e.g. under OR) needs it
+ALL_PAGES = "SELECT page_id FROM pages ORDER BY page_id"
+
+def full_scans(conn, statement):
+    """Plan steps of a statement that scan a table without any index."""
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement)]
+    # Scanning the rows of a subquery is fine, as long as the subquery itself uses indexes
+    subqueries = {step.split()[-1] for step in plan if step.startswith(("CO-ROUTINE", "MATERIALIZE"))}
+    return [step for step in plan if re.match(r"SCAN \w+$", step) and step.split()[1] not in subqueries]
+
+def run_traced(statements, db_path):
+    """Crawl a small site and serve searches through app.py on db_path, recording every SQL statement."""
+    site = os.path.join(os.path.dirname(db_path), "site")
+    os.makedirs(site)
+    with open(os.path.join(site, "index.html"), "w") as f:
+        f.write('<html><title>Home</title><body><a href="a.html">a</a> movies and films</body></html>')
+    with open(os.path.join(site, "a.html"), "w") as f:
+        f.write('<html><title>A</title><body><a href="index.html">home</a> film review</body></html>')
+    index = Database(db_path)
+    compact(index)     # As main.py does: stored norms keep the searches below fast
+    index.close()
+    server, base = serve_directory(site)
+    try:
+        import app     # Loads the vocabulary before tracing starts (a full read by design)
+        Database.trace_callback = statements.append
+        crawler = Crawler(base + "index.html", max_pages=5, db_name="crawl.db")
+        crawler.delay = 0
+        crawler.crawl()
+        crawler.recrawl(budget=2)
+        crawler.close()
+
+        client = app.app.test_client()
+        for query in ["movie", '"hong kong" university', "movie AND NOT dinosaur", "moviee", "zzzqqq"]:
+            assert client.get("/search", query_string={"query": query}).status_code == 200
+        for flag in ("PROXIMITY", "CHAMPIONS"):
+            app.app.config[flag] = True
+            client.get("/search", query_string={"query": "film review"})
+            app.app.config[flag] = False
+        client.post("/similar", data={"url": "https://www.cse.ust.hk/~kwtleung/COMP4321/testpage.htm"})
+        client.get("/complete", query_string={"prefix": "mov"})
+    finally:
+        Database.trace_callback = None
+        server.shutdown()
+
+def test_no_full_table_scans():
+    statements = []
+    with temp_index_copy(app_dir=True) as db_path:
+        run_traced(statements, db_path)
+        conn = sqlite3.connect(db_path)
+        checked = set()
+        failures = []
+        for statement in statements:
+            if not re.match(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)", statement, re.I):
+                continue
+            shape = re.sub(r"\s+", " ", re.sub(r"'[^']*'|\b\d+\b", "?", statement))
+            if any(marker in shape for marker in FULL_READS):
+                continue
+            if shape in checked:
+                continue
+            checked.add(shape)
+            scans = full_scans(conn, statement)
+            if scans:
+                failures.append(f"{shape.strip()[:160]} -> {scans}")
+        conn.close()
+    assert len(checked) > 30
+    assert not failures, "\n".join(failures)
+
+def test_boolean_not_reads_all_pages_only_without_and():
+    statements = []
+    with temp_index_copy() as db_path:
+        Database.trace_callback = statements.append
+        crawler = Crawler(None, db_name=db_path)
+        try:
+            all_page_reads = {}
+            for query in ["movie AND NOT dinosaur", "movie OR NOT dinosaur"]:
+                del statements[:]
+                assert search_engine(crawler, query, top_k=1000)
+                all_page_reads[query] = sum(ALL_PAGES in statement for statement in statements)
+        finally:
+            Database.trace_callback = None
+            crawler.close()
+    assert all_page_reads == {"movie AND NOT dinosaur": 0, "movie OR NOT dinosaur": 1}
+
+if __name__ == "__main__":
+    test_no_full_table_scans()
+    test_boolean_not_reads_all_pages_only_without_and()
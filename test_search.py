@@ -0,0 +1,61 @@
+import itertools
+import os
+import random
+import shutil
+import tempfile
+
+from crawler import Crawler
+from search import min_cover_window, search_engine
+from testing_utils import serve_directory
+
+def brute_force_window(position_lists):
+    if any(not positions for positions in position_lists):
+        return None
+    return min(max(combo) - min(combo) + 1 for combo in itertools.product(*position_lists))
+
+def test_min_cover_window():
+    assert min_cover_window([[1, 10, 20], [5, 14], [12]]) == 5
+    assert min_cover_window([[3], [4]]) == 2
+    assert min_cover_window([[3], []]) is None
+    rng = random.Random(4321)
+    for _ in range(200):
+        lists = [sorted(rng.sample(range(60), rng.randint(1, 6))) for _ in range(rng.randint(1, 4))]
+        assert min_cover_window(lists) == brute_force_window(lists)
+
+def test_proximity_reorders_equal_pages():
+    tmp_dir = tempfile.mkdtemp()
+    site = os.path.join(tmp_dir, "site")
+    os.makedirs(site)
+    filler = " ".join(f"filler{i}" for i in range(30))
+    pages = {
+        "index.html": '<title>Home</title><a href="scattered.html">one</a> <a href="close.html">two</a> '
+                      '<a href="other.html">three</a>',
+        # The same words with the same counts, so both pages get the same tf-idf score
+        "scattered.html": f"<title>Zoo</title><p>elephant {filler} giraffe</p>",
+        "close.html": f"<title>Zoo</title><p>elephant giraffe {filler}</p>",
+        "other.html": "<title>Zoo</title><p>elephant alone</p>",
+    }
+    for name, html in pages.items():
+        with open(os.path.join(site, name), "w") as f:
+            f.write(f"<html><body>{html}</body></html>")
+    server, base = serve_directory(site)
+    crawler = Crawler(base + "index.html", max_pages=10, db_name=os.path.join(tmp_dir, "crawl.db"),
+                      detect_duplicates=False)
+    crawler.delay = 0
+    try:
+        crawler.crawl()
+        plain = dict(search_engine(crawler, "elephant giraffe"))
+        assert abs(plain[base + "close.html"] - plain[base + "scattered.html"]) < 1e-12
+
+        boosted = search_engine(crawler, "elephant giraffe", proximity=True)
+        assert [url for url, score in boosted][:2] == [base + "close.html", base + "scattered.html"]
+        assert dict(boosted)[base + "close.html"] > dict(boosted)[base + "scattered.html"]
+        assert dict(boosted)[base + "other.html"] == plain[base + "other.html"]    # Missing a word: no boost
+    finally:
+        crawler.close()
+        server.shutdown()
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    test_min_cover_window()
+    test_proximity_reorders_equal_pages()
@@ -0,0 +1,90 @@
+import json
+
+import search_api
+from search_api import RankedListStore, CursorError, encode_cursor, decode_cursor
+from testing_utils import temp_index_copy
+
+def test_ranked_list_store():
+    store = RankedListStore(ttl=60, max_lists=2)
+    calls = []
+    ranker = lambda: calls.append(1) or [("a", 1.0), ("b", 0.5)]
+    list_id, results = store.rank(("db", "movie"), "movie", ranker)
+    assert store.rank(("db", "movie"), "movie", ranker) == (list_id, results)
+    assert len(calls) == 1     # Ranked once, the second call reuses the list
+    assert store.get(list_id) == ("movie", results)
+    assert decode_cursor(encode_cursor(list_id, 20)) == (list_id, 20)
+    for bad in [encode_cursor(list_id, -1), "not a cursor"]:
+        try:
+            decode_cursor(bad)
+            assert False, "expected CursorError"
+        except CursorError:
+            pass
+
+    store.rank(("db", "film"), "film", ranker)
+    store.rank(("db", "hong kong"), "hong kong", ranker)    # Evicts "movie", the least recently used
+    try:
+        store.get(list_id)
+        assert False, "expected CursorError"
+    except CursorError:
+        pass
+
+def test_ranked_lists_expire_out_of_order():
+    clock = [1000.0]
+    real_time = search_api.time
+    search_api.time = type("Clock", (), {"time": staticmethod(lambda: clock[0])})
+    try:
+        store = RankedListStore(ttl=60)
+        calls = []
+        ranker = lambda: calls.append(1) or [("a", 1.0)]
+        old_id, _ = store.rank(("db", "movie"), "movie", ranker)     # Expires at 1060
+        clock[0] = 1030
+        store.rank(("db", "film"), "film", ranker)                   # Expires at 1090
+        clock[0] = 1040
+        store.get(old_id)       # The older list is used last, so it is no longer at the front
+        clock[0] = 1070
+        try:
+            store.get(old_id)
+            assert False, "expected CursorError"
+        except CursorError:
+            pass
+        store.rank(("db", "movie"), "movie", ranker)
+        assert len(calls) == 3      # Ranked again instead of reusing the expired list
+    finally:
+        search_api.time = real_time
+
+def test_api_search():
+    with temp_index_copy(app_dir=True):
+        import app
+        client = app.app.test_client()
+        full = client.get("/api/search", query_string={"q": "movie", "limit": 100}).get_json()
+        assert full['total'] == len(full['results']) > 3
+        assert set(full['results'][0]) == {'rank', 'url', 'score', 'title', 'last_modified', 'size',
+                                           'snippet', 'keywords', 'parent_links', 'child_links'}
+
+        # Walking the cursors gives the same ranking, and unrequested fields are left out
+        urls, cursor = [], None
+        while True:
+            args = {"cursor": cursor, "limit": 3, "fields": "title"} if cursor else \
+                {"q": "movie", "limit": 3, "fields": "title"}
+            page = client.get("/api/search", query_string=args).get_json()
+            assert all(set(r) == {'rank', 'url', 'score', 'title'} for r in page['results'])
+            urls += [r['url'] for r in page['results']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert urls == [r['url'] for r in full['results']]
+
+        lines = client.get("/api/search", query_string={"q": "movie", "limit": 2, "stream": 1}).data.splitlines()
+        lines = [json.loads(line) for line in lines]
+        assert lines[0] == {'query': 'movie', 'total': full['total']}
+        assert [r['url'] for r in lines[1:-1]] == urls[:2]
+        assert lines[-1]['next_cursor']
+
+        assert client.get("/api/search", query_string={"q": "movie", "fields": "body"}).status_code == 400
+        assert client.get("/api/search", query_string={"cursor": encode_cursor("gone", 0)}).status_code == 410
+        assert client.get("/api/search", query_string={"cursor": encode_cursor("gone", -3)}).status_code == 410
+
+if __name__ == "__main__":
+    test_ranked_list_store()
+    test_ranked_lists_expire_out_of_order()
+    test_api_search()
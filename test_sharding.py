@@ -0,0 +1,62 @@
+import hashlib
+import os
+
+from crawler import Crawler
+from database import Database
+from search import search_engine
+from sharding import build_shards, ShardedSearchEngine
+from testing_utils import temp_index_copy
+
+def test_sharded_scores_match_unsharded():
+    with temp_index_copy() as db_path:
+        tmp_dir = os.path.dirname(db_path)
+        build_shards(db_path, num_shards=3, shard_dir=tmp_dir)
+        engine = ShardedSearchEngine(tmp_dir, num_shards=3)
+        crawler = Crawler(None, db_name=db_path)
+        try:
+            for query in ["information retrieval", 'hkust "computer science"']:
+                expected = dict(search_engine(crawler, query, top_k=1000))
+                results = engine.search(query, top_k=1000)
+                assert len(results) == len(expected)
+                for url, score in results:
+                    assert abs(expected[url] - score) < 1e-9
+                assert sorted(engine.last_shard_latencies) == [0, 1, 2]
+        finally:
+            engine.close()
+            crawler.close()
+
+def test_sharded_scores_match_after_stats_drift():
+    with temp_index_copy() as db_path:
+        tmp_dir = os.path.dirname(db_path)
+        # df no longer counts the postings: an inflated df, and a posting deleted without updating df
+        index = Database(db_path)
+        index.cursor.execute("UPDATE inverted_index_body_word2df SET df = df + 7 WHERE word_id = ?",
+                             (index.get_word_id("retriev"),))
+        index.cursor.execute("DELETE FROM inverted_index_body WHERE word_id = ? AND page_id = "
+                             "(SELECT MIN(page_id) FROM inverted_index_body WHERE word_id = ?)",
+                             (index.get_word_id("inform"), index.get_word_id("inform")))
+        index.conn.commit()
+        index.bump_generation()
+        index.close()
+
+        paths = build_shards(db_path, num_shards=3, shard_dir=tmp_dir)
+        digests = lambda: [hashlib.md5(open(path, "rb").read()).hexdigest() for path in paths]
+        before = digests()
+        engine = ShardedSearchEngine(tmp_dir, num_shards=3)
+        crawler = Crawler(None, db_name=db_path)
+        try:
+            for query in ["information retrieval", "information zzzqqq"]:
+                expected = dict(search_engine(crawler, query, top_k=1000))
+                results = engine.search(query, top_k=1000)
+                assert len(results) == len(expected) > 0
+                for url, score in results:
+                    assert abs(expected[url] - score) < 1e-9
+            assert digests() == before      # Shards are opened read-only: unknown words are not inserted
+            assert crawler.index.get_word_id("zzzqqq") is None
+        finally:
+            engine.close()
+            crawler.close()
+
+if __name__ == "__main__":
+    test_sharded_scores_match_unsharded()
+    test_sharded_scores_match_after_stats_drift()
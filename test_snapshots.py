@@ -0,0 +1,111 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from crawler import Crawler
+from database import Database
+from snapshots import (SnapshotError, SnapshotReader, create_snapshot, current_snapshot, publish_snapshot,
+                       read_history, rollback_snapshot, snapshot_update)
+from testing_utils import serve_directory, temp_index_copy
+
+def test_publish_swap_and_rollback():
+    with temp_index_copy() as served:
+        base = os.path.dirname(served)
+        swapped = []
+        reader = SnapshotReader(base, on_swap=swapped.append)
+        assert reader.acquire() == served
+
+        # A crawl updates its own copy while the old index is still being read
+        snapshot = create_snapshot(base)
+        index = Database(snapshot)
+        index.cursor.execute("UPDATE pages SET title = 'New title' WHERE page_id = (SELECT MIN(page_id) FROM pages)")
+        index.conn.commit()
+        index.close()
+        publish_snapshot(snapshot, base)
+        assert current_snapshot(base) == snapshot and read_history(base) == [os.path.basename(snapshot)]
+
+        new_path = reader.acquire()
+        assert new_path == snapshot and swapped == [snapshot]
+        assert reader.readers == {served: 1, snapshot: 1}  # Old reader draining
+        reader.release(served)
+        assert reader.readers == {snapshot: 1}
+        reader.release(new_path)
+
+        # A broken snapshot is not published and the served one does not change
+        broken = create_snapshot(base)
+        conn = sqlite3.connect(broken)
+        conn.execute("UPDATE inverted_index_body_word2df SET df = df + 1")
+        conn.commit()
+        conn.close()
+        try:
+            publish_snapshot(broken, base)
+            assert False, "invalid snapshot was published"
+        except SnapshotError as e:
+            assert "wrong df" in str(e)
+        assert current_snapshot(base) == snapshot
+
+        assert rollback_snapshot(base) == served
+        with reader.reading() as path:
+            assert path == served and reader.swaps == 2
+
+def test_publish_keeps_last_snapshots():
+    with temp_index_copy() as served:
+        base = os.path.dirname(served)
+        published = [publish_snapshot(create_snapshot(base), base, keep=2) for _ in range(3)]
+        assert not os.path.exists(published[0])
+        assert read_history(base) == [os.path.basename(p) for p in published[1:]]
+        assert rollback_snapshot(base) == published[1]
+
+def test_recrawl_is_published():
+    base = tempfile.mkdtemp()
+    site = os.path.join(base, "site")
+    os.makedirs(site)
+    def write(html, mtime):
+        path = os.path.join(site, "index.html")
+        with open(path, "w") as f:
+            f.write(f"<html><title>Home</title><body>{html}</body></html>")
+        os.utime(path, (mtime, mtime))
+    write("story about elephants", 1_000_000)
+    server, url = serve_directory(site)
+    url += "index.html"
+    crawler = Crawler(url, max_pages=1, db_name=os.path.join(base, "search_engine.db"))
+    crawler.delay = 0
+    crawler.crawl()
+    crawler.close()
+    reader = SnapshotReader(base)
+    try:
+        with reader.reading() as path:
+            assert path == os.path.join(base, "search_engine.db")
+
+        # As recrawl.py does: the recrawl writes into a new snapshot, which readers get once it is published
+        write("story about giraffes", 2_000_000)
+        with snapshot_update(base_dir=base) as db_name:
+            crawler = Crawler(None, db_name=db_name)
+            crawler.delay = 0
+            assert crawler.recrawl(budget=1)['changed'] == 1
+            crawler.close()
+        with reader.reading() as path:
+            assert path == db_name
+            index = Database(path, read_only=True)
+            assert index.get_docs_containing_word_body("giraff") == [url]
+            index.close()
+        index = Database(os.path.join(base, "search_engine.db"), read_only=True)
+        assert index.get_docs_containing_word_body("giraff") == []     # The old index was not written to
+        index.close()
+
+        # A failed update is neither published nor left behind
+        try:
+            with snapshot_update(base_dir=base) as failed:
+                raise RuntimeError("crawl failed")
+        except RuntimeError:
+            pass
+        assert not os.path.exists(failed) and current_snapshot(base) == db_name
+    finally:
+        server.shutdown()
+        shutil.rmtree(base)
+
+if __name__ == "__main__":
+    test_publish_swap_and_rollback()
+    test_publish_keeps_last_snapshots()
+    test_recrawl_is_published()
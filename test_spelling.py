@@ -0,0 +1,24 @@
+from spelling import SpellingIndex, naive_lookup, suggest_query, edit_distance, benchmark
+
+VOCABULARY = [("comput", 40), ("compani", 12), ("retriev", 9), ("movi", 30), ("move", 5), ("love", 20), ("inform", 25)]
+
+def test_lookup_matches_naive_scan():
+    spelling = SpellingIndex(VOCABULARY)
+    assert edit_distance("kitten", "sitting") == 3
+    for term in ["compt", "retreiv", "mvoi", "lovve", "informatoin", "xyz"]:
+        assert spelling.lookup(term) == naive_lookup(VOCABULARY, term)
+    assert spelling.lookup("movv") == [("movi", 1, 30), ("move", 1, 5), ("love", 2, 20)]
+
+def test_suggest_query():
+    spelling = SpellingIndex(VOCABULARY)
+    assert suggest_query("retreival AND movei", spelling) == "retriev AND movi"
+    assert suggest_query("the movie", spelling, stopwords={"the"}) is None
+
+def test_benchmark_agrees_with_naive_scan():
+    result = benchmark(VOCABULARY, queries=20)
+    assert result['same_results']
+
+if __name__ == "__main__":
+    test_lookup_matches_naive_scan()
+    test_suggest_query()
+    test_benchmark_agrees_with_naive_scan()
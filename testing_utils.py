@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from crawler import Crawler
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_directory(path: str):
+    """Serve a directory on a free local port (for tests and benchmarks); returns (server, base url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=path))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+@contextmanager
+def temp_index_copy(app_dir: bool = False):
+    """
+    Copy search_engine.db into a temporary directory and yield the copy's path, so a test never writes to the
+    tracked index; the directory is removed afterwards. With app_dir, stopwords.txt is copied too and the
+    directory is the working directory until the block ends, as app.py expects.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, "search_engine.db")
+    cwd = os.getcwd()
+    try:
+        shutil.copy("search_engine.db", db_path)
+        if app_dir:
+            shutil.copy("stopwords.txt", os.path.join(tmp_dir, "stopwords.txt"))
+            os.chdir(tmp_dir)
+        yield db_path
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp_dir)
+
+
+@contextmanager
+def temp_crawler():
+    """A Crawler on a temporary copy of search_engine.db (see temp_index_copy), closed afterwards."""
+    with temp_index_copy() as db_path:
+        crawler = Crawler(None, db_name=db_path)
+        try:
+            yield crawler
+        finally:
+            crawler.close()